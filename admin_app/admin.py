@@ -1,3 +1,14 @@
 from django.contrib import admin
 
-# Register your models here.
+from admin_app.changelist import HighVolumeAdmin
+from .models import AdminDecision
+
+@admin.register(AdminDecision)
+class AdminDecisionAdmin(HighVolumeAdmin):
+    list_display = ('id', 'ticket', 'admin', 'decision_type', 'decision', 'decision_time')
+    list_select_related = ('ticket', 'admin')
+    list_filter = ('decision_type', 'decision')
+    search_fields = ('=ticket__id',)
+    date_hierarchy = 'decision_time'
+    autocomplete_fields = ('admin',)
+    raw_id_fields = ('ticket',)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0002_alter_admindecision_admin_and_more'),
+        ('agents', '0003_archived_messages'),
+        ('tickets', '0007_message_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='admindecision',
+            index=models.Index(fields=['decision_time'], name='admin_app_a_decisio_c6b423_idx'),
+        ),
+    ]
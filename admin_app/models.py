@@ -22,5 +22,8 @@ class AdminDecision(models.Model):
     decision_notes = models.TextField(null=True, blank=True)
     decision_time = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['decision_time'])]  # admin date hierarchy
+
     def __str__(self):
-        return f"Admin Decision for Ticket #{self.ticket.id}: {self.decision}"
+        return f"Admin Decision for Ticket #{self.ticket_id}: {self.decision}"
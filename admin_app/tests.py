@@ -1,3 +1,82 @@
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from admin_app.changelist import EstimatedCountPaginator
+from agents.models import Agent, AgentMessage
+from customers.models import Customer, CustomerMessage
+from tickets.models import Ticket
+
+
+class ChangelistTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(user)
+        self.customer = Customer.objects.create(telegram_id=8001)
+        self.agent = Agent.objects.create(telegram_id=8002)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            customer = Customer.objects.create(telegram_id=Customer.objects.count() + 9000)
+            ticket = Ticket.objects.create(customer=customer, agent=self.agent)
+            CustomerMessage.objects.create(customer=customer, ticket=ticket, message_text="hi")
+            AgentMessage.objects.create(agent=self.agent, customer=customer, ticket=ticket, message_text="hello")
+
+    def changelist_queries(self):
+        counts = {}
+        for model in admin.site._registry:
+            url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[model.__name__] = len(queries)
+        return counts
+
+    def test_every_changelist_renders_without_n_plus_one(self):
+        self.add_rows(2)
+        few = self.changelist_queries()
+        self.add_rows(10)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_large_unfiltered_tables_use_the_estimate(self):
+        with mock.patch('admin_app.changelist.estimate_rows', return_value=5_000_000):
+            with CaptureQueriesContext(connection) as queries:
+                count = EstimatedCountPaginator(CustomerMessage.objects.order_by('-pk'), 50).count
+        self.assertEqual(count, 5_000_000)
+        self.assertFalse([q for q in queries if 'COUNT' in q['sql']])
+
+    def test_filtered_counts_are_exact_up_to_the_cap(self):
+        self.add_rows(3)
+        with mock.patch('admin_app.changelist.FILTERED_COUNT_CAP', 2):
+            paginator = EstimatedCountPaginator(CustomerMessage.objects.filter(message_text="hi").order_by("-pk"), 50)
+            self.assertEqual(paginator.count, 2)
+        self.assertEqual(EstimatedCountPaginator(Customer.objects.order_by("-pk"), 50).count, 4)
+
+    def test_date_hierarchy_reads_bounds_not_distinct_dates(self):
+        self.add_rows(3)
+        url = reverse('admin:customers_customermessage_changelist')
+        today = timezone.localdate()
+        cases = (
+            ('', 'sent_at__day=%d' % today.day),
+            ('?sent_at__year=%d' % today.year, 'sent_at__month=%d' % today.month),
+        )
+        for query, link in cases:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url + query)
+            self.assertContains(response, link)
+            self.assertFalse([q for q in queries if 'DISTINCT' in q['sql']])
 
-# Create your tests here.
+    def test_ban_action_is_one_update(self):
+        self.add_rows(3)
+        url = reverse('admin:customers_customer_changelist')
+        ids = list(Customer.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, {'action': 'ban_customers', '_selected_action': ids})
+        self.assertEqual(Customer.objects.filter(banned=True).count(), 4)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "customers_customer"')]), 1)
@@ -1,3 +1,34 @@
 from django.contrib import admin
 
-# Register your models here.
+from admin_app.changelist import HighVolumeAdmin, MessageTypeFilter, ReadOnlyAdmin
+from tickets.search import FullTextSearchMixin
+from .models import Agent, AgentMessage, ArchivedAgentMessage, PendingAgent
+
+@admin.register(Agent)
+class AgentAdmin(HighVolumeAdmin):
+    list_display = ('id', 'telegram_id', 'full_name', 'language', 'joined_at')
+    search_fields = ('=telegram_id', 'full_name')
+
+@admin.register(PendingAgent)
+class PendingAgentAdmin(HighVolumeAdmin):
+    list_display = ('telegram_id', 'full_name', 'language', 'applied_at')
+    search_fields = ('=telegram_id', 'full_name')
+
+@admin.register(AgentMessage)
+class AgentMessageAdmin(FullTextSearchMixin, HighVolumeAdmin):
+    list_display = ('id', 'agent', 'customer', 'ticket', 'message_type', 'sent_at', 'message_text')
+    list_select_related = ('agent', 'customer', 'ticket')
+    search_fields = ('message_text',)  # served by the full-text index, see tickets/search.py
+    search_source = 'agent'
+    list_filter = (MessageTypeFilter, 'sent_at')
+    date_hierarchy = 'sent_at'
+    autocomplete_fields = ('agent', 'customer')
+    raw_id_fields = ('ticket',)
+
+@admin.register(ArchivedAgentMessage)
+class ArchivedAgentMessageAdmin(FullTextSearchMixin, ReadOnlyAdmin):
+    list_display = ('id', 'agent', 'customer', 'ticket', 'message_type', 'sent_at', 'message_text', 'archived_at')
+    list_select_related = ('agent', 'customer', 'ticket')
+    search_fields = ('message_text',)
+    search_source = 'agent_archive'
+    list_filter = (MessageTypeFilter,)
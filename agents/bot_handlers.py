@@ -3,6 +3,7 @@ from agents.views import create_pending_agent, is_registered_agent
 from agents.models import Agent, PendingAgent
 from tickets.models import Ticket
 from customers.models import Customer
+from bot import routing
 from django.conf import settings
 from datetime import datetime, timedelta
 from utils import sanitize_text
@@ -57,20 +58,27 @@ def register_agent_handlers(bot):
                 language=pending.language
             )
             pending.delete()
-            # One-time, expiring link for this agent
+            # One-time, expiring links for this agent: their language's support group and the fallback one
             try:
-                invite = bot.create_chat_invite_link(
-                    chat_id=settings.SUPPORT_CHAT,
-                    member_limit=1,
-                    expire_date=int((datetime.utcnow() + timedelta(minutes=5)).timestamp()),
-                    creates_join_request=False,
-                    name=f"AgentInvite-{telegram_id}"
+                expire_date = int((datetime.utcnow() + timedelta(minutes=5)).timestamp())
+                invite_links = [
+                    bot.create_chat_invite_link(
+                        chat_id=chat_id,
+                        member_limit=1,
+                        expire_date=expire_date,
+                        creates_join_request=False,
+                        name=f"AgentInvite-{telegram_id}"
+                    ).invite_link
+                    for chat_id in routing.support_chats(pending.language)
+                ]
+                join = (
+                    "the support group with this one-time link" if len(invite_links) == 1
+                    else "the support groups with these one-time links"
                 )
-                invite_link = invite.invite_link
                 bot.send_message(
                     telegram_id,
                     f"🎉 Congratulations! You’ve been approved as a support agent.\n\n"
-                    f"👉 Join the support group with this one-time link (valid 5 minutes):\n{invite_link}"
+                    f"👉 Join {join} (valid 5 minutes):\n" + "\n".join(invite_links)
                 )
             except Exception as e:
                 bot.send_message(call.message.chat.id, f"⚠️ Agent approved, but invite link could not be created: {e}")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0002_agentmessage'),
+        ('customers', '0007_customermessage_ticket'),
+        ('tickets', '0004_one_active_ticket_per_customer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAgentMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message_text', models.TextField()),
+                ('message_type', models.CharField(default='text', max_length=50)),
+                ('telegram_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='agents.agent')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='customers.customer')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_agent_messages', to='tickets.ticket')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'sent_at'], name='agents_arch_custome_cbfdb6_idx')],
+            },
+        ),
+    ]
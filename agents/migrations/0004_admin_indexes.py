@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_archived_messages'),
+        ('customers', '0008_archived_messages'),
+        ('tickets', '0007_message_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agentmessage',
+            index=models.Index(fields=['sent_at'], name='agents_agen_sent_at_5bff90_idx'),
+        ),
+    ]
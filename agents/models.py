@@ -29,5 +29,27 @@ class AgentMessage(models.Model):
     telegram_message_id = models.BigIntegerField(blank=True, null=True)
     sent_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['sent_at'])]  # admin date hierarchy
+
+    def __str__(self):
+        return f"Message from Agent {self.agent.telegram_id} to Customer {self.customer.telegram_id} at {self.sent_at}"
+
+
+class ArchivedAgentMessage(models.Model):
+    """AgentMessage moved out of the live table by `archive_messages`; keeps the original id."""
+    id = models.BigIntegerField(primary_key=True)
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='archived_messages')
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='+')
+    ticket = models.ForeignKey('tickets.Ticket', on_delete=models.CASCADE, related_name='archived_agent_messages')
+    message_text = models.TextField()
+    message_type = models.CharField(max_length=50, default='text')
+    telegram_message_id = models.BigIntegerField(blank=True, null=True)
+    sent_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['customer', 'sent_at'])]
+
     def __str__(self):
-        return f"Message from Agent {self.agent.telegram_id} to Customer {self.customer.telegram_id} at {self.sent_at}"
\ No newline at end of file
+        return f"Archived message from Agent {self.agent.telegram_id} at {self.sent_at}"
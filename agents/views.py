@@ -1,4 +1,7 @@
 # agents/views.py
+import datetime
+
+from django.utils import timezone
 
 from .models import Agent, PendingAgent
 
@@ -31,3 +34,9 @@ def approve_pending_agent(user_id):
 
 def is_registered_agent(user_id):
     return Agent.objects.filter(telegram_id=user_id).exists()
+
+def expire_pending_agents(days):
+    """Delete applications nobody approved or rejected within `days` days. Returns how many."""
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = PendingAgent.objects.filter(applied_at__lt=cutoff).delete()
+    return deleted
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from admin_app.changelist import ReadOnlyAdmin
+from .models import ScheduledJob
+
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(ReadOnlyAdmin):
+    list_display = (
+        'name', 'last_started_at', 'last_status', 'last_duration_ms', 'runs', 'failures', 'timeouts', 'lease_owner',
+    )
@@ -0,0 +1,83 @@
+# bot/dedup.py
+"""
+Duplicate suppression for inline-button taps (see CallbackGuardMiddleware).
+
+A double tap delivers two callback queries with the same data on the same
+message. TTLCache remembers each (data, chat, message) for
+CALLBACK_DEDUP_SECONDS so the second one is answered at once and never
+reaches its handler. TicketLocks keeps a second transition of the same
+ticket (two admins approving, an agent claiming while an admin closes) from
+running while the first is still in flight.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Callbacks that change a ticket: "<action>_<ticket id>"
+TICKET_CALLBACK = re.compile(
+    r'^(?:claim|approve_resolved|decline_resolved|approve_closed|decline_closed'
+    r'|raise_ticket|handle_ticket|close_finally)_(\d+)$'
+)
+
+
+def ticket_of(data):
+    """Ticket id a callback's data acts on, or None for callbacks that change no ticket."""
+    match = TICKET_CALLBACK.match(data or '')
+    return int(match.group(1)) if match else None
+
+
+def callback_key(call):
+    if call.message is not None:
+        return call.data, call.message.chat.id, call.message.message_id
+    return call.data, call.inline_message_id
+
+
+class TTLCache:
+    """Keys seen in the last `ttl` seconds. Thread-safe; expired keys are dropped as new ones arrive."""
+
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._expires = OrderedDict()  # key -> expiry, oldest first (the TTL is fixed)
+
+    def add(self, key):
+        """Remember `key`. Returns False if it was already seen within the TTL."""
+        now = self.clock()
+        with self._lock:
+            while self._expires:
+                oldest, expires = next(iter(self._expires.items()))
+                if expires > now:
+                    break
+                del self._expires[oldest]
+            if key in self._expires:
+                return False
+            self._expires[key] = now + self.ttl
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._expires.pop(key, None)
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class TicketLocks:
+    """Non-blocking per-ticket locks: a ticket that is busy is reported, not waited for."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held = set()
+
+    def acquire(self, ticket_id):
+        with self._lock:
+            if ticket_id in self._held:
+                return False
+            self._held.add(ticket_id)
+            return True
+
+    def release(self, ticket_id):
+        with self._lock:
+            self._held.discard(ticket_id)
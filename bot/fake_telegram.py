@@ -0,0 +1,295 @@
+# bot/fake_telegram.py
+"""
+Local stand-in for the Telegram Bot API, used for load tests.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>/bot{0}/{1}.
+Updates are injected with FakeTelegramState.push_update() (or by POSTing
+Update JSON to /_inject) and handed out by getUpdates; every outgoing call the bot makes is recorded so a load generator
+can wait for the reply it expects.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 100000001, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+
+# Methods that count as "sends" for latency and 429 injection
+SEND_METHODS = {
+    'sendMessage', 'sendPhoto', 'sendDocument', 'sendVideo',
+    'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup',
+    'answerCallbackQuery', 'createChatInviteLink',
+}
+
+
+class FakeTelegramState:
+    """Update queue, outgoing-call log and fault injection settings."""
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit_ratio=0.0, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self.sent = []
+        self.calls = 0
+        self.rate_limited = 0
+        self.get_updates_calls = 0
+
+    # ---- update side -------------------------------------------------
+    def push_update(self, update: dict) -> int:
+        with self._cond:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append(dict(update, update_id=update_id))
+            self._cond.notify_all()
+        return update_id
+
+    def get_updates(self, offset=0, limit=100, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.get_updates_calls += 1
+            self._cond.notify_all()
+            # Confirm everything below the offset, as Telegram does
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            return self._updates[:limit]
+
+    # ---- outgoing side -----------------------------------------------
+    def next_message_id(self) -> int:
+        with self._cond:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            return message_id
+
+    def record(self, method: str, params: dict, message_id=None) -> dict:
+        markup = params.get('reply_markup')
+        entry = {
+            'method': method,
+            'chat_id': _int_or_none(params.get('chat_id')),
+            'message_id': message_id or _int_or_none(params.get('message_id')),
+            'text': params.get('text') or params.get('caption') or '',
+            'reply_markup': json.loads(markup) if markup else None,
+            'time': time.monotonic(),
+        }
+        with self._cond:
+            entry['seq'] = len(self.sent)
+            self.sent.append(entry)
+            self._cond.notify_all()
+        return entry
+
+    def mark(self) -> int:
+        """Sequence number to pass as `after` when waiting for a reply."""
+        with self._cond:
+            return len(self.sent)
+
+    def wait_for(self, predicate, after=0, timeout=30.0):
+        """Return the first outgoing call at or after `after` matching `predicate`, or None."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            position = after
+            while True:
+                while position < len(self.sent):
+                    entry = self.sent[position]
+                    position += 1
+                    if predicate(entry):
+                        return entry
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def wait_for_poller(self, timeout=30.0) -> bool:
+        """Block until the bot has called getUpdates at least once."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self.get_updates_calls:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def should_rate_limit(self) -> bool:
+        return self.rate_limit_ratio > 0 and random.random() < self.rate_limit_ratio
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    server_version = "FakeTelegram/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("fake-telegram: " + format, *args)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _params(self, query):
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length)
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('application/json'):
+                params.update(json.loads(body or b'{}'))
+            elif content_type.startswith('application/x-www-form-urlencoded'):
+                params.update(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+        return params
+
+    def _dispatch(self):
+        state = self.server.state
+        url = urlsplit(self.path)
+        method = url.path.rstrip('/').rsplit('/', 1)[-1]
+        params = self._params(url.query)
+        if url.path == '/_inject':
+            # Test hook: POST a raw Update JSON to queue it for getUpdates
+            return self._reply(200, {"ok": True, "result": state.push_update(params)})
+        state.calls += 1
+
+        if method in SEND_METHODS:
+            if state.latency or state.jitter:
+                time.sleep(state.latency + random.uniform(0, state.jitter))
+            if state.should_rate_limit():
+                state.rate_limited += 1
+                return self._reply(429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {state.retry_after}",
+                    "parameters": {"retry_after": state.retry_after},
+                })
+
+        handler = getattr(self, f"api_{method}", None)
+        if handler is None:
+            return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"})
+        return self._reply(200, {"ok": True, "result": handler(state, params)})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # ---- Bot API methods ---------------------------------------------
+    def api_getMe(self, state, params):
+        return BOT_USER
+
+    def api_deleteWebhook(self, state, params):
+        return True
+
+    def api_getUpdates(self, state, params):
+        return state.get_updates(
+            offset=int(params.get('offset') or 0),
+            limit=int(params.get('limit') or 100),
+            timeout=float(params.get('timeout') or 0),
+        )
+
+    def _message(self, state, method, params, **extra):
+        entry = state.record(method, params, message_id=state.next_message_id())
+        message = {
+            "message_id": entry['message_id'],
+            "date": int(time.time()),
+            "chat": {"id": entry['chat_id'], "type": "private" if (entry['chat_id'] or 0) > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        message.update(extra)
+        if entry['reply_markup']:
+            message['reply_markup'] = entry['reply_markup']
+        return message
+
+    def api_sendMessage(self, state, params):
+        return self._message(state, 'sendMessage', params, text=params.get('text', ''))
+
+    def api_sendPhoto(self, state, params):
+        return self._message(state, 'sendPhoto', params, caption=params.get('caption', ''),
+                             photo=[{"file_id": params.get('photo', 'photo'), "file_unique_id": "p", "width": 1, "height": 1}])
+
+    def api_sendDocument(self, state, params):
+        return self._message(state, 'sendDocument', params, caption=params.get('caption', ''),
+                             document={"file_id": params.get('document', 'document'), "file_unique_id": "d"})
+
+    def api_sendVideo(self, state, params):
+        return self._message(state, 'sendVideo', params, caption=params.get('caption', ''),
+                             video={"file_id": params.get('video', 'video'), "file_unique_id": "v",
+                                    "width": 1, "height": 1, "duration": 1})
+
+    def _edited(self, state, method, params, **extra):
+        entry = state.record(method, params)
+        message = {
+            "message_id": entry['message_id'],
+            "date": int(time.time()),
+            "edit_date": int(time.time()),
+            "chat": {"id": entry['chat_id'], "type": "supergroup"},
+            "from": BOT_USER,
+        }
+        message.update(extra)
+        if entry['reply_markup']:
+            message['reply_markup'] = entry['reply_markup']
+        return message
+
+    def api_editMessageText(self, state, params):
+        return self._edited(state, 'editMessageText', params, text=params.get('text', ''))
+
+    def api_editMessageCaption(self, state, params):
+        return self._edited(state, 'editMessageCaption', params, caption=params.get('caption', ''))
+
+    def api_editMessageReplyMarkup(self, state, params):
+        return self._edited(state, 'editMessageReplyMarkup', params)
+
+    def api_answerCallbackQuery(self, state, params):
+        state.record('answerCallbackQuery', params)
+        return True
+
+    def api_createChatInviteLink(self, state, params):
+        state.record('createChatInviteLink', params)
+        return {
+            "invite_link": f"https://t.me/+fake{state.next_message_id()}",
+            "creator": BOT_USER,
+            "creates_join_request": params.get('creates_join_request') == 'True',
+            "is_primary": False,
+            "is_revoked": False,
+            "name": params.get('name'),
+            "expire_date": _int_or_none(params.get('expire_date')),
+            "member_limit": _int_or_none(params.get('member_limit')),
+        }
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state=None):
+        super().__init__(address, FakeTelegramHandler)
+        self.state = state or FakeTelegramState()
+
+    @property
+    def api_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="FakeTelegramServer", daemon=True)
+        thread.start()
+        return thread
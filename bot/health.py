@@ -0,0 +1,289 @@
+# bot/health.py
+"""
+Liveness, readiness and a polling watchdog for `runbot`.
+
+PollerHealth wraps the bot's get_updates to record every getUpdates round
+trip, and HealthMiddleware counts the handlers running on the worker pool.
+From those it answers two questions for orchestration:
+
+- live: a getUpdates has completed within HEALTH_STALL_FACTOR × POLL_TIMEOUT
+  (a healthy long poll returns at least every POLL_TIMEOUT seconds, empty or
+  not), counted from the end of the retry policy's wait when it is holding
+  polling back (a 429's retry_after can be minutes), or polling is paused by
+  a full ingress queue (bot.ingress) and handlers are still finishing;
+- ready: live, the last getUpdates succeeded and polling is not backing off
+  after a crash, and the worker-pool backlog is at most HEALTH_MAX_BACKLOG
+  updates.
+
+They are served over HTTP on HEALTH_PORT (/healthz, /readyz, /status) and/or
+written to HEALTH_FILE every HEALTH_INTERVAL_SECONDS (`manage.py bot_health`
+checks that file, for exec-style probes). The Watchdog stops polling when the
+poller is not live, so runbot's loop starts a fresh one; if no getUpdates
+even returns within HEALTH_GRACE_SECONDS after that (the poll thread is
+wedged and cannot be interrupted), it calls on_wedged, and runbot exits for
+its supervisor to restart it.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class PollerHealth:
+    def __init__(self, stall_after, max_backlog, clock=time.monotonic):
+        self.stall_after = stall_after
+        self.max_backlog = max_backlog
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._started = clock()
+        self._pool = None
+        self.last_poll = None  # monotonic time of the last successful getUpdates
+        self.last_attempt = None  # ... of the last getUpdates that returned at all, or raised
+        self.last_update = None  # ... of the last one that returned updates
+        self.polls = self.updates = self.poll_errors = self.crashes = self.restarts = 0
+        self.consecutive_errors = 0
+        self.in_flight = 0
+        self.last_error = None
+        self.backing_off = False
+        self.resume_at = None  # clock() when the retry policy's current wait ends
+        self.retry = None  # bot.retry.PollRetryPolicy, whose metrics /status includes
+        self.ingress = None  # bot.ingress.Ingress, likewise
+        self.callbacks = None  # bot.middleware.CallbackGuardMiddleware, likewise
+        self.jobs = None  # bot.jobs.JobRunner, likewise
+        self.maintenance = None  # bot.scheduler.Maintenance, likewise
+        self.routing = None  # bot.routing.SupportRouter, likewise
+        self.assignment = None  # tickets.assignment.AssignmentEngine, likewise
+        self.last_handled = None  # clock() when a handler last finished
+
+    def attach(self, bot):
+        """Record every getUpdates `bot` makes and measure its worker-pool backlog."""
+        get_updates = bot.get_updates
+        self._pool = bot.worker_pool
+
+        def recorded_get_updates(*args, **kwargs):
+            try:
+                updates = get_updates(*args, **kwargs)
+            except Exception as exc:
+                self.poll_failed(exc)
+                raise
+            self.poll_ok(len(updates))
+            return updates
+
+        bot.get_updates = recorded_get_updates
+        return self
+
+    # ---- events ----------------------------------------------------------
+    def poll_ok(self, count):
+        now = self.clock()
+        with self._lock:
+            self.last_poll = self.last_attempt = now
+            self.polls += 1
+            self.consecutive_errors = 0
+            self.backing_off = False
+            if count:
+                self.last_update = now
+                self.updates += count
+
+    def poll_failed(self, exc):
+        now = self.clock()
+        with self._lock:
+            self.last_attempt = now
+            self.poll_errors += 1
+            self.consecutive_errors += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"
+
+    def waiting(self, seconds):
+        """The poll thread is deliberately waiting `seconds` before polling again (bot.retry): not a stall."""
+        with self._lock:
+            self.resume_at = self.clock() + seconds
+
+    def crashed(self, exc):
+        """runbot's polling loop caught `exc` and is backing off before polling again."""
+        with self._lock:
+            self.crashes += 1
+            self.backing_off = True
+            self.last_error = f"{type(exc).__name__}: {exc}"
+
+    def restarted(self):
+        with self._lock:
+            self.restarts += 1
+
+    def handler_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def handler_finished(self):
+        now = self.clock()
+        with self._lock:
+            self.in_flight -= 1
+            self.last_handled = now
+
+    # ---- state -----------------------------------------------------------
+    @property
+    def backlog(self):
+        """Updates queued for the worker pool that no handler thread has picked up yet."""
+        return self._pool.tasks.qsize() if self._pool is not None else 0
+
+    def since_last_poll(self):
+        """Seconds since the last successful getUpdates, or since the retry policy's wait ended if that is later."""
+        last = self.last_poll if self.last_poll is not None else self._started
+        if self.resume_at is not None:
+            last = max(last, self.resume_at)
+        return self.clock() - last
+
+    def live(self):
+        if self.since_last_poll() <= self.stall_after:
+            return True
+        # Waiting for handler threads to make room is not a stall, unless they have stopped too
+        return (
+            self.ingress is not None and self.ingress.paused
+            and self.last_handled is not None and self.clock() - self.last_handled <= self.stall_after
+        )
+
+    def ready(self):
+        return (
+            self.live() and self.last_poll is not None and not self.consecutive_errors
+            and not self.backing_off and self.backlog <= self.max_backlog
+            and not (self.ingress is not None and self.ingress.paused)
+        )
+
+    def snapshot(self):
+        now = self.clock()
+        live, ready = self.live(), self.ready()
+        with self._lock:
+            return {
+                "status": "ok" if ready else "degraded" if live else "stalled",
+                "live": live,
+                "ready": ready,
+                "pid": os.getpid(),
+                "written_at": time.time(),
+                "uptime": round(now - self._started, 1),
+                "seconds_since_poll": round(self.since_last_poll(), 1),
+                "seconds_since_update": round(now - self.last_update, 1) if self.last_update is not None else None,
+                "in_flight": self.in_flight,
+                "backlog": self.backlog,
+                "polls": self.polls,
+                "updates": self.updates,
+                "poll_errors": self.poll_errors,
+                "consecutive_errors": self.consecutive_errors,
+                "crashes": self.crashes,
+                "restarts": self.restarts,
+                "backing_off": self.backing_off,
+                "last_error": self.last_error,
+                "retry": self.retry.metrics() if self.retry is not None else None,
+                "ingress": self.ingress.metrics() if self.ingress is not None else None,
+                "callbacks": self.callbacks.metrics() if self.callbacks is not None else None,
+                "jobs": self.jobs.metrics() if self.jobs is not None else None,
+                "maintenance": self.maintenance.metrics() if self.maintenance is not None else None,
+                "routing": self.routing.metrics() if self.routing is not None else None,
+                "assignment": self.assignment.metrics() if self.assignment is not None else None,
+            }
+
+
+def write_status(path, snapshot):
+    """Replace the status file atomically, so a probe never reads half of it."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+class Watchdog(threading.Thread):
+    """
+    Every `interval` seconds: write the status file (when `path` is set), and
+    if the poller has stalled, stop polling so runbot starts a fresh poller.
+    When no getUpdates returns or fails within `grace` seconds after that,
+    on_wedged() is called once. (A poller whose requests keep failing is
+    reported not live but left to runbot's retry loop.)
+    """
+
+    def __init__(self, health, bot, interval, grace, path=None, on_wedged=None):
+        super().__init__(name="PollingWatchdog", daemon=True)
+        self.health = health
+        self.bot = bot
+        self.interval = interval
+        self.grace = grace
+        self.path = path
+        self.on_wedged = on_wedged
+        self._stopped = threading.Event()
+        self._stalled_at = None  # clock() when polling was last stopped for stalling
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        health = self.health
+        if self.path:
+            try:
+                write_status(self.path, health.snapshot())
+            except OSError as exc:
+                logger.warning("Could not write health file %s: %s", self.path, exc)
+        if health.live():
+            self._stalled_at = None
+            return
+        now = health.clock()
+        if self._stalled_at is None:
+            logger.error(
+                "No getUpdates completed for %.0f s (limit %.0f s); restarting polling",
+                health.since_last_poll(), health.stall_after,
+            )
+            health.restarted()
+            self._stalled_at = now
+            self.bot.stop_polling()
+        elif now - self._stalled_at > self.grace and (
+            health.last_attempt is None or health.last_attempt < self._stalled_at
+        ):
+            # Not even a failed getUpdates since the restart: the poll thread is stuck
+            logger.critical("Polling did not recover within %.0f s of a restart", self.grace)
+            self._stalled_at = float('inf')  # report once
+            if self.on_wedged:
+                self.on_wedged()
+
+
+class HealthRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BotHealth/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("health: " + format, *args)
+
+    def do_GET(self):
+        health = self.server.health
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path == '/healthz':
+            ok = health.live()
+            return self._reply(200 if ok else 503, {"status": "ok" if ok else "stalled"})
+        if path == '/readyz':
+            ok = health.ready()
+            return self._reply(200 if ok else 503, {"status": "ok" if ok else "not ready"})
+        if path == '/status':
+            return self._reply(200, health.snapshot())
+        return self._reply(404, {"status": "error", "message": "Not found"})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class HealthServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, health):
+        super().__init__(address, HealthRequestHandler)
+        self.health = health
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="HealthServer", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,232 @@
+# bot/ingress.py
+"""
+Bounded ingress between runbot's poller and its handler threads.
+
+telebot hands every fetched update to the worker pool's unbounded queue, so
+during a spike the bot keeps pulling updates it cannot handle: memory grows
+and every reply waits behind the whole backlog. Ingress.attach() wraps
+bot.process_new_updates so that at most INGRESS_CAPACITY updates wait for a
+handler thread:
+
+- Normal updates are queued while there is room. When the queue is full the
+  poll thread waits for a free slot, so polling pauses and the rest stays
+  queued at Telegram (backpressure). A customer whose message has to wait
+  gets TEXT_MESSAGES['busy'] once per INGRESS_BUSY_NOTICE_SECONDS.
+- Low-priority updates (LOW_PRIORITY_COMMANDS, LOW_PRIORITY_CALLBACKS) are
+  deferred while the queue is at least half full and queued again once it
+  has drained below that: by the poller before each batch, and by
+  bot.middleware.IngressDrainMiddleware after every handler, so they do
+  not wait for the next getUpdates. At most INGRESS_DEFERRED_MAX wait; beyond that
+  they are shed: the update is dropped and the user is told to try again
+  (TEXT_MESSAGES['busy_retry']).
+
+Deferred and shed updates still advance bot.last_update_id, so Telegram does
+not deliver them again. Busy replies are sent by their own thread, so they do
+not slow the poller down; when even that falls NOTICE_QUEUE behind, notices
+are skipped. Queue depth, pause time and deferred/shed/notice
+counts are in metrics() (runbot's /status).
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Work that can wait, or be refused, when the bot is overloaded
+LOW_PRIORITY_COMMANDS = {'search', 'stats'}
+LOW_PRIORITY_CALLBACKS = ('preview_', 'searchpage_')
+
+NORMAL, LOW = 'normal', 'low'
+NOTICE_QUEUE = 100
+
+
+def priority(update):
+    if update.callback_query is not None:
+        data = update.callback_query.data or ''
+        return LOW if data.startswith(LOW_PRIORITY_CALLBACKS) else NORMAL
+    message = update.message
+    if message is not None and (message.text or '').startswith('/'):
+        command = message.text.split(maxsplit=1)[0][1:].split('@', 1)[0]
+        if command in LOW_PRIORITY_COMMANDS:
+            return LOW
+    return NORMAL
+
+
+def staff_ids():
+    """Telegram ids that never get the customer busy notice: admins and agents."""
+    from agents.models import Agent
+    return set(settings.ADMIN_IDS) | set(Agent.objects.values_list('telegram_id', flat=True))
+
+
+class Ingress:
+    def __init__(self, capacity, deferred_max, notice_seconds, busy_text, shed_text,
+                 staff_ttl=60, wait_step=0.02, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = capacity
+        self.low_water = capacity // 2
+        self.notice_seconds = notice_seconds
+        self.busy_text = busy_text
+        self.shed_text = shed_text
+        self.staff_ttl = staff_ttl
+        self.wait_step = wait_step
+        self.clock = clock
+        self.sleep = sleep
+        self.bot = None
+        self.deferred = deque()
+        self.deferred_max = deferred_max
+        self._lock = threading.Lock()
+        self._draining = threading.Lock()
+        self._notified = {}  # chat id -> clock() of its last busy notice
+        self._staff, self._staff_loaded = set(), None
+        self.counts = Counter()  # queued, deferred, shed, notices
+        self.paused_since = None
+        self.paused_seconds = 0.0
+        self._notices = queue.Queue(maxsize=NOTICE_QUEUE)
+        self._sender = None
+
+    def attach(self, bot):
+        self.bot = bot
+        process_new_updates = bot.process_new_updates
+
+        def bounded_process_new_updates(updates):
+            self.drain()
+            for update in updates:
+                self.admit(update)
+
+        self._dispatch = process_new_updates
+        bot.process_new_updates = bounded_process_new_updates
+        return self
+
+    # ---- queue -----------------------------------------------------------
+    @property
+    def depth(self):
+        return self.bot.worker_pool.tasks.qsize()
+
+    @property
+    def paused(self):
+        return self.paused_since is not None
+
+    def _queue(self, update):
+        self._dispatch([update])
+        self.counts['queued'] += 1
+
+    def _skip(self, update):
+        # Not dispatched now, but Telegram must not send it again
+        if update.update_id > self.bot.last_update_id:
+            self.bot.last_update_id = update.update_id
+
+    def admit(self, update):
+        if priority(update) == LOW and (self.depth >= self.low_water or self.deferred):
+            self._skip(update)
+            if len(self.deferred) < self.deferred_max:
+                self.deferred.append(update)
+                self.counts['deferred'] += 1
+            else:
+                self.counts['shed'] += 1
+                logger.warning("Ingress full: shed update %s", update.update_id)
+                self.reply_shed(update)
+            return
+        if self.depth >= self.capacity:
+            self.reply_busy(update)
+            self.wait_for_room()
+        self._queue(update)
+
+    def wait_for_room(self):
+        """Block the poll thread until a handler thread frees a slot: polling pauses meanwhile."""
+        with self._lock:
+            self.paused_since = self.clock()
+        logger.warning("Ingress queue full (%d): polling paused", self.capacity)
+        while self.depth >= self.capacity:
+            self.sleep(self.wait_step)
+        with self._lock:
+            waited = self.clock() - self.paused_since
+            self.paused_seconds += waited
+            self.paused_since = None
+        logger.info("Ingress queue has room again after %.2f s", waited)
+
+    def drain(self):
+        """Queue deferred low-priority updates again, oldest first, while the queue is below half full."""
+        if not self.deferred or not self._draining.acquire(blocking=False):
+            return  # nothing deferred, or another thread is on it
+        try:
+            while self.deferred and self.depth < self.low_water:
+                self._dispatch([self.deferred.popleft()])
+                self.counts['queued'] += 1
+        finally:
+            self._draining.release()
+
+    # ---- busy notices ----------------------------------------------------
+    def _is_staff(self, user_id):
+        now = self.clock()
+        if self._staff_loaded is None or now - self._staff_loaded > self.staff_ttl:
+            try:
+                self._staff = staff_ids()
+            except Exception:
+                logger.exception("Could not load staff ids for busy notices")
+            self._staff_loaded = now
+        return user_id in self._staff
+
+    def reply_busy(self, update):
+        """Tell a customer writing privately that replies are delayed, at most once per chat per notice_seconds."""
+        message = update.message
+        if message is None or message.from_user is None or message.chat.type != 'private':
+            return
+        now = self.clock()
+        last = self._notified.get(message.chat.id)
+        if last is not None and now - last < self.notice_seconds:
+            return
+        if self._is_staff(message.from_user.id):
+            return
+        if len(self._notified) > 10000:  # forget notices that no longer suppress anything
+            self._notified = {chat: at for chat, at in self._notified.items() if now - at < self.notice_seconds}
+        self._notified[message.chat.id] = now
+        self._send(update, message.chat.id, self.busy_text)
+
+    def reply_shed(self, update):
+        """Tell whoever sent a shed update to try again: an alert for a button press, else a message."""
+        if update.callback_query is not None:
+            self._send(update, None, self.shed_text, callback_query_id=update.callback_query.id)
+        elif update.message is not None:
+            self._send(update, update.message.chat.id, self.shed_text)
+
+    def _send(self, update, chat_id, text, callback_query_id=None):
+        if self._sender is None:
+            self._sender = threading.Thread(target=self._send_notices, name="IngressNotices", daemon=True)
+            self._sender.start()
+        try:
+            self._notices.put_nowait((update.update_id, chat_id, text, callback_query_id))
+        except queue.Full:
+            self.counts['notices_skipped'] += 1
+
+    def _send_notices(self):
+        while True:
+            update_id, chat_id, text, callback_query_id = self._notices.get()
+            try:
+                if callback_query_id:
+                    self.bot.answer_callback_query(callback_query_id, text, show_alert=True)
+                else:
+                    self.bot.send_message(chat_id, text)
+                self.counts['notices'] += 1
+            except Exception as e:
+                logger.warning("Busy reply for update %s failed: %s", update_id, e)
+            finally:
+                self._notices.task_done()
+
+    def metrics(self):
+        with self._lock:
+            paused_for = self.clock() - self.paused_since if self.paused_since is not None else 0.0
+            return {
+                "depth": self.depth,
+                "capacity": self.capacity,
+                "paused": self.paused_since is not None,
+                "paused_seconds": round(self.paused_seconds + paused_for, 3),
+                "deferred_waiting": len(self.deferred),
+                "queued": self.counts['queued'],
+                "deferred": self.counts['deferred'],
+                "shed": self.counts['shed'],
+                "busy_notices": self.counts['notices'],
+                "busy_notices_skipped": self.counts['notices_skipped'],
+            }
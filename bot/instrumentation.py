@@ -0,0 +1,124 @@
+# bot/instrumentation.py
+"""
+Per-update query instrumentation for the telebot handlers.
+
+With ``QUERY_INSTRUMENTATION=True`` every registered handler runs inside a
+query counter. Handlers that exceed their budget, or that repeat the same
+query shape (the usual N+1 signature), are logged with the handler name.
+"""
+import functools
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Handler lists on a TeleBot instance that hold {'function': ...} dicts
+HANDLER_LISTS = (
+    'message_handlers',
+    'edited_message_handlers',
+    'callback_query_handlers',
+    'inline_handlers',
+)
+
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+
+
+def query_shape(sql: str) -> str:
+    """Collapse variable-length IN (...) lists so equivalent queries compare equal."""
+    return _IN_LIST.sub("(%s, ...)", sql)
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries and their shapes."""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.shapes[query_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold: int):
+        """Return (shape, times) for every shape executed at least `threshold` times."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+@contextmanager
+def count_queries():
+    """Count queries issued on this thread's connections while the block runs."""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(counter))
+        yield counter
+
+
+def handler_budget(name: str) -> int:
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(name, settings.QUERY_BUDGET_DEFAULT)
+
+
+def report(name: str, counter: QueryCounter):
+    """Log budget overruns and repeated query shapes for one handler run."""
+    budget = handler_budget(name)
+    if counter.count > budget:
+        logger.warning("Handler %s ran %d queries (budget %d)", name, counter.count, budget)
+    for shape, times in counter.repeated(settings.N_PLUS_ONE_THRESHOLD):
+        logger.warning("Possible N+1 in %s: %d x %s", name, times, shape)
+
+
+def instrument(func, name=None):
+    """Wrap a handler so every call is counted and reported under `name`."""
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with count_queries() as counter:
+            try:
+                return func(*args, **kwargs)
+            finally:
+                report(name, counter)
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument_handlers(bot):
+    """
+    Wrap every handler registered on `bot`. Call after all register_*_handlers().
+    Next-step handlers are registered per update and are not covered.
+    """
+    wrapped = 0
+    for attr in HANDLER_LISTS:
+        for handler in getattr(bot, attr, []):
+            func = handler['function']
+            if getattr(func, '_instrumented', False):
+                continue
+            handler['function'] = instrument(func)
+            wrapped += 1
+    logger.info("Query instrumentation enabled for %d handlers", wrapped)
+    return wrapped
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, max_repeats: int = None):
+    """
+    Fail if the block runs more than `max_queries` queries, or (when given) any
+    query shape more than `max_repeats` times. Used by tests to pin hot paths.
+    """
+    with count_queries() as counter:
+        yield counter
+    if counter.count > max_queries:
+        listing = "\n".join(f"{n} x {shape}" for shape, n in counter.shapes.most_common())
+        raise AssertionError(f"{counter.count} queries executed, budget is {max_queries}:\n{listing}")
+    if max_repeats is not None:
+        offenders = counter.repeated(max_repeats + 1)
+        if offenders:
+            shape, times = offenders[0]
+            raise AssertionError(f"Query repeated {times} times (max {max_repeats}): {shape}")
@@ -0,0 +1,138 @@
+# bot/jobs.py
+"""
+Tracked background jobs for handler work that should not hold up a reply.
+
+Callback handlers commit their ticket transition, answer the button at once
+and hand the slow part (notifying customer and agent, replaying history) to
+submit(). Jobs run on a small pool of JOB_WORKERS threads, each with its own
+database connection, closed after every job. The last JOB_HISTORY finished
+jobs are kept for metrics() (runbot's /status) along with their timings and
+errors. With JOB_WORKERS = 0 jobs run inline, in the submitting thread
+(tests, debugging).
+"""
+import itertools
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    __slots__ = ('id', 'name', 'state', 'submitted', 'started', 'finished', 'error')
+
+    def __init__(self, job_id, name):
+        self.id = job_id
+        self.name = name
+        self.state = 'queued'
+        self.submitted = time.monotonic()
+        self.started = self.finished = None
+        self.error = None
+
+    def __repr__(self):
+        return f"<Job #{self.id} {self.name} {self.state}>"
+
+
+class JobRunner:
+    def __init__(self, workers, history=200):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Job") if workers else None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.active = {}  # id -> Job, queued or running
+        self.finished = deque(maxlen=history)
+        self.counts = Counter()
+
+    def submit(self, name, fn, *args, on_done=None):
+        """
+        Run fn(*args) in the background as job `name`. on_done(job), if given,
+        runs after it in the same thread, whether it succeeded or failed
+        (job.state is 'done' or 'failed').
+        """
+        job = Job(next(self._ids), name)
+        with self._lock:
+            self.active[job.id] = job
+            self.counts['submitted'] += 1
+        if self._pool is None:
+            self._run(job, fn, args, on_done)
+        else:
+            self._pool.submit(self._run, job, fn, args, on_done)
+        return job
+
+    def _run(self, job, fn, args, on_done):
+        job.state, job.started = 'running', time.monotonic()
+        if self._pool is not None:
+            close_old_connections()
+        try:
+            fn(*args)
+            job.state = 'done'
+        except Exception as e:
+            job.state, job.error = 'failed', f"{type(e).__name__}: {e}"
+            logger.exception("Job #%s %s failed", job.id, job.name)
+        job.finished = time.monotonic()
+        try:
+            if on_done:
+                on_done(job)
+        except Exception:
+            logger.exception("Completion report for job #%s %s failed", job.id, job.name)
+        finally:
+            if self._pool is not None:
+                connection.close()  # this worker's connection; the next job opens its own
+            with self._lock:
+                self.active.pop(job.id, None)
+                self.finished.append(job)
+                self.counts[job.state] += 1
+        logger.info(
+            "Job #%s %s %s in %.0f ms (waited %.0f ms)", job.id, job.name, job.state,
+            (job.finished - job.started) * 1000, (job.started - job.submitted) * 1000,
+        )
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+
+    def metrics(self):
+        with self._lock:
+            running = sum(1 for job in self.active.values() if job.state == 'running')
+            durations = sorted(job.finished - job.started for job in self.finished)
+            return {
+                "queued": len(self.active) - running,
+                "running": running,
+                "done": self.counts['done'],
+                "failed": self.counts['failed'],
+                "recent_p50_ms": round(durations[len(durations) // 2] * 1000) if durations else None,
+                "recent_max_ms": round(durations[-1] * 1000) if durations else None,
+                "last_error": next((job.error for job in reversed(self.finished) if job.error), None),
+            }
+
+
+_runner = None
+_runner_lock = threading.Lock()
+_inline = JobRunner(0)
+
+
+def get_runner() -> JobRunner:
+    global _runner
+    if not settings.JOB_WORKERS:
+        return _inline
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(settings.JOB_WORKERS, history=settings.JOB_HISTORY)
+        return _runner
+
+
+def submit(name, fn, *args, on_done=None):
+    return get_runner().submit(name, fn, *args, on_done=on_done)
+
+
+def shutdown():
+    global _runner
+    with _runner_lock:
+        runner, _runner = _runner, None
+    if runner is not None:
+        runner.shutdown()
@@ -0,0 +1,208 @@
+# bot/loadgen.py
+"""
+End-to-end load generator for the bot, driven through the fake Bot API.
+
+Each simulated customer runs full ticket lifecycles against a live `runbot`:
+open -> claim -> agent reply -> resolve -> admin approve -> final close.
+Latency is measured from the moment an update is queued on the fake server to
+the bot's first matching outgoing call.
+"""
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+CUSTOMER_ID_BASE = 7_000_000_000
+AGENT_ID_BASE = 7_100_000_000
+ADMIN_ID_BASE = 7_200_000_000
+SUPPORT_CHAT_ID = -1007000000000
+
+STEPS = ('open', 'claim', 'agent_reply', 'resolve_prompt', 'resolve', 'approve', 'close_finally')
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}", "language_code": "en"}
+
+
+def _callback_data(entry):
+    markup = entry.get('reply_markup') or {}
+    for row in markup.get('inline_keyboard', []):
+        for button in row:
+            if button.get('callback_data'):
+                yield button['callback_data']
+
+
+def has_button(entry, prefix):
+    return any(data.startswith(prefix) for data in _callback_data(entry))
+
+
+class StepFailed(Exception):
+    pass
+
+
+class LoadGenerator:
+    def __init__(self, state, customers, agents, admins, rounds=1, step_timeout=30.0):
+        self.state = state
+        self.customer_ids = [CUSTOMER_ID_BASE + i for i in range(customers)]
+        self.agent_ids = [AGENT_ID_BASE + i for i in range(agents)]
+        self.admin_ids = [ADMIN_ID_BASE + i for i in range(max(1, admins))]
+        self.rounds = rounds
+        self.step_timeout = step_timeout
+        self._message_ids = itertools.count(1)
+        self._free_agents = queue.Queue()
+        for agent_id in self.agent_ids:
+            self._free_agents.put(agent_id)
+        self._admin_cycle = itertools.cycle(self.admin_ids)
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.completed = 0
+        self.updates_sent = 0
+
+    # ---- update builders ---------------------------------------------
+    def _push(self, update):
+        with self._lock:
+            self.updates_sent += 1
+        return self.state.push_update(update)
+
+    def send_text(self, user_id, text):
+        self._push({"message": {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+        }})
+
+    def press(self, user_id, data, entry):
+        self._push({"callback_query": {
+            "id": uuid.uuid4().hex,
+            "from": _user(user_id),
+            "chat_instance": "loadtest",
+            "data": data,
+            "message": {
+                "message_id": entry['message_id'],
+                "date": int(time.time()),
+                "chat": {"id": entry['chat_id'], "type": "supergroup" if entry['chat_id'] < 0 else "private"},
+                "text": entry['text'],
+            },
+        }})
+
+    # ---- step runner -------------------------------------------------
+    def step(self, name, action, predicate):
+        """Run `action`, then wait for an outgoing call matching `predicate`."""
+        after = self.state.mark()
+        started = time.monotonic()
+        action()
+        entry = self.state.wait_for(predicate, after=after, timeout=self.step_timeout)
+        if entry is None:
+            with self._lock:
+                self.errors[name] += 1
+            raise StepFailed(name)
+        with self._lock:
+            self.latencies[name].append(entry['time'] - started)
+        return entry
+
+    def lifecycle(self, customer_id):
+        marker = uuid.uuid4().hex[:12]
+        announcement = self.step(
+            'open',
+            lambda: self.send_text(customer_id, f"Hello, my order {marker} has not arrived yet."),
+            lambda e: e['chat_id'] == SUPPORT_CHAT_ID and marker in e['text'] and has_button(e, 'claim_'),
+        )
+        ticket_id = next(d for d in _callback_data(announcement) if d.startswith('claim_')).split('_')[1]
+
+        agent_id = self._free_agents.get()
+        try:
+            self.step(
+                'claim',
+                lambda: self.press(agent_id, f"claim_{ticket_id}", announcement),
+                lambda e: e['chat_id'] == agent_id and f"claimed Ticket #{ticket_id}" in e['text'],
+            )
+            self.step(
+                'agent_reply',
+                lambda: self.send_text(agent_id, f"Looking into {marker} now."),
+                lambda e: e['chat_id'] == customer_id and f"Looking into {marker}" in e['text'],
+            )
+            self.step(
+                'resolve_prompt',
+                lambda: self.send_text(agent_id, "/resolve_ticket"),
+                lambda e: e['chat_id'] == agent_id and "resolution summary" in e['text'],
+            )
+            admin_id = next(self._admin_cycle)
+            request = self.step(
+                'resolve',
+                lambda: self.send_text(agent_id, f"Order {marker} re-shipped."),
+                lambda e: e['chat_id'] == admin_id and has_button(e, f"approve_resolved_{ticket_id}"),
+            )
+            decision = self.step(
+                'approve',
+                lambda: self.press(admin_id, f"approve_resolved_{ticket_id}", request),
+                lambda e: e['method'] == 'editMessageText' and has_button(e, f"close_finally_{ticket_id}"),
+            )
+        finally:
+            self._free_agents.put(agent_id)
+        self.step(
+            'close_finally',
+            lambda: self.press(admin_id, f"close_finally_{ticket_id}", decision),
+            lambda e: e['method'] == 'editMessageText' and f"Ticket #{ticket_id} permanently closed" in e['text'],
+        )
+
+    def _run_customer(self, customer_id):
+        for _ in range(self.rounds):
+            try:
+                self.lifecycle(customer_id)
+            except StepFailed:
+                continue
+            with self._lock:
+                self.completed += 1
+
+    def run(self):
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(self.customer_ids) or 1) as pool:
+            list(pool.map(self._run_customer, self.customer_ids))
+        return self.report(time.monotonic() - started)
+
+    def report(self, elapsed):
+        attempted = len(self.customer_ids) * self.rounds
+        steps = {}
+        for name in STEPS:
+            samples = self.latencies.get(name, [])
+            total = len(samples) + self.errors.get(name, 0)
+            steps[name] = {
+                'count': len(samples),
+                'errors': self.errors.get(name, 0),
+                'error_rate': round(self.errors.get(name, 0) / total, 4) if total else 0.0,
+                'p50_ms': _ms(percentile(samples, 50)),
+                'p99_ms': _ms(percentile(samples, 99)),
+            }
+        all_samples = [s for samples in self.latencies.values() for s in samples]
+        return {
+            'elapsed_s': round(elapsed, 3),
+            'lifecycles_attempted': attempted,
+            'lifecycles_completed': self.completed,
+            'lifecycles_per_s': round(self.completed / elapsed, 3) if elapsed else 0.0,
+            'updates_sent': self.updates_sent,
+            'updates_per_s': round(self.updates_sent / elapsed, 3) if elapsed else 0.0,
+            'p50_ms': _ms(percentile(all_samples, 50)),
+            'p99_ms': _ms(percentile(all_samples, 99)),
+            'error_rate': round(1 - self.completed / attempted, 4) if attempted else 0.0,
+            'api_calls': self.state.calls,
+            'api_429s': self.state.rate_limited,
+            'steps': steps,
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
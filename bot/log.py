@@ -0,0 +1,156 @@
+# bot/log.py
+"""
+Non-blocking logging pipeline for the bot.
+
+Handler threads only append the LogRecord to a bounded in-memory queue
+(AsyncLogHandler). A QueueListener thread does the %-formatting, PII
+redaction, JSON encoding and the file writes with size or time based
+rotation. When the queue is full, records are dropped and counted rather
+than blocking an update handler.
+
+Configured from settings.LOGGING; nothing here imports Django models.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s - %(message)s"
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, thread and any `extra` fields."""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Replace message bodies passed as `extra` fields (e.g. extra={'body': text})
+    with their length.
+    """
+
+    def __init__(self, fields=('body',)):
+        super().__init__()
+        self.fields = tuple(fields)
+
+    def filter(self, record):
+        for field in self.fields:
+            value = getattr(record, field, None)
+            if isinstance(value, str):
+                setattr(record, field, f"<redacted {len(value)} chars>")
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of sub-WARNING records for high-volume loggers.
+    `rates` maps a logger name (or dotted prefix) to the fraction kept, 0..1.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._cache = {}
+
+    def _rate(self, name):
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix, value in sorted(self.rates.items(), key=lambda item: len(item[0]), reverse=True):
+                if name == prefix or name.startswith(prefix + '.'):
+                    rate = value
+                    break
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class _Listener(logging.handlers.QueueListener):
+    def __init__(self, queue, *handlers, redactor=None):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.redactor = redactor
+
+    def prepare(self, record):
+        if self.redactor is not None:
+            self.redactor.filter(record)
+        return record
+
+
+class AsyncLogHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that owns its QueueListener and target handlers.
+
+    Records are enqueued unformatted; formatting happens on the listener thread,
+    so objects passed as log arguments must not be mutated after the call.
+    """
+
+    def __init__(self, filename=None, rotation='size', max_bytes=50 * 1024 * 1024, backup_count=10,
+                 when='midnight', json_format=True, console_level=None, queue_size=10000,
+                 redact_fields=('body',), redact=True):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        targets = []
+        if filename:
+            if rotation == 'time':
+                target = logging.handlers.TimedRotatingFileHandler(
+                    filename, when=when, backupCount=backup_count, encoding='utf-8', delay=True,
+                )
+            else:
+                target = logging.handlers.RotatingFileHandler(
+                    filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True,
+                )
+            target.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+            targets.append(target)
+        if console_level:
+            console = logging.StreamHandler(sys.stderr)
+            console.setLevel(console_level)
+            console.setFormatter(logging.Formatter(TEXT_FORMAT))
+            targets.append(console)
+        redactor = RedactingFilter(redact_fields) if redact else None
+        self.listener = _Listener(self.queue, *targets, redactor=redactor)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def prepare(self, record):
+        # Defer getMessage()/format() to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()  # drains the queue before returning
+            for target in listener.handlers:
+                target.close()
+        super().close()
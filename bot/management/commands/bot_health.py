@@ -0,0 +1,37 @@
+# bot_health.py
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the running bot's health file (HEALTH_FILE), for exec-style liveness/readiness probes. "
+        'Exits non-zero when the bot is stalled (or not ready, with --ready) or the file has gone stale.'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.HEALTH_FILE, help='Status file written by runbot')
+        parser.add_argument('--ready', action='store_true', help='Check readiness instead of liveness')
+        parser.add_argument('--max-age', type=float, default=3 * settings.HEALTH_INTERVAL_SECONDS,
+                            help='Seconds after which an unchanged file means runbot is gone')
+
+    def handle(self, *args, **options):
+        if not options['file']:
+            raise CommandError("No health file: set HEALTH_FILE or pass --file")
+        try:
+            with open(options['file']) as f:
+                status = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {options['file']}: {exc}")
+
+        age = time.time() - status['written_at']
+        self.stdout.write(json.dumps(status, indent=2))
+        if age > options['max_age']:
+            raise CommandError(f"Health file is {age:.0f}s old; runbot (pid {status['pid']}) is not updating it")
+        key = 'ready' if options['ready'] else 'live'
+        if not status[key]:
+            raise CommandError(f"Bot is not {key}: {status['status']}")
@@ -0,0 +1,97 @@
+# check_db_portability.py
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import ProjectState
+from django.db.utils import load_backend
+
+BACKENDS = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that every model, index, constraint and migration works on both SQLite and PostgreSQL. '
+        'Runs the model system checks against each backend and renders every migration to SQL '
+        'without connecting to a database. Backends whose driver is not installed are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', action='append', choices=sorted(BACKENDS),
+                            help='Only check this backend (repeatable)')
+        parser.add_argument('--show-sql', action='store_true', help='Print the rendered migration SQL')
+
+    def handle(self, *args, **options):
+        problems = 0
+        try:
+            call_command('makemigrations', check=True, dry_run=True, verbosity=0)
+        except SystemExit:
+            self.stdout.write(self.style.ERROR("Models have changes that are not reflected in migrations"))
+            problems += 1
+
+        for vendor in options['backend'] or list(BACKENDS):
+            try:
+                connection = self._offline_connection(vendor)
+            except Exception as e:  # driver missing or unusable
+                self.stdout.write(self.style.WARNING(f"{vendor}: skipped ({e})"))
+                continue
+            # Operations look the connection up by alias, so register it for the duration
+            connections[connection.alias] = connection
+            try:
+                found = self._check_models(vendor, connection) + self._render_migrations(
+                    vendor, connection, options['show_sql'],
+                )
+            finally:
+                del connections[connection.alias]
+            problems += found
+            style = self.style.ERROR if found else self.style.SUCCESS
+            self.stdout.write(style(f"{vendor}: {found} problem(s)"))
+
+        if problems:
+            raise CommandError(f"{problems} portability problem(s) found")
+
+    def _offline_connection(self, vendor):
+        # ':memory:' so an SQLite check never leaves a database file behind
+        settings_dict = {'ENGINE': BACKENDS[vendor], 'NAME': ':memory:' if vendor == 'sqlite' else 'portability_check'}
+        connections.configure_settings({'default': settings_dict})  # fills in the defaults
+        backend = load_backend(BACKENDS[vendor])
+        return backend.DatabaseWrapper(settings_dict, alias=f'portability_{vendor}')
+
+    def _check_models(self, vendor, connection):
+        """Run Django's model checks (fields, indexes, constraints) against `connection`'s features."""
+        messages = []
+        for model in apps.get_models():
+            messages += model.check(databases=[connection.alias])
+        serious = [m for m in messages if m.is_serious() or m.level >= 30]  # warnings count too
+        for message in serious:
+            self.stdout.write(f"{vendor}: {message}")
+        return len(serious)
+
+    def _render_migrations(self, vendor, connection, show_sql=False):
+        """Render every migration to `vendor` SQL, the way sqlmigrate does."""
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        plan = []
+        for leaf in sorted(loader.graph.leaf_nodes()):
+            for node in loader.graph.forwards_plan(leaf):
+                if node not in plan:
+                    plan.append(node)
+        state = ProjectState(real_apps=loader.unmigrated_apps)
+        problems = 0
+        for app_label, name in plan:
+            migration = loader.get_migration(app_label, name)
+            try:
+                with connection.schema_editor(collect_sql=True, atomic=False) as editor:
+                    state = migration.apply(state, editor, collect_sql=True)
+            except Exception as e:
+                self.stdout.write(f"{vendor}: {app_label}.{name} cannot be rendered: {e}")
+                problems += 1
+                state = loader.project_state((app_label, name), at_end=True)
+                continue
+            if show_sql:
+                self.stdout.write(f"-- {vendor}: {app_label}.{name}")
+                self.stdout.write("\n".join(editor.collected_sql))
+        return problems
@@ -0,0 +1,36 @@
+# fake_telegram.py
+import logging
+
+from django.core.management.base import BaseCommand
+
+from bot.fake_telegram import FakeTelegramServer, FakeTelegramState
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake Telegram Bot API server (for load and integration testing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Fixed latency added to every send')
+        parser.add_argument('--jitter-ms', type=float, default=0.0, help='Random extra latency, 0..N ms')
+        parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='Fraction of sends answered with 429')
+        parser.add_argument('--retry-after', type=int, default=1, help='retry_after seconds reported with 429s')
+
+    def handle(self, *args, **options):
+        state = FakeTelegramState(
+            latency=options['latency_ms'] / 1000.0,
+            jitter=options['jitter_ms'] / 1000.0,
+            rate_limit_ratio=options['rate_limit_ratio'],
+            retry_after=options['retry_after'],
+        )
+        server = FakeTelegramServer((options['host'], options['port']), state)
+        self.stdout.write(f"Fake Bot API listening. Set TELEGRAM_API_URL={server.api_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
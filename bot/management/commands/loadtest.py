@@ -0,0 +1,122 @@
+# loadtest.py
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from agents.models import Agent
+from bot.fake_telegram import FakeTelegramServer, FakeTelegramState
+from bot.loadgen import LoadGenerator, SUPPORT_CHAT_ID
+from customers.models import Customer
+from tickets import events
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run simulated customers, agents and admins through full ticket lifecycles against runbot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=20)
+        parser.add_argument('--agents', type=int, default=5)
+        parser.add_argument('--admins', type=int, default=1)
+        parser.add_argument('--rounds', type=int, default=1, help='Lifecycles per customer')
+        parser.add_argument('--port', type=int, default=0, help='Fake Bot API port (0 = any free port)')
+        parser.add_argument('--latency-ms', type=float, default=0.0)
+        parser.add_argument('--jitter-ms', type=float, default=0.0)
+        parser.add_argument('--rate-limit-ratio', type=float, default=0.0)
+        parser.add_argument('--retry-after', type=int, default=1)
+        parser.add_argument('--step-timeout', type=float, default=30.0)
+        parser.add_argument('--mode', default='polling', choices=['polling'],
+                            help='runbot update mode under test (runbot only supports polling)')
+        parser.add_argument('--runbot-args', default='', help='Extra arguments passed to the runbot subprocess')
+        parser.add_argument('--no-spawn', action='store_true',
+                            help="Don't start runbot; point an already running one at the printed URL")
+        parser.add_argument('--keep-data', action='store_true', help='Keep simulated customers/agents afterwards')
+        parser.add_argument('--json', dest='json_path', help='Also write the report to this file')
+
+    def handle(self, *args, **options):
+        state = FakeTelegramState(
+            latency=options['latency_ms'] / 1000.0,
+            jitter=options['jitter_ms'] / 1000.0,
+            rate_limit_ratio=options['rate_limit_ratio'],
+            retry_after=options['retry_after'],
+        )
+        server = FakeTelegramServer(('127.0.0.1', options['port']), state)
+        server.start()
+        generator = LoadGenerator(
+            state,
+            customers=options['customers'],
+            agents=options['agents'],
+            admins=options['admins'],
+            rounds=options['rounds'],
+            step_timeout=options['step_timeout'],
+        )
+        for agent_id in generator.agent_ids:
+            Agent.objects.get_or_create(telegram_id=agent_id, defaults={'full_name': f"Load Agent {agent_id}"})
+
+        process = None
+        try:
+            if options['no_spawn']:
+                self.stdout.write(
+                    f"Start runbot with TELEGRAM_API_URL={server.api_url} SUPPORT_CHAT={SUPPORT_CHAT_ID} "
+                    f"ADMIN_IDS={','.join(map(str, generator.admin_ids))}"
+                )
+            else:
+                process = self._spawn_runbot(server, generator, options['runbot_args'])
+            if not state.wait_for_poller(timeout=60):
+                raise CommandError("runbot never called getUpdates on the fake Bot API")
+            self.stdout.write(
+                f"Running {options['customers']} customers x {options['rounds']} rounds, "
+                f"{options['agents']} agents, {len(generator.admin_ids)} admins ({options['mode']})..."
+            )
+            report = generator.run()
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            server.shutdown()
+            server.server_close()
+            if not options['keep_data']:
+                self._cleanup(generator)
+
+        report['mode'] = options['mode']
+        report['config'] = {k: options[k] for k in (
+            'customers', 'agents', 'admins', 'rounds', 'latency_ms', 'jitter_ms', 'rate_limit_ratio',
+        )}
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                fh.write(output)
+
+    def _spawn_runbot(self, server, generator, extra_args):
+        env = dict(
+            os.environ,
+            TELEGRAM_BOT_TOKEN="123456:LOADTEST",
+            TELEGRAM_API_URL=server.api_url,
+            SUPPORT_CHAT=str(SUPPORT_CHAT_ID),
+            ADMIN_IDS=",".join(map(str, generator.admin_ids)),
+            BAD_WORDS_TOGGLE="False",
+            RUNBOT_LOCK_PATH=os.path.join(tempfile.gettempdir(), "telegram_bot_loadtest.lock"),
+            # Periodic jobs would act on the real tickets in the configured DB
+            STALE_SWEEP_MINUTES="0",
+            UNCLAIMED_ESCALATION_MINUTES="0",
+            PROJECTION_INTERVAL_SECONDS="0",
+        )
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runbot', *extra_args.split()]
+        logger.info("Spawning %s", " ".join(command))
+        return subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+
+    def _cleanup(self, generator):
+        customers = Customer.objects.filter(telegram_id__in=generator.customer_ids)
+        agents = Agent.objects.filter(telegram_id__in=generator.agent_ids)
+        events.purge(customers, agents)
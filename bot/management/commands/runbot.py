@@ -1,34 +1,31 @@
 # runbot.py
+"""
+Run the Telegram bot (long polling).
+
+Nothing heavy is imported at module level: Django loads this module for
+`manage.py help runbot` and friends, so telebot, the handler modules and
+APScheduler are imported in handle() (see bot/startup.py).
+"""
 import os
-import django
 import logging
 import signal
 import sys
+import threading
 import time
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import connections
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'botcore.settings')
-django.setup()
-
-import telebot
-import requests
-
-from customers.bot_handlers import register_customer_handlers
-from tickets.bot_handlers import register_ticket_handlers
-from agents.bot_handlers import register_agent_handlers
+from bot.health import HealthServer, PollerHealth, Watchdog
+from bot.startup import StartupTimeline, warm_up, watch_first_update
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
-)
 
-bot = telebot.TeleBot(settings.TELEGRAM_BOT_TOKEN, threaded=True, num_threads=20)
+SCHEDULER_START_DELAY = 5  # seconds; every job runs at most once a minute anyway
 
 # --- Optional: simple single-instance lock (POSIX) ---
-LOCK_PATH = "/tmp/telegram_bot_runbot.lock"
+LOCK_PATH = os.getenv("RUNBOT_LOCK_PATH", "/tmp/telegram_bot_runbot.lock")
 _lock_fd = None
 def acquire_lock():
     # On Windows you'd use portalocker instead; this is POSIX-only.
@@ -55,35 +52,170 @@ def release_lock():
 # --- End lock helpers ---
 
 
+def build_bot(timeline, num_threads=20, health=None):
+    """
+    Construct the TeleBot and register every handler, importing the handler
+    modules on the way. With `health` (a bot.health.PollerHealth) its polls and
+    handlers are recorded.
+    """
+    telebot = timeline.import_module('telebot')
+    if settings.TELEGRAM_API_URL:
+        telebot.apihelper.API_URL = settings.TELEGRAM_API_URL
+        logger.info("Using Bot API endpoint %s", settings.TELEGRAM_API_URL)
+    tickets = timeline.import_module('tickets.bot_handlers')
+    agents = timeline.import_module('agents.bot_handlers')
+    customers = timeline.import_module('customers.bot_handlers')
+    middleware = timeline.import_module('bot.middleware')
+
+    with timeline.phase("construct bot and register handlers"):
+        bot = telebot.TeleBot(
+            settings.TELEGRAM_BOT_TOKEN, threaded=True, num_threads=num_threads, use_class_middlewares=True,
+        )
+        if settings.CALLBACK_DEDUP_SECONDS > 0:
+            # First, so a cancelled tap skips the other middlewares entirely
+            guard = middleware.CallbackGuardMiddleware(bot, ttl=settings.CALLBACK_DEDUP_SECONDS)
+            bot.setup_middleware(guard)
+            if health is not None:
+                health.callbacks = guard
+        if health is not None:
+            bot.setup_middleware(middleware.HealthMiddleware(health))
+            health.attach(bot)
+        # Recycle each worker thread's DB connection around every update
+        bot.setup_middleware(middleware.DatabaseConnectionMiddleware())
+        tickets.register_ticket_handlers(bot)
+        agents.register_agent_handlers(bot)
+        customers.register_customer_handlers(bot)
+        if settings.QUERY_INSTRUMENTATION:
+            from bot.instrumentation import instrument_handlers
+            instrument_handlers(bot)
+    return bot
+
+
+def start_scheduler(timeline, bot, health=None):
+    """
+    Periodic maintenance (bot/scheduler.py): projections, archiving, expiry of
+    stale pending media and agent applications, the stale-ticket sweeper,
+    ticket assignment (opt-in) and unclaimed-ticket reminders.
+    Returns the started Maintenance, or None when every job is off.
+    """
+    timeline.import_module('apscheduler.schedulers.background')
+    from bot.scheduler import Maintenance, register_default_jobs
+
+    maintenance = register_default_jobs(Maintenance(workers=settings.MAINTENANCE_WORKERS), bot)
+    if not maintenance.start():
+        return None
+    if health is not None:
+        health.maintenance = maintenance
+        if 'assign_tickets' in maintenance.jobs:
+            from tickets.assignment import get_engine
+            health.assignment = get_engine()
+    return maintenance
+
+
 class Command(BaseCommand):
     help = 'Run the Telegram bot'
-
-    def handle(self, *args, **kwargs):
+    # The bot serves no HTTP: skip the URL/admin system checks, which import every admin module.
+    # Run `manage.py check` in CI/deploys instead.
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.BOT_THREADS,
+                            help='Handler worker threads')
+        parser.add_argument('--startup-report', action='store_true',
+                            help='Log where startup time went, up to the first update received')
+        parser.add_argument('--no-warm-up', action='store_true',
+                            help="Don't warm caches while the first getUpdates is in flight")
+
+    def handle(self, *args, **options):
+        timeline = StartupTimeline()
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+        )
         # Ensure only one process runs
         if not acquire_lock():
             return
 
-        logger.info("Starting Telegram bot with 20 threads...")
+        logger.info("Starting Telegram bot with %d threads...", options['threads'])
+        health = PollerHealth(
+            stall_after=settings.HEALTH_STALL_FACTOR * settings.POLL_TIMEOUT,
+            max_backlog=settings.HEALTH_MAX_BACKLOG,
+        )
+        bot = build_bot(timeline, options['threads'], health=health)
+        from bot import jobs, routing, writer
+        from bot.ingress import Ingress
+        from bot.middleware import IngressDrainMiddleware
+        from bot.retry import PollRetryPolicy
+
+        def alert_conflict(description):
+            for admin_id in settings.ADMIN_IDS:
+                bot.send_message(admin_id, f"⚠️ Bot polling conflict (409): {description}\n"
+                                           "Is a second instance running with this token?")
+
+        retry = PollRetryPolicy(
+            base=settings.POLL_RETRY_BASE, cap=settings.POLL_RETRY_MAX, on_conflict=alert_conflict,
+            on_wait=health.waiting,
+        ).attach(bot)
+        health.retry = retry
+        health.ingress = Ingress(
+            capacity=settings.INGRESS_CAPACITY, deferred_max=settings.INGRESS_DEFERRED_MAX,
+            notice_seconds=settings.INGRESS_BUSY_NOTICE_SECONDS, busy_text=settings.TEXT_MESSAGES['busy'],
+            shed_text=settings.TEXT_MESSAGES['busy_retry'],
+        ).attach(bot)
+        bot.setup_middleware(IngressDrainMiddleware(health.ingress))
+        health.jobs = jobs.get_runner()
+        health.routing = routing.get_router()
 
         # Remove webhook so polling doesn't conflict with it
-        try:
-            # pyTelegramBotAPI >=4.x
-            bot.delete_webhook(drop_pending_updates=True)
-            logger.info("Deleted webhook (drop_pending_updates=True).")
-        except AttributeError:
-            # Older versions use remove_webhook()
+        with timeline.phase("delete webhook"):
             try:
-                bot.remove_webhook()
-                logger.info("Removed webhook.")
+                # pyTelegramBotAPI >=4.x
+                bot.delete_webhook(drop_pending_updates=True)
+                logger.info("Deleted webhook (drop_pending_updates=True).")
+            except AttributeError:
+                # Older versions use remove_webhook()
+                try:
+                    bot.remove_webhook()
+                    logger.info("Removed webhook.")
+                except Exception as e:
+                    logger.warning("Failed to remove webhook: %s", e)
             except Exception as e:
-                logger.warning(f"Failed to remove webhook: {e}")
-        except Exception as e:
-            logger.warning(f"delete_webhook failed: {e}")
+                logger.warning("delete_webhook failed: %s", e)
+
+        # Runs beside the first getUpdates: cache warm-up, then, once the first
+        # updates have been served, the maintenance scheduler (importing APScheduler
+        # alone costs ~90 ms of CPU that would otherwise compete with them)
+        def background_start():
+            if not options['no_warm_up']:
+                with timeline.phase("warm-up (background)"):
+                    warm_up()
+            time.sleep(SCHEDULER_START_DELAY)
+            try:
+                start_scheduler(timeline, bot, health)
+            except Exception:
+                logger.exception("Maintenance scheduler did not start")
+
+        if options['startup_report']:
+            watch_first_update(bot, timeline, on_first=lambda: logger.info("%s", timeline.report()))
+        timeline.mark("polling")
+        logger.info("Polling after %.0f ms of startup", timeline.marks[-1][1] * 1000)
+        threading.Thread(target=background_start, name="RunbotStartup", daemon=True).start()
+
+        if settings.HEALTH_PORT:
+            server = HealthServer((settings.HEALTH_HOST, settings.HEALTH_PORT), health)
+            server.start()
+            logger.info("Health endpoints on http://%s:%s/healthz", *server.server_address[:2])
+
+        def wedged():
+            # The poll thread is stuck somewhere stop_polling() can't reach: let the supervisor restart us
+            writer.shutdown()
+            release_lock()
+            os._exit(3)
 
-        # Register handlers
-        register_ticket_handlers(bot)
-        register_agent_handlers(bot)
-        register_customer_handlers(bot)
+        Watchdog(
+            health, bot, interval=settings.HEALTH_INTERVAL_SECONDS, grace=settings.HEALTH_GRACE_SECONDS,
+            path=settings.HEALTH_FILE or None, on_wedged=wedged,
+        ).start()
 
         # Setup graceful shutdown
         def shutdown_handler(signum, frame):
@@ -92,27 +224,31 @@ class Command(BaseCommand):
                 bot.stop_polling()
             except Exception:
                 pass
+            if health.maintenance is not None:
+                health.maintenance.shutdown()  # frees its job leases for the next runbot
+            jobs.shutdown()  # let answered callbacks finish notifying
+            routing.shutdown()  # the sweeper re-posts whatever is still queued
+            writer.shutdown()  # flush queued message inserts
             release_lock()
             sys.exit(0)
 
         signal.signal(signal.SIGINT, shutdown_handler)
         signal.signal(signal.SIGTERM, shutdown_handler)
 
-        # Retry loop to keep bot alive
+        # Retry loop to keep bot alive. Failed getUpdates calls are retried inside
+        # polling by the retry policy; what reaches here stopped polling itself.
         while True:
             try:
-                bot.polling(none_stop=True, timeout=60)
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Network error: {e}. Retrying in 10s...")
-                try:
-                    bot.stop_polling()  # make sure old polling stops before retry
-                except Exception:
-                    pass
-                time.sleep(10)
+                # Also returns after the watchdog stops a stalled poller: poll again
+                bot.polling(none_stop=True, timeout=60, long_polling_timeout=settings.POLL_TIMEOUT)
             except Exception as e:
-                logger.exception(f"Bot crashed unexpectedly: {e}. Restarting in 15s...")
+                delay = retry.crashed(e)
+                logger.exception("Bot crashed unexpectedly: %s. Restarting in %.1fs...", e, delay)
+                health.crashed(e)
+                health.waiting(delay)
                 try:
                     bot.stop_polling()  # prevent overlapping pollers that cause 409
                 except Exception:
                     pass
-                time.sleep(15)
+                connections.close_all()  # don't carry stale connections into the next poll
+                time.sleep(delay)
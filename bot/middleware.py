@@ -0,0 +1,126 @@
+# bot/middleware.py
+"""
+telebot class middlewares for `runbot`.
+
+Requires a bot built with use_class_middlewares=True. Middlewares run on the
+worker thread that handles the update, so anything thread-local (such as the
+Django DB connection) belongs to that update's handler.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.db import close_old_connections
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+
+from bot.dedup import TicketLocks, TTLCache, callback_key, ticket_of
+
+logger = logging.getLogger(__name__)
+
+# Update types the bot registers handlers for
+UPDATE_TYPES = ['message', 'edited_message', 'callback_query']
+
+
+class DatabaseConnectionMiddleware(BaseMiddleware):
+    """
+    Treat every update like a Django request: close_old_connections() before
+    and after the handler, so the worker thread's connection is dropped when it
+    is broken or older than CONN_MAX_AGE (health-checked on reuse when
+    CONN_HEALTH_CHECKS is on).
+
+    Next-step handlers are dispatched outside the middleware chain; the
+    connection they leave behind is recycled by the next update on that thread.
+    """
+
+    def __init__(self, update_types=None):
+        super().__init__()
+        self.update_types = list(update_types or UPDATE_TYPES)
+
+    def pre_process(self, message, data):
+        close_old_connections()
+
+    def post_process(self, message, data, exception):
+        close_old_connections()
+
+
+class HealthMiddleware(BaseMiddleware):
+    """Count the handlers running right now for bot.health (the 'in_flight' figure)."""
+
+    def __init__(self, health, update_types=None):
+        super().__init__()
+        self.health = health
+        self.update_types = list(update_types or UPDATE_TYPES)
+
+    def pre_process(self, message, data):
+        self.health.handler_started()
+
+    def post_process(self, message, data, exception):
+        self.health.handler_finished()
+
+
+class IngressDrainMiddleware(BaseMiddleware):
+    """Requeue updates a bot.ingress.Ingress deferred as soon as a handler finishes, not at the next poll."""
+
+    def __init__(self, ingress, update_types=None):
+        super().__init__()
+        self.ingress = ingress
+        self.update_types = list(update_types or UPDATE_TYPES)
+
+    def pre_process(self, message, data):
+        pass
+
+    def post_process(self, message, data, exception):
+        self.ingress.drain()
+
+
+class CallbackGuardMiddleware(BaseMiddleware):
+    """
+    Stop repeated button taps before they reach a handler. A callback query
+    with the same data on the same message as one seen in the last `ttl`
+    seconds, or one acting on a ticket whose previous transition is still
+    running, is answered straight away and cancelled: no queries, no
+    notifications. A handler that raises forgets its tap, so it can be retried.
+
+    Must be the first middleware: a cancelled update skips every other
+    middleware's post_process.
+    """
+
+    def __init__(self, bot, ttl, clock=time.monotonic):
+        super().__init__()
+        self.update_types = ['callback_query']
+        self.bot = bot
+        self.seen = TTLCache(ttl, clock)
+        self.locks = TicketLocks()
+        self.counts = Counter()
+
+    def _answer(self, call, text):
+        try:
+            self.bot.answer_callback_query(call.id, text)
+        except Exception as e:
+            logger.warning("Could not answer repeated callback %s: %s", call.data, e)
+
+    def pre_process(self, call, data):
+        key = callback_key(call)
+        if not self.seen.add(key):
+            self.counts['duplicates'] += 1
+            logger.info("Ignored repeated tap %r from %s", call.data, call.from_user.id)
+            self._answer(call, "⏳ Already on it…")
+            return CancelUpdate()
+        ticket_id = ticket_of(call.data)
+        if ticket_id is not None and not self.locks.acquire(ticket_id):
+            self.seen.discard(key)
+            self.counts['ticket_busy'] += 1
+            logger.info("Ticket %s busy; refused %r from %s", ticket_id, call.data, call.from_user.id)
+            self._answer(call, f"⏳ Ticket #{ticket_id} is being updated. Try again in a moment.")
+            return CancelUpdate()
+        data['callback_guard'] = (key, ticket_id)
+
+    def post_process(self, call, data, exception):
+        key, ticket_id = data['callback_guard']
+        if ticket_id is not None:
+            self.locks.release(ticket_id)
+        if exception is not None:
+            self.seen.discard(key)
+
+    def metrics(self):
+        return {"duplicates": self.counts['duplicates'], "ticket_busy": self.counts['ticket_busy']}
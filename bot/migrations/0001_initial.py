@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('last_started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_status', models.CharField(blank=True, max_length=16)),
+                ('last_duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('timeouts', models.PositiveIntegerField(default=0)),
+                ('lease_owner', models.CharField(blank=True, max_length=128)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -1,3 +1,22 @@
 from django.db import models
 
-# Create your models here.
+
+class ScheduledJob(models.Model):
+    """
+    A periodic maintenance job (bot/scheduler.py): how its last run went, and
+    the lease of the runbot process running it now, if any.
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_status = models.CharField(max_length=16, blank=True)  # ok, failed, timeout
+    last_duration_ms = models.PositiveIntegerField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    runs = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    timeouts = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=128, blank=True)  # "host:pid" of the process running it
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.last_status or 'never run'})"
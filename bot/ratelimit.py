@@ -0,0 +1,58 @@
+# bot/ratelimit.py
+"""
+Rate limiting for outgoing Bot API calls.
+
+Telegram rejects bursts above roughly 30 messages per second per bot with
+429 Too Many Requests and a retry_after. TokenBucket spreads sends from any
+number of threads over a steady rate, and pause() stops everyone for the
+retry_after of a 429 instead of letting each thread find out on its own.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts of up to
+    `capacity`. Kept as the time the bucket is next empty (virtual scheduling),
+    so acquire() is one locked arithmetic step and waiters are served in
+    arrival order.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._burst = (self.capacity - 1) / self.rate
+        self._next_free = clock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` may be spent. Returns the seconds waited."""
+        with self._lock:
+            now = self._clock()
+            next_free = max(self._next_free, now)
+            wait = max(next_free - self._burst - now, 0.0)
+            self._next_free = next_free + tokens / self.rate
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def try_acquire(self, tokens=1, max_wait=0.0):
+        """acquire(), unless that would wait more than `max_wait` seconds: then take nothing and return None."""
+        with self._lock:
+            now = self._clock()
+            next_free = max(self._next_free, now)
+            wait = max(next_free - self._burst - now, 0.0)
+            if wait > max_wait:
+                return None
+            self._next_free = next_free + tokens / self.rate
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """Hand out no tokens for `seconds` (e.g. a 429's retry_after), then resume at `rate` without a burst."""
+        with self._lock:
+            self._next_free = max(self._next_free, self._clock() + seconds + self._burst)
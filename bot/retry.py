@@ -0,0 +1,172 @@
+# bot/retry.py
+"""
+Classified retry policy for runbot's getUpdates loop.
+
+PollRetryPolicy.attach() wraps bot.get_updates: a failed poll is classified,
+the poll thread waits the class's delay, and the wrapper returns no updates so
+telebot simply polls again. Failures never reach telebot's own error handling
+(a blind 0.25 s → 60 s doubling) or runbot's crash loop.
+
+    network   connection errors, timeouts     exponential from POLL_RETRY_BASE, with jitter
+    server    HTTP 5xx, invalid JSON          re-poll almost at once, then back off the same way
+    throttled 429                             exactly the retry_after Telegram asks for
+    conflict  409 (another poller, a webhook) slow exponential backoff and an alert;
+                                              a webhook is deleted instead
+    api       anything else from the API      exponential, like network
+    crash     polling itself stopped          exponential from 1 s (runbot's loop calls crashed())
+
+Delays grow with consecutive failures of the same class and are capped at
+POLL_RETRY_MAX; the first success resets them and logs how long recovery took.
+Exceptions that are not API or network errors are re-raised to runbot's loop,
+which backs off through crashed(). on_wait(delay) is told of every wait before
+the poll thread sleeps it out, so the health watchdog does not take a long
+retry_after for a wedged poller.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+from telebot.apihelper import ApiException, ApiHTTPException, ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+NETWORK, SERVER, THROTTLED, CONFLICT, API, CRASH = 'network', 'server', 'throttled', 'conflict', 'api', 'crash'
+
+
+def classify(exc):
+    """(class, retry_after or None) for a failed getUpdates; class None for errors that are not ours to retry."""
+    if isinstance(exc, requests.exceptions.RequestException):
+        return NETWORK, None
+    if isinstance(exc, ApiTelegramException):
+        if exc.error_code == 429:
+            return THROTTLED, ((exc.result_json or {}).get('parameters') or {}).get('retry_after', 1)
+        if exc.error_code == 409:
+            return CONFLICT, None
+        if exc.error_code >= 500:
+            return SERVER, None
+        return API, None
+    if isinstance(exc, ApiHTTPException):
+        return (SERVER if exc.result.status_code >= 500 else API), None
+    if isinstance(exc, ApiException):  # invalid JSON: a proxy or the API misbehaving
+        return SERVER, None
+    return None, None
+
+
+class PollRetryPolicy:
+    # Multiplier on `base` for the first retry of each class
+    FIRST_DELAY = {NETWORK: 1, SERVER: 0.2, API: 1, CONFLICT: 10, CRASH: 2}
+
+    def __init__(self, base=0.5, cap=30.0, on_conflict=None, on_wait=None, sleep=time.sleep,
+                 jitter=random.uniform, clock=time.monotonic):
+        self.base = base
+        self.cap = cap
+        self.on_conflict = on_conflict
+        self.on_wait = on_wait
+        self.sleep = sleep
+        self.jitter = jitter
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.failures = Counter()  # class -> count, since start
+        self.streak = 0  # consecutive failed polls
+        self._streak_class = None
+        self._failing_since = None
+        self.backoff_seconds = 0.0  # total time spent waiting
+        self.last_delay = None
+        self.last_recovery = None  # seconds from the first failure to the next successful poll
+        self.recoveries = 0
+        self.conflicts_alerted = 0
+
+    def attach(self, bot):
+        get_updates = bot.get_updates
+
+        def retrying_get_updates(*args, **kwargs):
+            try:
+                updates = get_updates(*args, **kwargs)
+            except Exception as exc:
+                kind, retry_after = classify(exc)
+                if kind is None:
+                    raise
+                delay = self.failed(kind, exc, retry_after, bot)
+                if self.on_wait:
+                    self.on_wait(delay)
+                self.sleep(delay)
+                return []
+            self.succeeded()
+            return updates
+
+        bot.get_updates = retrying_get_updates
+        return self
+
+    def delay(self, kind, attempt, retry_after=None):
+        """Seconds to wait before poll number `attempt` (1 = the first retry) after failures of `kind`."""
+        if kind == THROTTLED:
+            return float(retry_after)
+        ceiling = min(self.cap, self.base * self.FIRST_DELAY.get(kind, 1) * 2 ** (attempt - 1))
+        return self.jitter(ceiling / 2, ceiling)  # "equal jitter": never 0, never in lockstep
+
+    def crashed(self, exc):
+        """Polling itself stopped with `exc`: seconds to wait before polling again."""
+        kind, retry_after = classify(exc)
+        return self.failed(kind or CRASH, exc, retry_after)
+
+    def failed(self, kind, exc, retry_after=None, bot=None):
+        """Record a failure of class `kind`; returns the seconds to wait before polling again."""
+        with self._lock:
+            if self._failing_since is None:
+                self._failing_since = self.clock()
+            self.streak = self.streak + 1 if kind == self._streak_class else 1
+            self._streak_class = kind
+            self.failures[kind] += 1
+            attempt = self.streak
+            delay = self.delay(kind, attempt, retry_after)
+            self.last_delay = delay
+            self.backoff_seconds += delay
+
+        if kind == CONFLICT:
+            self._conflict(exc, attempt, bot)
+        log = logger.warning if attempt < 5 else logger.error
+        log("Polling failed (%s, attempt %d): %s; polling again in %.2f s", kind, attempt, exc, delay)
+        return delay
+
+    def _conflict(self, exc, attempt, bot):
+        description = getattr(exc, 'description', str(exc))
+        if 'webhook' in description.lower() and bot is not None:
+            logger.error("A webhook is set; deleting it so polling can continue")
+            try:
+                bot.delete_webhook()
+            except Exception as e:
+                logger.warning("delete_webhook failed: %s", e)
+            return
+        if attempt == 1:  # once per conflict episode
+            logger.critical("409 Conflict: another process is polling with this bot token (%s)", description)
+            self.conflicts_alerted += 1
+            if self.on_conflict:
+                try:
+                    self.on_conflict(description)
+                except Exception:
+                    logger.exception("Conflict alert failed")
+
+    def succeeded(self):
+        with self._lock:
+            if self._failing_since is None:
+                return
+            self.last_recovery = self.clock() - self._failing_since
+            self.recoveries += 1
+            streak, kind = self.streak, self._streak_class
+            self._failing_since, self.streak, self._streak_class = None, 0, None
+        logger.info("Polling recovered after %d failed poll(s) (%s) in %.2f s", streak, kind, self.last_recovery)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "failures": dict(self.failures),
+                "streak": self.streak,
+                "last_delay": round(self.last_delay, 3) if self.last_delay is not None else None,
+                "backoff_seconds": round(self.backoff_seconds, 3),
+                "recoveries": self.recoveries,
+                "last_recovery_seconds": round(self.last_recovery, 3) if self.last_recovery is not None else None,
+                "conflicts_alerted": self.conflicts_alerted,
+            }
@@ -0,0 +1,249 @@
+# bot/routing.py
+"""
+Language-sharded support groups.
+
+Ticket posts (new tickets, raises, the sweeper's re-posts) go to the support
+group for the customer's Telegram language in SUPPORT_ROUTES, so no single
+group carries every ticket. A language without a route ("pt-br" is tried as
+"pt-br", then "pt") goes to the fallback SUPPORT_CHAT, which every agent is
+invited to alongside their own language's group.
+
+Telegram allows a group about 20 messages a minute. Each group gets a
+TokenBucket of SUPPORT_CHAT_RATE_PER_MINUTE, and nothing that posts ever
+waits for it:
+
+- post() (new tickets, on handler threads) sends at once when the group has
+  budget left, and otherwise queues the post for the router's sender thread.
+  That thread waits up to SUPPORT_CHAT_MAX_WAIT seconds for the group's
+  budget, then overflows to the fallback chat and waits for its budget
+  instead. At most OUTBOX_MAX posts are queued; beyond that they are dropped
+  (and counted), and the stale-ticket sweeper re-posts their tickets later.
+- try_post() (the sweeper's re-posts) sends only if the group, or failing
+  that the fallback chat, has budget right now, and otherwise returns False
+  for the caller to try again on its next run.
+
+A group that answers 429 has its bucket paused for the retry_after and the
+post goes the same way as one without budget. With
+SUPPORT_CHAT_RATE_PER_MINUTE = 0 posts are not limited (tests) and there
+are no buckets; only a 429 still holds that chat for its retry_after. Per-chat
+counts and the queue are in metrics() (runbot's /status "routing").
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from telebot.apihelper import ApiTelegramException
+
+from bot.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BURST = 5  # posts a quiet group may take at once
+OUTBOX_MAX = 1000  # posts waiting for the sender thread
+
+
+def chat_for(language):
+    """The support chat for a Telegram language code (e.g. "fr", "pt-br"); SUPPORT_CHAT when none is routed."""
+    routes = settings.SUPPORT_ROUTES
+    language = (language or '').strip().lower().replace('_', '-')
+    if language in routes:
+        return routes[language]
+    return routes.get(language.split('-', 1)[0], settings.SUPPORT_CHAT)
+
+
+def support_chats(language=None):
+    """Chats an agent speaking `language` belongs in: their language's group, then the fallback chat."""
+    chats = [chat_for(language), settings.SUPPORT_CHAT]
+    return list(dict.fromkeys(chats))
+
+
+class SupportRouter:
+    def __init__(self, per_minute, max_wait, clock=time.monotonic, sleep=time.sleep, outbox_max=None,
+                 background=True):
+        self.per_minute = per_minute
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.background = background  # False: queued posts wait for flush() (tests)
+        self._lock = threading.Lock()
+        self._buckets = {}  # chat id -> TokenBucket
+        self._paused = {}  # chat id -> clock() its 429 ends; per_minute = 0 only, which has no buckets
+        self._outbox = queue.Queue(maxsize=outbox_max or OUTBOX_MAX)
+        self._sender = None
+        self.posts = Counter()  # chat id -> posts sent
+        self.overflows = Counter()  # routed chat id -> posts sent to the fallback instead
+        self.dropped = 0  # posts not queued because the outbox was full
+
+    def bucket(self, chat_id):
+        with self._lock:
+            if chat_id not in self._buckets:
+                self._buckets[chat_id] = TokenBucket(
+                    self.per_minute / 60, capacity=min(BURST, self.per_minute), clock=self.clock, sleep=self.sleep,
+                )
+            return self._buckets[chat_id]
+
+    def _try_acquire(self, chat_id, max_wait=0.0):
+        """Whether the chat has budget within max_wait seconds (waiting for it); see TokenBucket.try_acquire."""
+        if self.per_minute:
+            return self.bucket(chat_id).try_acquire(max_wait=max_wait) is not None
+        wait = self._paused.get(chat_id, 0) - self.clock()
+        if wait > max_wait:
+            return False
+        if wait > 0:
+            self.sleep(wait)
+        return True
+
+    def _acquire(self, chat_id):
+        if self.per_minute:
+            self.bucket(chat_id).acquire()
+        else:
+            self._try_acquire(chat_id, max_wait=float('inf'))
+
+    def _attempt(self, chat_id, send, args, kwargs):
+        """(True, send()'s result), or (False, None) when the chat answers 429; its bucket is then paused."""
+        try:
+            result = send(chat_id, *args, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code != 429:
+                raise
+            retry_after = ((e.result_json or {}).get('parameters') or {}).get('retry_after', 60)
+            if self.per_minute:
+                self.bucket(chat_id).pause(retry_after)
+            else:
+                with self._lock:
+                    self._paused[chat_id] = self.clock() + retry_after
+            logger.warning("Support chat %s is rate limited for %s s", chat_id, retry_after)
+            return False, None
+        with self._lock:
+            self.posts[chat_id] += 1
+        return True, result
+
+    def _overflowed(self, chat_id, fallback):
+        with self._lock:
+            self.overflows[chat_id] += 1
+        logger.info("Support chat %s has no budget left; posting to %s", chat_id, fallback)
+
+    def post(self, send, language, *args, **kwargs):
+        """
+        send(chat_id, *args, **kwargs) (bot.send_message, send_photo, ...) to
+        the support chat for `language`: at once when it has budget, returning
+        send()'s result, otherwise from the sender thread, returning None.
+        Never waits.
+        """
+        chat_id = chat_for(language)
+        if self._try_acquire(chat_id):
+            sent, result = self._attempt(chat_id, send, args, kwargs)
+            if sent:
+                return result
+        try:
+            self._outbox.put_nowait((language, send, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.error("Support-group outbox is full; post for chat %s dropped", chat_id)
+            return None
+        if self.background:
+            self._start_sender()
+        return None
+
+    def try_post(self, send, language, *args, **kwargs):
+        """post(), but only if the chat for `language` or the fallback chat has budget right now. Returns whether it was sent."""
+        chat_id, fallback = chat_for(language), settings.SUPPORT_CHAT
+        if self._try_acquire(chat_id) and self._attempt(chat_id, send, args, kwargs)[0]:
+            return True
+        if chat_id == fallback or not self._try_acquire(fallback):
+            return False
+        if not self._attempt(fallback, send, args, kwargs)[0]:
+            return False
+        self._overflowed(chat_id, fallback)
+        return True
+
+    # ---- sender thread ---------------------------------------------------
+    def _start_sender(self):
+        with self._lock:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._run, name="SupportRouter", daemon=True)
+                self._sender.start()
+
+    def _run(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                return
+            self._deliver(*item)
+
+    def _deliver(self, language, send, args, kwargs):
+        chat_id, fallback = chat_for(language), settings.SUPPORT_CHAT
+        try:
+            if chat_id != fallback:
+                if self._try_acquire(chat_id, max_wait=self.max_wait):
+                    if self._attempt(chat_id, send, args, kwargs)[0]:
+                        return
+                self._overflowed(chat_id, fallback)
+            while True:  # a 429 pauses the chat, which the next _acquire() waits out
+                self._acquire(fallback)
+                if self._attempt(fallback, send, args, kwargs)[0]:
+                    return
+        except Exception:
+            logger.exception("Queued post for support chat %s failed", chat_id)
+
+    def flush(self):
+        """Deliver every queued post in this thread, as the sender thread would (tests)."""
+        while True:
+            try:
+                item = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                self._deliver(*item)
+
+    def stop(self):
+        sender, self._sender = self._sender, None
+        if sender is not None:
+            self._outbox.put(None)
+            sender.join(timeout=5)
+        if self._outbox.qsize():
+            logger.warning("%d support-group post(s) not sent at shutdown", self._outbox.qsize())
+
+    def metrics(self):
+        with self._lock:
+            chats = {
+                str(chat_id): {"posts": self.posts[chat_id], "overflowed": self.overflows[chat_id]}
+                for chat_id in set(self.posts) | set(self.overflows)
+            }
+            return {"chats": chats, "queued": self._outbox.qsize(), "dropped": self.dropped}
+
+
+_router = None
+_router_lock = threading.Lock()
+_unlimited = SupportRouter(0, 0)
+
+
+def get_router() -> SupportRouter:
+    global _router
+    if not settings.SUPPORT_CHAT_RATE_PER_MINUTE:
+        return _unlimited
+    with _router_lock:
+        if _router is None:
+            _router = SupportRouter(settings.SUPPORT_CHAT_RATE_PER_MINUTE, settings.SUPPORT_CHAT_MAX_WAIT)
+        return _router
+
+
+def post(send, language, *args, **kwargs):
+    return get_router().post(send, language, *args, **kwargs)
+
+
+def try_post(send, language, *args, **kwargs):
+    return get_router().try_post(send, language, *args, **kwargs)
+
+
+def shutdown():
+    """Stop the sender thread after the post it is on; queued posts are logged and left to the sweeper."""
+    global _router
+    with _router_lock:
+        router, _router = _router, None
+    if router is not None:
+        router.stop()
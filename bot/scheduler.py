@@ -0,0 +1,265 @@
+# bot/scheduler.py
+"""
+Periodic maintenance for runbot, on APScheduler.
+
+Jobs are registered with Maintenance.register(name, func, every, timeout)
+(register_default_jobs() adds the standard ones) and run on
+MAINTENANCE_WORKERS threads of APScheduler's own pool, never on the handler
+threads. Each run:
+
+- is skipped while the previous run of the same job is still going: in this
+  process (APScheduler's max_instances=1), or in another runbot sharing the
+  database, through a lease on the job's ScheduledJob row held for the
+  job's timeout plus LEASE_GRACE;
+- is called as func(deadline), `deadline` being time.monotonic() `timeout`
+  seconds ahead. Batch jobs stop between batches once it has passed and
+  carry on at their next run; a run that ends after its deadline counts as
+  a timeout;
+- is recorded on its ScheduledJob row (start, finish, status, duration,
+  error, counts). The row is also the schedule's persistent store: after a
+  restart a job next runs `every` seconds after its last start, rather than
+  at once or a full interval after boot.
+
+metrics() (runbot's /status "maintenance") has per-job counts, durations
+and how long a run in progress has been going.
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from bot.models import ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+LEASE_GRACE = 60  # seconds a lease outlives its run's timeout (for a process that died mid-run)
+FIRST_RUN_DELAY = 5  # seconds after start before overdue jobs run, one more per job so they don't all start at once
+
+
+class PeriodicJob:
+    def __init__(self, name, func, every, timeout):
+        self.name = name
+        self.func = func
+        self.every = every
+        self.timeout = timeout
+        self.counts = Counter()  # runs, ok, failed, timeout, skipped
+        self.running_since = None  # clock() when the current run started
+        self.last_status = self.last_error = None
+        self.last_duration = self.max_duration = None
+
+
+class Maintenance:
+    def __init__(self, workers=2, owner=None, clock=time.monotonic):
+        self.workers = workers
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.clock = clock
+        self.jobs = {}
+        self.scheduler = None
+        self._lock = threading.Lock()
+
+    def register(self, name, func, every, timeout):
+        """Run func(deadline) every `every` seconds, asking it to stop after `timeout`. every <= 0: not registered."""
+        if every <= 0:
+            return None
+        job = self.jobs[name] = PeriodicJob(name, func, every, timeout)
+        return job
+
+    # ---- scheduling ------------------------------------------------------
+    def first_runs(self, now=None):
+        """{job name: first run time}: `every` after its last recorded start, staggered from FIRST_RUN_DELAY."""
+        now = now or timezone.now()
+        last_started = dict(
+            ScheduledJob.objects.filter(name__in=self.jobs).values_list('name', 'last_started_at')
+        )
+        first = {}
+        for i, job in enumerate(self.jobs.values()):
+            soonest = now + datetime.timedelta(seconds=FIRST_RUN_DELAY + i)
+            started = last_started.get(job.name)
+            first[job.name] = max(soonest, started + datetime.timedelta(seconds=job.every)) if started else soonest
+        return first
+
+    def start(self):
+        """Start APScheduler with the registered jobs. Returns False, starting nothing, when none is registered."""
+        if not self.jobs:
+            return False
+        import pytz
+        from apscheduler.events import EVENT_JOB_MAX_INSTANCES
+        from apscheduler.executors.pool import ThreadPoolExecutor
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        self.scheduler = BackgroundScheduler(
+            executors={'default': ThreadPoolExecutor(self.workers)}, timezone=pytz.utc, daemon=True,
+        )
+        self.scheduler.add_listener(self._overlapped, EVENT_JOB_MAX_INSTANCES)
+        for name, first in self.first_runs().items():
+            job = self.jobs[name]
+            self.scheduler.add_job(
+                self.run, 'interval', args=[name], seconds=job.every, id=name, name=name,
+                next_run_time=first, max_instances=1, coalesce=True, misfire_grace_time=int(job.every),
+            )
+            logger.info("Maintenance job %s every %s s (timeout %s s), first at %s", name, job.every, job.timeout, first)
+        self.scheduler.start()
+        return True
+
+    def shutdown(self):
+        """Stop scheduling and free this process's leases, so a restarted runbot need not wait for them to expire."""
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+        try:
+            ScheduledJob.objects.filter(lease_owner=self.owner).update(lease_owner='', lease_expires_at=None)
+        except Exception:
+            logger.exception("Could not release maintenance job leases")
+
+    def _overlapped(self, event):
+        job = self.jobs.get(event.job_id)
+        if job is not None:
+            with self._lock:
+                job.counts['skipped'] += 1
+            logger.warning("Maintenance job %s still running; this run skipped", event.job_id)
+
+    # ---- running ---------------------------------------------------------
+    def run(self, name):
+        """One run of job `name` (what APScheduler calls). Returns its status, or None if it is running elsewhere."""
+        job = self.jobs[name]
+        close_old_connections()
+        try:
+            if not self._take_lease(job):
+                with self._lock:
+                    job.counts['skipped'] += 1
+                logger.info("Maintenance job %s is running in another process; skipped", name)
+                return None
+            status, error, duration = self._execute(job)
+            self._record(job, status, error, duration)
+            return status
+        finally:
+            connection.close()  # this pool thread's connection; the next run opens its own
+
+    def _take_lease(self, job):
+        now = timezone.now()
+        lease = {
+            'lease_owner': self.owner,
+            'lease_expires_at': now + datetime.timedelta(seconds=job.timeout + LEASE_GRACE),
+            'last_started_at': now,
+        }
+        free = Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+        if ScheduledJob.objects.filter(free, name=job.name).update(**lease):
+            return True
+        try:
+            _, created = ScheduledJob.objects.get_or_create(name=job.name, defaults=lease)
+        except IntegrityError:  # created by another process just now
+            return False
+        return created
+
+    def _execute(self, job):
+        started = self.clock()
+        deadline = started + job.timeout
+        with self._lock:
+            job.running_since = started
+        try:
+            job.func(deadline)
+            status, error = ('timeout' if self.clock() > deadline else 'ok'), None
+        except Exception as e:
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+            logger.exception("Maintenance job %s failed", job.name)
+        duration = self.clock() - started
+        with self._lock:
+            job.running_since = None
+            job.counts['runs'] += 1
+            job.counts[status] += 1
+            job.last_status, job.last_duration = status, duration
+            job.max_duration = max(job.max_duration or 0.0, duration)
+            if error:
+                job.last_error = error
+        if status == 'timeout':
+            logger.warning("Maintenance job %s ran %.1f s, over its %s s timeout", job.name, duration, job.timeout)
+        else:
+            logger.info("Maintenance job %s %s in %.0f ms", job.name, status, duration * 1000)
+        return status, error, duration
+
+    def _record(self, job, status, error, duration):
+        try:
+            ScheduledJob.objects.filter(name=job.name, lease_owner=self.owner).update(
+                last_finished_at=timezone.now(),
+                last_status=status,
+                last_duration_ms=round(duration * 1000),
+                last_error=error or '',
+                runs=F('runs') + 1,
+                failures=F('failures') + int(status == 'failed'),
+                timeouts=F('timeouts') + int(status == 'timeout'),
+                lease_owner='',
+                lease_expires_at=None,
+            )
+        except Exception:
+            logger.exception("Could not record the run of maintenance job %s", job.name)
+
+    def metrics(self):
+        now = self.clock()
+        with self._lock:
+            return {
+                job.name: {
+                    "every": job.every,
+                    "timeout": job.timeout,
+                    "runs": job.counts['runs'],
+                    "failed": job.counts['failed'],
+                    "timeouts": job.counts['timeout'],
+                    "skipped": job.counts['skipped'],
+                    "last_status": job.last_status,
+                    "last_duration_ms": round(job.last_duration * 1000) if job.last_duration is not None else None,
+                    "max_duration_ms": round(job.max_duration * 1000) if job.max_duration is not None else None,
+                    "running_for": round(now - job.running_since, 1) if job.running_since is not None else None,
+                    "last_error": job.last_error,
+                }
+                for job in self.jobs.values()
+            }
+
+
+def register_default_jobs(maintenance, bot):
+    """The standard maintenance jobs; each is off while its interval setting is 0."""
+    from agents.views import expire_pending_agents
+    from customers.bot_handlers import expire_pending_media
+    from tickets import archive, assignment, projections, sweeper
+    from tickets.bot_handlers import escalate_unclaimed
+
+    maintenance.register(
+        'update_projections', projections.run_scheduled,
+        every=settings.PROJECTION_INTERVAL_SECONDS, timeout=max(settings.PROJECTION_INTERVAL_SECONDS, 30),
+    )
+    maintenance.register(
+        'archive_messages', archive.run_scheduled, every=settings.ARCHIVE_INTERVAL_HOURS * 3600, timeout=900,
+    )
+    maintenance.register(
+        'compact_archive', lambda deadline: archive.vacuum(),
+        every=settings.ARCHIVE_COMPACT_HOURS * 3600, timeout=1800,
+    )
+    if settings.PENDING_MEDIA_EXPIRY_SECONDS > 0:
+        maintenance.register(
+            'expire_pending_media',
+            lambda deadline: expire_pending_media(bot, settings.PENDING_MEDIA_EXPIRY_SECONDS),
+            every=60, timeout=30,
+        )
+    if settings.PENDING_AGENT_EXPIRY_DAYS > 0:
+        maintenance.register(
+            'expire_pending_agents', lambda deadline: expire_pending_agents(settings.PENDING_AGENT_EXPIRY_DAYS),
+            every=6 * 3600, timeout=60,
+        )
+    maintenance.register(
+        'sweep_stale_tickets', lambda deadline: sweeper.sweep(bot, deadline),
+        every=settings.STALE_SWEEP_MINUTES * 60, timeout=120,
+    )
+    maintenance.register(
+        'assign_tickets', lambda deadline: assignment.get_engine().run(bot, deadline),
+        every=settings.ASSIGNMENT_INTERVAL_SECONDS, timeout=max(settings.ASSIGNMENT_INTERVAL_SECONDS, 30),
+    )
+    maintenance.register(
+        'escalate_unclaimed', lambda deadline: escalate_unclaimed(bot, settings.UNCLAIMED_ESCALATION_MINUTES),
+        every=settings.UNCLAIMED_ESCALATION_MINUTES * 60, timeout=60,
+    )
+    return maintenance
@@ -0,0 +1,107 @@
+# bot/startup.py
+"""
+Startup timeline and warm-up for `runbot`.
+
+runbot imports its heavy modules (telebot, the handler modules, APScheduler)
+inside handle() through StartupTimeline.import_module(), so `manage.py help`
+and other commands never pay for them, and `runbot --startup-report` can show
+where a restart spends its time: one line per phase and per lazily imported
+module (`python -X importtime manage.py runbot` gives the full tree), then
+time to the first getUpdates and to the first update received.
+
+warm_up() runs in a background thread while the first getUpdates long-poll
+is in flight. It pays the first-use costs the first update would otherwise
+pay: the database backend and its connection, Django's model relation caches
+and the write-queue thread.
+"""
+import importlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def process_age():
+    """Seconds since this process was started (Linux /proc), or None where unavailable."""
+    try:
+        with open('/proc/self/stat') as f:
+            # field 22, after the parenthesised command name: start time in clock ticks since boot
+            started = int(f.read().rpartition(')')[2].split()[19]) / os.sysconf('SC_CLK_TCK')
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0]) - started
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimeline:
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._before = process_age()  # interpreter start, Django setup and command loading
+        self.phases = []  # (name, seconds)
+        self.marks = []  # (name, seconds since the timeline started)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def import_module(self, name):
+        """Import `name`, recording its cumulative import time unless it was already loaded."""
+        with self.phase(f"import {name}"):
+            return importlib.import_module(name)
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self._started))
+
+    def report(self):
+        lines = ["Startup timeline:"]
+        if self._before is not None:
+            lines.append(f"  {self._before * 1000:8.1f} ms  process start to runbot")
+        lines += [f"  {seconds * 1000:8.1f} ms  {name}" for name, seconds in self.phases]
+        offset = self._before or 0.0
+        lines += [f"  {(offset + seconds) * 1000:8.1f} ms  → {name}" for name, seconds in self.marks]
+        return "\n".join(lines)
+
+
+def watch_first_update(bot, timeline, on_first=None):
+    """Mark the first non-empty batch of updates the bot processes, then get out of the way."""
+    process_new_updates = bot.process_new_updates
+
+    def first_updates(updates):
+        if updates:
+            bot.process_new_updates = process_new_updates
+            timeline.mark("first update received")
+            if on_first:
+                on_first()
+        return process_new_updates(updates)
+
+    bot.process_new_updates = first_updates
+
+
+def warm_up():
+    """Pay first-use costs off the critical path. Safe to run concurrently with polling."""
+    from django.apps import apps
+    from django.conf import settings
+    from django.db import connection
+
+    from bot import writer
+
+    started = time.perf_counter()
+    try:
+        for model in apps.get_models():
+            model._meta.related_objects  # relation tree, built on first delete/select_related
+        connection.ensure_connection()  # imports the backend modules and runs its init_command
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        if settings.WRITE_QUEUE:
+            writer.get_writer()  # starts the writer thread
+    except Exception:
+        logger.exception("Warm-up failed (the first update will pay the cost instead)")
+    finally:
+        connection.close()  # this thread's connection; handler threads open their own
+    logger.info("Warm-up done in %.1f ms", (time.perf_counter() - started) * 1000)
@@ -1,3 +1,704 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+import telebot
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from bot.fake_telegram import FakeTelegramServer, FakeTelegramState
+from bot.health import HealthServer, PollerHealth, Watchdog
+from bot.ingress import Ingress
+from bot.jobs import JobRunner
+from bot.loadgen import SUPPORT_CHAT_ID, LoadGenerator, percentile
+from bot.log import AsyncLogHandler, SamplingFilter
+from bot.management.commands.runbot import build_bot
+from bot import writer
+from bot.middleware import CallbackGuardMiddleware, DatabaseConnectionMiddleware, IngressDrainMiddleware
+from bot.ratelimit import TokenBucket
+from bot.models import ScheduledJob
+from bot.routing import SupportRouter, chat_for, support_chats
+from bot.retry import CONFLICT, NETWORK, SERVER, THROTTLED, PollRetryPolicy
+from bot.scheduler import Maintenance
+from bot.startup import StartupTimeline, watch_first_update
+from agents.models import Agent
+from customers.models import Customer, CustomerMessage
+
+
+class AsyncLogHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / 'bot.log'
+        self.logger = logging.getLogger('bot.tests.async')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def attach(self, handler):
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+
+    def records(self):
+        return [json.loads(line) for line in self.path.read_text().splitlines()]
+
+    def test_writes_json_and_redacts_bodies(self):
+        handler = AsyncLogHandler(filename=str(self.path))
+        self.attach(handler)
+        self.logger.info("Ticket %s claimed", 42, extra={'body': 'card number 1234'})
+        handler.close()
+        [record] = self.records()
+        self.assertEqual(record['msg'], "Ticket 42 claimed")
+        self.assertEqual(record['body'], "<redacted 16 chars>")
+
+    def test_drops_when_queue_full(self):
+        handler = AsyncLogHandler(filename=str(self.path), queue_size=1)
+        handler.listener.stop()  # nothing drains the queue
+        self.attach(handler)
+        for i in range(5):
+            self.logger.info("record %s", i)
+        self.assertEqual(handler.dropped, 4)
+        handler.listener = None
+        handler.close()
+
+    def test_sampling_keeps_warnings(self):
+        sampler = SamplingFilter({'bot.tests': 0.0})
+        info = logging.LogRecord('bot.tests.async', logging.INFO, '', 0, 'x', (), None)
+        warning = logging.LogRecord('bot.tests.async', logging.WARNING, '', 0, 'x', (), None)
+        other = logging.LogRecord('tickets', logging.INFO, '', 0, 'x', (), None)
+        self.assertFalse(sampler.filter(info))
+        self.assertTrue(sampler.filter(warning))
+        self.assertTrue(sampler.filter(other))
+
+
+class DatabaseConnectionMiddlewareTests(SimpleTestCase):
+    def test_recycles_connection_around_each_update(self):
+        bot = telebot.TeleBot("123456:TEST", threaded=False, use_class_middlewares=True)
+        bot.setup_middleware(DatabaseConnectionMiddleware())
+        seen = []
+
+        @bot.message_handler(func=lambda m: True)
+        def handler(message):
+            seen.append(message.text)
+
+        update = types.Update.de_json({"update_id": 1, "message": {
+            "message_id": 1, "date": 0, "text": "hi",
+            "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "A"},
+        }})
+        with mock.patch('bot.middleware.close_old_connections') as close_old:
+            bot.process_new_updates([update])
+        self.assertEqual(seen, ["hi"])
+        self.assertEqual(close_old.call_count, 2)
+
+
+class CallbackGuardMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.bot = telebot.TeleBot("123456:TEST", threaded=False, use_class_middlewares=True)
+        self.guard = CallbackGuardMiddleware(self.bot, ttl=10, clock=lambda: self.now)
+        self.bot.setup_middleware(self.guard)
+        answer = mock.patch.object(self.bot, 'answer_callback_query')
+        self.answer = answer.start()
+        self.addCleanup(answer.stop)
+        self.handled = []
+        self.next_id = 0
+
+    def tap(self, data, message_id=1):
+        self.next_id += 1
+        self.bot.process_new_updates([types.Update.de_json({"update_id": self.next_id, "callback_query": {
+            "id": str(self.next_id), "data": data, "chat_instance": "1",
+            "from": {"id": 1, "is_bot": False, "first_name": "A"},
+            "message": {"message_id": message_id, "date": 0, "text": "t", "chat": {"id": -100, "type": "supergroup"}},
+        }})])
+
+    def test_repeated_taps_are_answered_without_running_the_handler(self):
+        self.bot.callback_query_handler(func=lambda call: True)(lambda call: self.handled.append(call.data))
+        self.tap("claim_5")
+        self.tap("claim_5")
+        self.tap("claim_5", message_id=2)  # the same button on another message
+        self.assertEqual(self.handled, ["claim_5", "claim_5"])
+        self.answer.assert_called_once_with("2", "⏳ Already on it…")
+        self.now += 11
+        self.tap("claim_5")
+        self.assertEqual(len(self.handled), 3)
+
+    def test_ticket_lock_and_failed_handlers_allow_a_retry(self):
+        def handler(call):
+            self.handled.append(call.data)
+            if self.handled == ["claim_5"]:
+                self.tap("close_finally_5")  # arrives while the claim is still running
+                self.tap("close_finally_6")
+                raise RuntimeError("API down")
+
+        self.bot.callback_query_handler(func=lambda call: True)(handler)
+        self.tap("claim_5")
+        self.assertEqual(self.handled, ["claim_5", "close_finally_6"])
+        self.answer.assert_called_once_with("2", "⏳ Ticket #5 is being updated. Try again in a moment.")
+        self.tap("claim_5")  # the first attempt failed: not a duplicate
+        self.tap("close_finally_5")
+        self.assertEqual(self.handled[-2:], ["claim_5", "close_finally_5"])
+        self.assertEqual(self.guard.metrics(), {"duplicates": 0, "ticket_busy": 1})
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.bucket = TokenBucket(10, capacity=3, clock=lambda: self.now, sleep=self.sleep)
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def test_bursts_up_to_capacity_then_spaces_at_rate(self):
+        waits = [self.bucket.acquire() for _ in range(5)]
+        self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(waits[3], 0.1)
+        self.assertAlmostEqual(waits[4], 0.1)
+
+    def test_pause_holds_every_caller_then_resumes_without_burst(self):
+        self.bucket.pause(2)
+        self.assertAlmostEqual(self.bucket.acquire(), 2.0)
+        self.assertAlmostEqual(self.bucket.acquire(), 0.1)
+
+    def test_try_acquire_takes_nothing_when_the_wait_is_too_long(self):
+        for _ in range(3):
+            self.bucket.acquire()
+        self.assertIsNone(self.bucket.try_acquire(max_wait=0.05))
+        self.assertAlmostEqual(self.bucket.try_acquire(max_wait=0.15), 0.1)
+        self.assertAlmostEqual(self.bucket.acquire(), 0.1)
+
+
+@override_settings(SUPPORT_CHAT=-100, SUPPORT_ROUTES={'fr': -200, 'pt-br': -300})
+class SupportRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.router = SupportRouter(
+            per_minute=2, max_wait=1, clock=lambda: self.now, sleep=self.sleep, background=False,
+        )
+        self.sent = []
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def send(self, chat_id, text):
+        self.sent.append(chat_id)
+        return chat_id
+
+    def test_chat_for_falls_back_from_region_to_language_to_support_chat(self):
+        self.assertEqual(chat_for('fr-CA'), -200)
+        self.assertEqual(chat_for('pt-BR'), -300)
+        self.assertEqual(chat_for('pt'), -100)
+        self.assertEqual(chat_for(None), -100)
+        self.assertEqual(support_chats('fr'), [-200, -100])
+        self.assertEqual(support_chats('en'), [-100])
+
+    def test_post_queues_instead_of_waiting_for_budget(self):
+        posted = [self.router.post(self.send, 'fr', "ticket") for _ in range(10)]
+        self.assertEqual(posted, [-200, -200] + [None] * 8)
+        self.assertEqual(self.now, 0.0)  # nobody waited
+        self.assertEqual(self.router.metrics()["queued"], 8)
+
+    def test_queued_posts_overflow_to_support_chat(self):
+        for _ in range(3):
+            self.router.post(self.send, 'fr', "ticket")
+        self.router.flush()
+        self.assertEqual(self.sent, [-200, -200, -100])
+        self.assertEqual(self.router.metrics(), {
+            "chats": {"-200": {"posts": 2, "overflowed": 1}, "-100": {"posts": 1, "overflowed": 0}},
+            "queued": 0, "dropped": 0,
+        })
+
+    def test_full_outbox_drops_the_post(self):
+        router = SupportRouter(per_minute=1, max_wait=0, clock=lambda: self.now, outbox_max=1, background=False)
+        self.assertEqual([router.post(self.send, 'fr', "ticket") for _ in range(3)], [-200, None, None])
+        self.assertEqual(router.metrics()["dropped"], 1)
+
+    def test_try_post_only_sends_with_budget(self):
+        self.assertEqual([self.router.try_post(self.send, 'fr', "ticket") for _ in range(5)],
+                         [True, True, True, True, False])
+        self.assertEqual(self.sent, [-200, -200, -100, -100])
+        self.assertEqual(self.now, 0.0)
+
+    def test_rate_limited_group_is_paused_and_the_post_overflows(self):
+        def send(chat_id, text):
+            if chat_id == -200:
+                raise telegram_error(429, "Too Many Requests", method='sendMessage', retry_after=30)
+            return self.send(chat_id, text)
+
+        self.assertIsNone(self.router.post(send, 'fr', "ticket"))
+        self.assertTrue(self.router.try_post(self.send, 'fr', "ticket"))  # -200 is paused for 30 s
+        self.router.flush()
+        self.assertEqual(self.sent, [-100, -100])
+        self.now += 31
+        self.assertEqual(self.router.post(self.send, 'fr', "ticket"), -200)
+
+
+    def test_rate_limited_group_without_a_rate_limit_queues_the_post(self):
+        router = SupportRouter(per_minute=0, max_wait=0, clock=lambda: self.now, sleep=self.sleep, background=False)
+        attempts = []
+
+        def send(chat_id, text):
+            attempts.append(chat_id)
+            if len(attempts) == 1:
+                raise telegram_error(429, "Too Many Requests", method='sendMessage', retry_after=30)
+            return self.send(chat_id, text)
+
+        self.assertIsNone(router.post(send, 'en', "ticket"))
+        self.assertFalse(router.try_post(send, 'en', "ticket"))  # -100 is held for 30 s
+        router.flush()
+        self.assertEqual(self.sent, [-100])
+        self.assertEqual(self.now, 30.0)  # the sender waited out the retry_after
+
+
+class WriteQueueTests(TransactionTestCase):
+    def test_batches_inserts_from_many_threads(self):
+        customer = Customer.objects.create(telegram_id=5001)
+        queue = writer.WriteQueue(max_delay=0.05).start()
+        self.addCleanup(queue.stop)
+        futures = [queue.submit(CustomerMessage(customer=customer, message_text=f"m{i}")) for i in range(10)]
+        saved = [future.result(timeout=5) for future in futures]
+        self.assertTrue(all(message.pk for message in saved))
+        self.assertEqual(CustomerMessage.objects.filter(customer=customer).count(), 10)
+        self.assertLess(queue.batches, 10)
+
+    def test_failed_row_does_not_fail_the_batch(self):
+        customer = Customer.objects.create(telegram_id=5002)
+        queue = writer.WriteQueue(max_delay=0.05).start()
+        self.addCleanup(queue.stop)
+        good = queue.submit(CustomerMessage(customer=customer, message_text="ok"))
+        bad = queue.submit(Customer(telegram_id=5002))  # duplicate telegram_id
+        self.assertIsNotNone(good.result(timeout=5).pk)
+        with self.assertRaises(Exception):
+            bad.result(timeout=5)
+
+
+class MaintenanceTests(TransactionTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.maintenance = Maintenance(owner="test:1", clock=lambda: self.now)
+
+    def test_runs_are_recorded(self):
+        def slow(deadline):
+            self.now += 120
+        self.maintenance.register("ok", lambda deadline: None, every=60, timeout=30)
+        self.maintenance.register("failing", lambda deadline: 1 / 0, every=60, timeout=30)
+        self.maintenance.register("slow", slow, every=60, timeout=30)
+        self.maintenance.register("off", lambda deadline: None, every=0, timeout=30)
+        self.assertEqual(
+            [self.maintenance.run(name) for name in ("ok", "failing", "slow")], ['ok', 'failed', 'timeout']
+        )
+        self.assertNotIn("off", self.maintenance.jobs)
+        failing = ScheduledJob.objects.get(name="failing")
+        self.assertEqual((failing.runs, failing.failures, failing.lease_owner), (1, 1, ''))
+        self.assertTrue(failing.last_error.startswith("ZeroDivisionError"))
+        self.assertEqual(ScheduledJob.objects.get(name="slow").timeouts, 1)
+        metrics = self.maintenance.metrics()
+        self.assertEqual(metrics["slow"]["last_duration_ms"], 120000)
+        self.assertEqual(metrics["failing"]["failed"], 1)
+
+    def test_job_leased_by_another_process_is_skipped(self):
+        ran = []
+        self.maintenance.register("sweep", ran.append, every=60, timeout=30)
+        lease = {'lease_owner': "other:2", 'lease_expires_at': timezone.now() + datetime.timedelta(seconds=60)}
+        ScheduledJob.objects.create(name="sweep", **lease)
+        self.assertIsNone(self.maintenance.run("sweep"))
+        self.assertEqual((ran, self.maintenance.metrics()["sweep"]["skipped"]), ([], 1))
+        # A lease left by a process that died mid-run expires
+        ScheduledJob.objects.filter(name="sweep").update(lease_expires_at=timezone.now())
+        self.assertEqual(self.maintenance.run("sweep"), 'ok')
+
+    def test_schedule_survives_a_restart(self):
+        self.maintenance.register("hourly", lambda deadline: None, every=3600, timeout=30)
+        self.maintenance.register("new", lambda deadline: None, every=3600, timeout=30)
+        now = timezone.now()
+        ScheduledJob.objects.create(name="hourly", last_started_at=now - datetime.timedelta(minutes=20))
+        first = self.maintenance.first_runs(now)
+        self.assertEqual(first["hourly"], now + datetime.timedelta(minutes=40))
+        self.assertLess(first["new"], now + datetime.timedelta(minutes=1))
+
+
+class WriterCreateTests(TestCase):
+    @override_settings(WRITE_QUEUE=True)
+    def test_saves_directly_inside_a_transaction(self):
+        customer = Customer.objects.create(telegram_id=5003)
+        with mock.patch.object(writer, 'get_writer') as get_writer:
+            message = writer.create(CustomerMessage, customer=customer, message_text="hi")
+        get_writer.assert_not_called()
+        self.assertIsNotNone(message.pk)
+
+
+class DatabasePortabilityCommandTests(TestCase):
+    def test_models_and_migrations_render_for_sqlite(self):
+        out = io.StringIO()
+        call_command('check_db_portability', backend=['sqlite'], stdout=out)
+        self.assertIn("sqlite: 0 problem(s)", out.getvalue())
+
+
+class JobRunnerTests(TestCase):
+    def test_jobs_run_in_background_and_report(self):
+        runner = JobRunner(workers=1)
+        self.addCleanup(runner.shutdown)
+        done = queue.Queue()
+        ok = runner.submit("ok", lambda: None, on_done=done.put)
+        failed = runner.submit("failing", int, "x", on_done=done.put)
+        self.assertIs(done.get(timeout=5), ok)
+        self.assertIs(done.get(timeout=5), failed)
+        runner.shutdown()
+        self.assertEqual((ok.state, failed.state), ('done', 'failed'))
+        self.assertTrue(failed.error.startswith("ValueError"))
+        metrics = runner.metrics()
+        self.assertEqual((metrics['queued'], metrics['running'], metrics['done'], metrics['failed']), (0, 0, 1, 1))
+        self.assertEqual(metrics['last_error'], failed.error)
+
+    def test_failing_report_does_not_lose_the_job(self):
+        runner = JobRunner(workers=0)
+        job = runner.submit("ok", lambda: None, on_done=lambda job: 1 / 0)
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(runner.metrics()['done'], 1)
+
+
+class FakeTelegramTests(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeTelegramServer(('127.0.0.1', 0))
+        self.server.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.state = self.server.state
+
+    def call(self, method, **params):
+        return requests.post(self.server.api_url.format("123:TEST", method), data=params, timeout=5)
+
+    def test_get_updates_confirms_below_offset_and_send_message_is_recorded(self):
+        first = self.state.push_update({"message": {"text": "one"}})
+        self.state.push_update({"message": {"text": "two"}})
+        updates = self.call('getUpdates', offset=0).json()['result']
+        self.assertEqual([u['message']['text'] for u in updates], ["one", "two"])
+        updates = self.call('getUpdates', offset=first + 1, timeout=0).json()['result']
+        self.assertEqual([u['message']['text'] for u in updates], ["two"])
+
+        reply = self.call('sendMessage', chat_id=-100, text="hi").json()
+        self.assertTrue(reply['ok'])
+        self.assertEqual(reply['result']['chat'], {"id": -100, "type": "supergroup"})
+        entry = self.state.wait_for(lambda e: e['method'] == 'sendMessage', timeout=1)
+        self.assertEqual((entry['chat_id'], entry['text']), (-100, "hi"))
+
+    def test_injected_429_carries_retry_after(self):
+        self.state.rate_limit_ratio, self.state.retry_after = 1.0, 7
+        response = self.call('sendMessage', chat_id=1, text="hi")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['parameters'], {"retry_after": 7})
+        self.assertEqual(self.state.rate_limited, 1)
+        self.assertEqual(self.state.sent, [])
+        self.assertTrue(self.call('getUpdates', timeout=0).json()['ok'])  # polling is never rate limited
+
+
+class LoadGeneratorReportTests(SimpleTestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile(range(1, 101), 99), 99)
+        self.assertEqual(percentile([5], 99), 5)
+
+    def test_report(self):
+        state = FakeTelegramState()
+        state.calls, state.rate_limited = 40, 2
+        load = LoadGenerator(state, customers=2, agents=1, admins=1, rounds=2)
+        load.latencies['open'] = [0.1, 0.3]
+        load.errors['claim'] = 1
+        load.latencies['claim'] = [0.2]
+        load.completed, load.updates_sent = 3, 20
+
+        report = load.report(elapsed=2.0)
+
+        self.assertEqual(report['lifecycles_attempted'], 4)
+        self.assertEqual(report['lifecycles_per_s'], 1.5)
+        self.assertEqual(report['updates_per_s'], 10.0)
+        self.assertEqual(report['error_rate'], 0.25)
+        self.assertEqual((report['api_calls'], report['api_429s']), (40, 2))
+        self.assertEqual((report['p50_ms'], report['p99_ms']), (200.0, 300.0))
+        self.assertEqual(report['steps']['open'], {
+            'count': 2, 'errors': 0, 'error_rate': 0.0, 'p50_ms': 100.0, 'p99_ms': 300.0,
+        })
+        self.assertEqual(report['steps']['claim']['error_rate'], 0.5)
+        self.assertEqual(report['steps']['close_finally']['p50_ms'], None)
+
+    def test_open_step_waits_for_the_announcement_with_a_claim_button(self):
+        state = FakeTelegramState()
+        load = LoadGenerator(state, customers=1, agents=1, admins=1, step_timeout=0.2)
+
+        def announce():
+            state.record('sendMessage', {
+                'chat_id': SUPPORT_CHAT_ID, 'text': "order",
+                'reply_markup': json.dumps({"inline_keyboard": [[{"text": "Claim", "callback_data": "claim_9"}]]}),
+            })
+
+        entry = load.step('open', announce, lambda e: e['chat_id'] == SUPPORT_CHAT_ID)
+        self.assertEqual(entry['text'], "order")
+        self.assertEqual(len(load.latencies['open']), 1)
+
+
+class RunbotStartupTests(SimpleTestCase):
+    def test_importing_the_command_loads_no_bot_modules(self):
+        code = (
+            "import sys, django; django.setup(); import bot.management.commands.runbot; "
+            "print(sorted(m for m in ('telebot', 'apscheduler', 'tickets.bot_handlers') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='botcore.settings', LOG_CONSOLE_LEVEL=''),
+        )
+        self.assertEqual(result.stdout.strip(), "[]", result.stderr)
+
+    def test_build_bot_times_imports_and_first_update(self):
+        timeline = StartupTimeline()
+        with override_settings(TELEGRAM_BOT_TOKEN="123456:TEST"):
+            bot = build_bot(timeline, num_threads=2)
+        self.addCleanup(bot.worker_pool.close)
+        self.assertEqual(bot.worker_pool.num_threads, 2)
+        self.assertTrue(bot.message_handlers and bot.callback_query_handlers)
+        self.assertIn("import tickets.bot_handlers", [name for name, _ in timeline.phases])
+        with mock.patch.object(bot, 'process_new_updates') as process:
+            reports = []
+            watch_first_update(bot, timeline, on_first=lambda: reports.append(timeline.report()))
+            bot.process_new_updates([])
+            bot.process_new_updates([mock.Mock()])
+            bot.process_new_updates([mock.Mock()])
+        self.assertEqual(process.call_count, 3)
+        self.assertEqual(len(reports), 1)
+        self.assertIn("→ first update received", reports[0])
+
+
+class PollerHealthTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.health = PollerHealth(stall_after=60, max_backlog=1, clock=lambda: self.now)
+        self.fetch = mock.Mock(return_value=[])
+        self.bot = mock.Mock(get_updates=self.fetch)
+        self.bot.worker_pool.tasks.qsize.return_value = 0
+        self.health.attach(self.bot)
+
+    def test_live_and_ready_follow_polls_crashes_and_backlog(self):
+        self.assertTrue(self.health.live())
+        self.assertFalse(self.health.ready())  # not polled yet
+        self.bot.get_updates(offset=1)
+        self.assertTrue(self.health.ready())
+        self.bot.worker_pool.tasks.qsize.return_value = 2
+        self.assertFalse(self.health.ready())
+        self.bot.worker_pool.tasks.qsize.return_value = 0
+        self.health.crashed(RuntimeError("boom"))
+        self.assertFalse(self.health.ready())
+        self.bot.get_updates(offset=1)
+        self.assertTrue(self.health.ready())
+        self.now += 61
+        self.assertEqual(self.health.snapshot()["status"], "stalled")
+
+    def test_long_retry_wait_is_not_a_stall(self):
+        self.bot.get_updates(offset=1)
+        policy = PollRetryPolicy(on_wait=self.health.waiting, sleep=lambda seconds: None)
+        policy.attach(self.bot)  # around the health wrapper, as in runbot
+        self.fetch.side_effect = telegram_error(429, "Too Many Requests", retry_after=300)
+        self.assertEqual(self.bot.get_updates(offset=1), [])
+        wedged = mock.Mock()
+        watchdog = Watchdog(self.health, self.bot, interval=5, grace=30, on_wedged=wedged)
+        self.now += 299
+        watchdog.check()
+        self.now += 60  # stall_after counts from the end of the wait
+        watchdog.check()
+        self.assertTrue(self.health.live())
+        self.bot.stop_polling.assert_not_called()
+        self.now += 2
+        self.assertFalse(self.health.live())
+
+    def test_watchdog_restarts_polling_then_reports_a_wedged_poller_once(self):
+        wedged = mock.Mock()
+        watchdog = Watchdog(self.health, self.bot, interval=5, grace=30, on_wedged=wedged)
+        self.now += 61
+        watchdog.check()
+        watchdog.check()
+        self.bot.stop_polling.assert_called_once()
+        self.assertEqual(self.health.restarts, 1)
+        self.now += 31
+        watchdog.check()
+        watchdog.check()
+        wedged.assert_called_once()
+
+        self.bot.get_updates()  # a poll gets through: back to normal
+        watchdog.check()
+        self.now += 61
+        watchdog.check()
+        self.assertEqual(self.bot.stop_polling.call_count, 2)
+        self.now += 31
+        self.fetch.side_effect = ConnectionError("down")
+        with self.assertRaises(ConnectionError):
+            self.bot.get_updates()
+        watchdog.check()
+        self.assertFalse(self.health.live())
+        wedged.assert_called_once()  # failing, not wedged: left to runbot's retry loop
+
+    def test_http_endpoints_and_status_file_command(self):
+        server = HealthServer(('127.0.0.1', 0), self.health)
+        server.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = "http://%s:%s" % server.server_address[:2]
+
+        with urllib.request.urlopen(base + "/healthz") as response:
+            self.assertEqual(response.status, 200)
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            urllib.request.urlopen(base + "/readyz")
+        self.assertEqual(ctx.exception.code, 503)
+        self.bot.get_updates()
+        with urllib.request.urlopen(base + "/status") as response:
+            status = json.load(response)
+        self.assertEqual((status["status"], status["polls"]), ("ok", 1))
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "health.json")
+        Watchdog(self.health, self.bot, interval=5, grace=30, path=path).check()
+        call_command('bot_health', file=path, ready=True, stdout=io.StringIO())
+        self.now += 61
+        Watchdog(self.health, self.bot, interval=5, grace=30, path=path).check()
+        with self.assertRaisesMessage(CommandError, "not live"):
+            call_command('bot_health', file=path, stdout=io.StringIO())
+
+
+def telegram_error(code, description, method='getUpdates', **parameters):
+    """The ApiTelegramException pyTelegramBotAPI raises for a failed `method` call (shared with customers.tests)."""
+    result_json = {'ok': False, 'error_code': code, 'description': description}
+    if parameters:
+        result_json['parameters'] = parameters
+    return ApiTelegramException(method, None, result_json)
+
+
+class PollRetryPolicyTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.slept = []
+        self.conflicts = []
+        self.policy = PollRetryPolicy(
+            base=0.5, cap=30, on_conflict=self.conflicts.append, sleep=self.slept.append,
+            jitter=lambda low, high: high, clock=lambda: self.now,
+        )
+
+    def attach(self, *results):
+        bot = mock.Mock(get_updates=mock.Mock(side_effect=results))
+        self.policy.attach(bot)
+        return bot
+
+    def test_delays_by_class(self):
+        self.assertEqual(self.policy.delay(NETWORK, 1), 0.5)
+        self.assertEqual(self.policy.delay(NETWORK, 3), 2.0)
+        self.assertEqual(self.policy.delay(NETWORK, 20), 30)
+        self.assertEqual(self.policy.delay(SERVER, 1), 0.1)
+        self.assertEqual(self.policy.delay(THROTTLED, 1, retry_after=7), 7.0)
+        self.assertEqual(self.policy.delay(CONFLICT, 1), 5.0)
+        jittered = PollRetryPolicy(base=0.5).delay(NETWORK, 1)
+        self.assertTrue(0.25 <= jittered <= 0.5)
+
+    def test_failed_polls_back_off_and_return_no_updates_until_recovered(self):
+        update = mock.Mock()
+        bot = self.attach(
+            requests.exceptions.ConnectionError("reset"), requests.exceptions.ConnectionError("reset"),
+            telegram_error(502, "Bad Gateway"), telegram_error(429, "Too Many Requests", retry_after=3),
+            [update],
+        )
+        results = [bot.get_updates(offset=1) for _ in range(5)]
+        self.assertEqual(results, [[], [], [], [], [update]])
+        self.assertEqual(self.slept, [0.5, 1.0, 0.1, 3.0])
+        metrics = self.policy.metrics()
+        self.assertEqual(metrics["failures"], {NETWORK: 2, SERVER: 1, THROTTLED: 1})
+        self.assertEqual((metrics["streak"], metrics["recoveries"]), (0, 1))
+
+    def test_conflicts_alert_once_per_episode_and_unknown_errors_propagate(self):
+        conflict = telegram_error(409, "Conflict: terminated by other getUpdates request")
+        bot = self.attach(conflict, conflict, [], conflict, ValueError("bug"))
+        for _ in range(4):
+            bot.get_updates()
+        self.assertEqual(len(self.conflicts), 2)
+        with self.assertRaises(ValueError):
+            bot.get_updates()
+        self.assertEqual(self.policy.crashed(ValueError("bug")), 1.0)
+
+        bot = self.attach(telegram_error(409, "Conflict: can't use getUpdates method while webhook is active"))
+        bot.get_updates()
+        bot.delete_webhook.assert_called_once()
+        self.assertEqual(len(self.conflicts), 2)
+
+
+class IngressTests(TestCase):
+    def setUp(self):
+        self.bot = mock.Mock(last_update_id=0)
+        self.bot.worker_pool.tasks = queue.Queue()
+        self.bot.process_new_updates.side_effect = lambda updates: [
+            self.bot.worker_pool.tasks.put(update) for update in updates
+        ]
+        self.ingress = Ingress(
+            capacity=4, deferred_max=1, notice_seconds=300, busy_text="busy", shed_text="try later",
+            sleep=lambda seconds: self.bot.worker_pool.tasks.get(),  # a handler thread takes one
+        ).attach(self.bot)
+        self.next_id = 0
+
+    def update(self, user_id, text=None, callback=None):
+        self.next_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": "U"}
+        if callback:
+            return types.Update.de_json({"update_id": self.next_id, "callback_query": {
+                "id": str(self.next_id), "from": user, "data": callback, "chat_instance": "1",
+            }})
+        return types.Update.de_json({"update_id": self.next_id, "message": {
+            "message_id": self.next_id, "date": 0, "text": text, "chat": {"id": user_id, "type": "private"}, "from": user,
+        }})
+
+    def queued(self):
+        return [update.update_id for update in self.bot.worker_pool.tasks.queue]
+
+    def test_full_queue_pauses_polling_and_tells_each_customer_once(self):
+        Agent.objects.create(telegram_id=7, full_name="Agent")
+        self.bot.process_new_updates([self.update(1, "a") for _ in range(4)])
+        self.bot.process_new_updates([self.update(1, "b"), self.update(1, "c"), self.update(7, "reply")])
+        self.assertEqual(self.queued(), [4, 5, 6, 7])  # three handled while polling waited
+        self.ingress._notices.join()
+        self.bot.send_message.assert_called_once_with(1, "busy")
+        metrics = self.ingress.metrics()
+        self.assertEqual((metrics["queued"], metrics["busy_notices"], metrics["paused"]), (7, 1, False))
+
+    def test_low_priority_work_is_deferred_then_shed(self):
+        self.bot.process_new_updates([self.update(1, "a"), self.update(2, "b")])  # half full
+        self.bot.process_new_updates([
+            self.update(3, "/search refund"), self.update(4, "/stats"), self.update(5, callback="preview_9"),
+        ])
+        self.assertEqual(self.queued(), [1, 2])
+        self.assertEqual(self.bot.last_update_id, 5)  # Telegram won't resend them
+        self.ingress._notices.join()
+        self.bot.send_message.assert_called_once_with(4, "try later")
+        self.bot.answer_callback_query.assert_called_once_with("5", "try later", show_alert=True)
+
+        self.bot.worker_pool.tasks.get()
+        self.bot.process_new_updates([])
+        self.assertEqual(self.queued(), [2, 3])
+        self.assertEqual(self.ingress.metrics()["shed"], 2)
+
+    def test_deferred_work_is_queued_when_a_handler_finishes(self):
+        self.bot.process_new_updates([self.update(1, "a"), self.update(2, "b"), self.update(3, "/search refund")])
+        self.assertEqual(self.queued(), [1, 2])
+        drain = IngressDrainMiddleware(self.ingress)
+
+        handled = self.bot.worker_pool.tasks.get()
+        drain.post_process(handled, {}, None)  # no getUpdates in between
+
+        self.assertEqual(self.queued(), [2, 3])
@@ -0,0 +1,147 @@
+# bot/writer.py
+"""
+Single-writer queue for high-volume inserts (CustomerMessage, AgentMessage).
+
+SQLite allows one writer at a time, so 20 handler threads each committing
+their own one-row INSERT mostly wait on the database lock. With
+WRITE_QUEUE=True, create() hands the unsaved instance to one writer thread
+that collects whatever arrived within WRITE_QUEUE_MAX_DELAY (up to
+WRITE_QUEUE_MAX_BATCH rows) and inserts it in one transaction. The caller
+blocks until that transaction commits, so it still gets a saved row with a pk.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, max_batch=200, max_delay=0.001):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="WriteQueue", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Flush everything queued so far, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, obj) -> Future:
+        """Queue an unsaved model instance; the Future resolves to the saved instance."""
+        future = Future()
+        self._queue.put((obj, future))
+        if self._thread is None:
+            self.start()
+        return future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch = self._collect(item)
+                close_old_connections()
+                self._write(batch)
+        finally:
+            connection.close()
+
+    def _write(self, batch):
+        by_model = defaultdict(list)
+        for obj, future in batch:
+            by_model[type(obj)].append((obj, future))
+        try:
+            with transaction.atomic():
+                for model, items in by_model.items():
+                    model.objects.bulk_create([obj for obj, _ in items])
+        except Exception:
+            logger.exception("Batched insert of %d rows failed, retrying one by one", len(batch))
+            self._write_each(batch)
+            return
+        self.batches += 1
+        self.rows += len(batch)
+        for obj, future in batch:
+            future.set_result(obj)
+
+    def _write_each(self, batch):
+        for obj, future in batch:
+            try:
+                obj.save(force_insert=True)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(obj)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> WriteQueue:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteQueue(
+                max_batch=settings.WRITE_QUEUE_MAX_BATCH,
+                max_delay=settings.WRITE_QUEUE_MAX_DELAY,
+            ).start()
+        return _writer
+
+
+def shutdown():
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def create(model, **fields):
+    """
+    Drop-in for model.objects.create() on insert-only hot paths. Falls back to a
+    direct save when the queue is disabled or the caller is inside a transaction
+    (the queued insert would otherwise escape it).
+    """
+    obj = model(**fields)
+    if not settings.WRITE_QUEUE or connection.in_atomic_block:
+        obj.save(force_insert=True)
+        return obj
+    return get_writer().submit(obj).result(timeout=settings.WRITE_QUEUE_TIMEOUT)
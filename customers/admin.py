@@ -1,14 +1,49 @@
-from django.contrib import admin
-from .models import Customer, CustomerMessage
+from django.contrib import admin, messages
+
+from admin_app.changelist import HighVolumeAdmin, MessageTypeFilter, ReadOnlyAdmin
+from tickets.search import FullTextSearchMixin
+from .models import ArchivedCustomerMessage, Broadcast, Customer, CustomerMessage
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
-    list_display = ('telegram_id', 'full_name', 'language_code', 'open_ticket', 'banned', 'created_at')
-    search_fields = ('telegram_id', 'full_name')
-    list_filter = ('open_ticket', 'banned', 'language_code')
+class CustomerAdmin(HighVolumeAdmin):
+    list_display = ('telegram_id', 'full_name', 'language_code', 'open_ticket', 'banned', 'blocked', 'created_at')
+    search_fields = ('=telegram_id', 'full_name')
+    list_filter = ('open_ticket', 'banned', 'blocked')
+    actions = ('ban_customers', 'unban_customers')
+
+    @admin.action(description="Ban selected customers")
+    def ban_customers(self, request, queryset):
+        updated = queryset.update(banned=True)
+        self.message_user(request, f"{updated} customer(s) banned.", messages.SUCCESS)
+
+    @admin.action(description="Unban selected customers")
+    def unban_customers(self, request, queryset):
+        updated = queryset.update(banned=False)
+        self.message_user(request, f"{updated} customer(s) unbanned.", messages.SUCCESS)
 
 @admin.register(CustomerMessage)
-class CustomerMessageAdmin(admin.ModelAdmin):
-    list_display = ('customer', 'message_type', 'sent_at', 'message_text')
+class CustomerMessageAdmin(FullTextSearchMixin, HighVolumeAdmin):
+    list_display = ('id', 'customer', 'ticket', 'message_type', 'sent_at', 'message_text')
+    list_select_related = ('customer', 'ticket')
+    search_fields = ('message_text',)  # served by the full-text index, see tickets/search.py
+    search_source = 'customer'
+    list_filter = (MessageTypeFilter, 'is_forwarded', 'sent_at')
+    date_hierarchy = 'sent_at'
+    autocomplete_fields = ('customer',)
+    raw_id_fields = ('ticket',)
+
+@admin.register(ArchivedCustomerMessage)
+class ArchivedCustomerMessageAdmin(FullTextSearchMixin, ReadOnlyAdmin):
+    list_display = ('id', 'customer', 'ticket', 'message_type', 'sent_at', 'message_text', 'archived_at')
+    list_select_related = ('customer', 'ticket')
     search_fields = ('message_text',)
-    list_filter = ('message_type', 'sent_at')
+    search_source = 'customer_archive'
+    list_filter = (MessageTypeFilter,)
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'sent', 'blocked', 'failed', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = (
+        'status', 'last_customer_id', 'sent', 'blocked', 'failed', 'created_by', 'heartbeat_at', 'finished_at',
+    )
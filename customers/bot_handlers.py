@@ -2,14 +2,15 @@ from django.conf import settings
 from telebot.types import (
     Message, InlineKeyboardMarkup, InlineKeyboardButton,
 )
-from utils import sanitize_text, get_active_ticket_for_customer
-from tickets.models import Ticket
+from utils import sanitize_text, get_active_ticket_for_customer, get_or_create_active_ticket
 from customers.models import Customer, CustomerMessage
-from tickets.models import Ticket
 from agents.models import Agent
+from bot import routing, writer
+from tickets import banners
 import re
 import os
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -58,9 +59,37 @@ def is_allowed_document(document) -> bool:
     mime_ok = has_allowed_mime(getattr(document, 'mime_type', '') or '')
     return name_ok or mime_ok
 
+def unblock(customer):
+    """A customer marked blocked by a broadcast (403) who writes again has unblocked the bot."""
+    if customer.blocked:
+        Customer.objects.filter(pk=customer.pk).update(blocked=False)
+        customer.blocked = False
+
 # In-memory state store for media caption handling
 _pending_media = {}
 
+
+def expire_pending_media(bot, max_age):
+    """
+    Drop media that has waited more than `max_age` seconds for its caption
+    (run by the maintenance scheduler): the placeholder message is deleted and
+    the customer asked to send the file again. Returns how many expired.
+    """
+    cutoff = time.monotonic() - max_age
+    expired = [user_id for user_id, media in list(_pending_media.items()) if media['added_at'] < cutoff]
+    for user_id in expired:
+        media = _pending_media.pop(user_id, None)
+        if media is None:  # captioned meanwhile
+            continue
+        CustomerMessage.objects.filter(id=media['customer_message'].id).delete()
+        try:
+            bot.send_message(user_id, "⌛ No caption arrived for your file, so it was not sent. Please send it again.")
+        except Exception as e:
+            logger.warning("Could not tell customer %s their pending media expired: %s", user_id, e)
+    if expired:
+        logger.info("Expired %d media message(s) still waiting for a caption", len(expired))
+    return len(expired)
+
 # -------------------------------
 # Handlers
 # -------------------------------
@@ -70,6 +99,7 @@ def register_customer_handlers(bot):
         customer, _ = Customer.objects.get_or_create(telegram_id=message.from_user.id)
         customer.full_name = message.from_user.full_name
         customer.language_code = message.from_user.language_code
+        customer.blocked = False  # they are talking to the bot again
         customer.save()
         markup = InlineKeyboardMarkup()
         markup.add(InlineKeyboardButton("📋 FAQ", callback_data="show_faq"))
@@ -92,6 +122,7 @@ def register_customer_handlers(bot):
             caption = text or "[No caption provided]"
             content_type = media_data['content_type']
             customer = media_data['customer']
+            language = customer.language_code or message.from_user.language_code  # picks the support group
             customer_message = media_data['customer_message']
             ticket = media_data.get('ticket')  # may be None if this media started a new conversation
 
@@ -99,12 +130,12 @@ def register_customer_handlers(bot):
             try:
                 customer_message.message_text = caption
                 customer_message.save()
-                logger.info(f"Updated media caption for customer {user_id}, msg_id: {customer_message.id}")
+                logger.info("Updated media caption for customer %s, msg_id: %s", user_id, customer_message.id)
             except Exception as e:
-                logger.error(f"Caption save failed for customer {user_id}: {e}")
+                logger.error("Caption save failed for customer %s: %s", user_id, e)
                 bot.send_message(message.chat.id, "⚠️ Failed to process your caption. Please try again.")
                 customer_message.delete()
-                del _pending_media[user_id]
+                _pending_media.pop(user_id, None)
                 return
 
             # If there's an active, claimed ticket with an agent → forward directly to agent
@@ -118,33 +149,35 @@ def register_customer_handlers(bot):
                         bot.send_document(ticket.agent.telegram_id, media_data['file_id'], caption=final_caption)
                     customer_message.is_forwarded = True
                     customer_message.save()
-                    logger.info(f"Forwarded media to agent {ticket.agent.telegram_id} (ticket {ticket.id})")
+                    logger.info("Forwarded media to agent %s (ticket %s)", ticket.agent.telegram_id, ticket.id)
                 except Exception as e:
-                    logger.error(f"Media forward to agent failed (cust {user_id}, ticket {ticket.id if ticket else 'None'}): {e}")
+                    logger.error("Media forward to agent failed (cust %s, ticket %s): %s", user_id, ticket.id if ticket else 'None', e)
                     bot.send_message(message.chat.id, "⚠️ Failed to forward your message. Please try again.")
                     customer_message.delete()
-                    del _pending_media[user_id]
+                    _pending_media.pop(user_id, None)
                     return
 
                 bot.send_message(message.chat.id, "✅ Your file and caption have been sent to our support team.", parse_mode="Markdown")
-                del _pending_media[user_id]
+                _pending_media.pop(user_id, None)
                 return
 
             # Per-ticket queue logic for UNCLAIMED flow
             # If no active ticket (approved/closed previously), create a fresh ticket
+            created = False
             if not ticket:
                 try:
-                    ticket = Ticket.objects.create(customer=customer)
-                    # Attach this media message to the new ticket
+                    ticket, created = get_or_create_active_ticket(customer)
+                    # Attach this media message to the ticket
                     CustomerMessage.objects.filter(id=customer_message.id).update(ticket=ticket)
-                    logger.info(f"Created new ticket {ticket.id} for customer {user_id} (media caption)")
                 except Exception as e:
-                    logger.error(f"Ticket create failed for customer {user_id} (media): {e}")
+                    logger.error("Ticket create failed for customer %s (media): %s", user_id, e)
                     bot.send_message(message.chat.id, "⚠️ Failed to create a ticket. Please try again.")
                     customer_message.delete()
-                    del _pending_media[user_id]
+                    _pending_media.pop(user_id, None)
                     return
 
+            if created:
+                logger.info("Created new ticket %s for customer %s (media caption)", ticket.id, user_id)
                 # Count unforwarded messages for THIS ticket
                 count = CustomerMessage.objects.filter(
                 customer=customer, ticket=ticket, is_forwarded=False
@@ -159,24 +192,24 @@ def register_customer_handlers(bot):
                 )
                 try:
                     if content_type == 'photo':
-                        bot.send_photo(settings.SUPPORT_CHAT, media_data['file_id'], caption=full_caption, reply_markup=markup)
+                        routing.post(banners.sender(bot.send_photo, ticket.id), language, media_data['file_id'], caption=full_caption, reply_markup=markup)
                     elif content_type == 'document':
-                        bot.send_document(settings.SUPPORT_CHAT, media_data['file_id'], caption=full_caption, reply_markup=markup)
+                        routing.post(banners.sender(bot.send_document, ticket.id), language, media_data['file_id'], caption=full_caption, reply_markup=markup)
                     customer_message.is_forwarded = True
                     customer_message.save()
-                    logger.info(f"Forwarded media to group for ticket {ticket.id}")
+                    logger.info("Forwarded media to group for ticket %s", ticket.id)
                 except Exception as e:
-                    logger.error(f"Forward media to group failed (cust {user_id}, ticket {ticket.id}): {e}")
+                    logger.error("Forward media to group failed (cust %s, ticket %s): %s", user_id, ticket.id, e)
                     bot.send_message(message.chat.id, "⚠️ Failed to forward your message. Please try again.")
                     customer_message.delete()
-                    del _pending_media[user_id]
+                    _pending_media.pop(user_id, None)
                     return
 
                 bot.send_message(message.chat.id, "✅ Your file and caption have been received. You may send two more messages if needed.", parse_mode="Markdown")
-                del _pending_media[user_id]
+                _pending_media.pop(user_id, None)
                 return
 
-            # Ticket exists but is UNCLAIMED → per-ticket counting
+            # Ticket exists (or a concurrent message just opened it) but is UNCLAIMED → per-ticket counting
             count = CustomerMessage.objects.filter(
             customer=customer, ticket=ticket, is_forwarded=False
             ).count()
@@ -192,17 +225,17 @@ def register_customer_handlers(bot):
                 )
                 try:
                     if content_type == 'photo':
-                        bot.send_photo(settings.SUPPORT_CHAT, media_data['file_id'], caption=full_caption, reply_markup=markup)
+                        routing.post(banners.sender(bot.send_photo, ticket.id), language, media_data['file_id'], caption=full_caption, reply_markup=markup)
                     elif content_type == 'document':
-                        bot.send_document(settings.SUPPORT_CHAT, media_data['file_id'], caption=full_caption, reply_markup=markup)
+                        routing.post(banners.sender(bot.send_document, ticket.id), language, media_data['file_id'], caption=full_caption, reply_markup=markup)
                     customer_message.is_forwarded = True
                     customer_message.save()
-                    logger.info(f"Forwarded media to group (ticket {ticket.id})")
+                    logger.info("Forwarded media to group (ticket %s)", ticket.id)
                 except Exception as e:
-                    logger.error(f"Forward media to group failed (cust {user_id}, ticket {ticket.id}): {e}")
+                    logger.error("Forward media to group failed (cust %s, ticket %s): %s", user_id, ticket.id, e)
                     bot.send_message(message.chat.id, "⚠️ Failed to forward your message. Please try again.")
                     customer_message.delete()
-                    del _pending_media[user_id]
+                    _pending_media.pop(user_id, None)
                     return
 
                 bot.send_message(message.chat.id, "✅ File received. You may send two more messages if needed.", parse_mode="Markdown")
@@ -210,9 +243,9 @@ def register_customer_handlers(bot):
                 bot.send_message(message.chat.id, f"📄 File and caption queued ({count}/3). Thank you.")
             else:
                 bot.send_message(message.chat.id, "⚠️ You've reached the message limit. An agent will get back to you shortly.")
-                logger.warning(f"Customer {user_id} reached per-ticket message limit (ticket {ticket.id})")
+                logger.warning("Customer %s reached per-ticket message limit (ticket %s)", user_id, ticket.id)
 
-            del _pending_media[user_id]
+            _pending_media.pop(user_id, None)
             return
 
         # -----------------------------------------
@@ -245,20 +278,22 @@ def register_customer_handlers(bot):
         # 3) Get/Create customer + find active ticket (not finally approved)
         # -----------------------------------------
         customer, _ = Customer.objects.get_or_create(telegram_id=user_id)
+        unblock(customer)
         ticket = get_active_ticket_for_customer(customer)  # may be None
 
         # Save the incoming text, attach to ticket if present
         try:
-            customer_message = CustomerMessage.objects.create(
+            customer_message = writer.create(
+                CustomerMessage,
                 customer=customer,
                 ticket=ticket,  # None if first message of a brand new ticket
                 message_text=text,
                 message_type=message.content_type,
                 telegram_message_id=message.message_id
             )
-            logger.info(f"Saved text message {customer_message.id} for customer {user_id}")
+            logger.info("Saved text message %s for customer %s", customer_message.id, user_id)
         except Exception as e:
-            logger.error(f"Failed to save message for customer {user_id}: {e}")
+            logger.error("Failed to save message for customer %s: %s", user_id, e)
             bot.reply_to(message, "⚠️ Failed to process your message. Please try again.")
             return
 
@@ -273,9 +308,9 @@ def register_customer_handlers(bot):
                 bot.send_message(ticket.agent.telegram_id, sanitize_text(msg))
                 customer_message.is_forwarded = True
                 customer_message.save()
-                logger.info(f"Forwarded message from customer {user_id} to agent {ticket.agent.telegram_id} (ticket {ticket.id})")
+                logger.info("Forwarded message from customer %s to agent %s (ticket %s)", user_id, ticket.agent.telegram_id, ticket.id)
             except Exception as e:
-                logger.error(f"Forward to agent failed (cust {user_id}): {e}")
+                logger.error("Forward to agent failed (cust %s): %s", user_id, e)
                 bot.reply_to(message, "⚠️ Failed to forward your message. Please try again.")
                 customer_message.delete()
             return
@@ -283,18 +318,20 @@ def register_customer_handlers(bot):
         # -----------------------------------------
         # 5) Unclaimed flow (queue) — create a new ticket if none exists yet
         # -----------------------------------------
+        created = False
         if ticket is None:
             try:
-                ticket = Ticket.objects.create(customer=customer)
-                # attach this just-saved message to the new ticket
+                ticket, created = get_or_create_active_ticket(customer)
+                # attach this just-saved message to the ticket
                 CustomerMessage.objects.filter(id=customer_message.id).update(ticket=ticket)
-                logger.info(f"Created new ticket {ticket.id} for customer {user_id}")
             except Exception as e:
-                logger.error(f"Failed to create ticket for customer {user_id}: {e}")
+                logger.error("Failed to create ticket for customer %s: %s", user_id, e)
                 bot.reply_to(message, "⚠️ Failed to create a ticket. Please try again.")
                 customer_message.delete()
                 return
 
+        if created:
+            logger.info("Created new ticket %s for customer %s", ticket.id, user_id)
             # Count unforwarded for THIS ticket (should be 1 here)
             count = CustomerMessage.objects.filter(customer=customer, ticket=ticket, is_forwarded=False).count()
 
@@ -305,12 +342,15 @@ def register_customer_handlers(bot):
             )
             forwarded_text = f"📩 Customer ID:{customer.id:03d}\n\n{text}"
             try:
-                bot.send_message(settings.SUPPORT_CHAT, sanitize_text(forwarded_text), reply_markup=markup)
+                routing.post(
+                    banners.sender(bot.send_message, ticket.id), customer.language_code or message.from_user.language_code,
+                    sanitize_text(forwarded_text), reply_markup=markup,
+                )
                 customer_message.is_forwarded = True
                 customer_message.save()
-                logger.info(f"Forwarded first message to group for ticket {ticket.id}")
+                logger.info("Forwarded first message to group for ticket %s", ticket.id)
             except Exception as e:
-                logger.error(f"Forward to group failed (cust {user_id}, ticket {ticket.id}): {e}")
+                logger.error("Forward to group failed (cust %s, ticket %s): %s", user_id, ticket.id, e)
                 bot.reply_to(message, "⚠️ Failed to forward your message. Please try again.")
                 customer_message.delete()
                 return
@@ -323,7 +363,8 @@ def register_customer_handlers(bot):
             return
 
         # -----------------------------------------
-        # 6) Ticket exists but unclaimed → per-ticket count & queue
+        # 6) Ticket exists but unclaimed (possibly just opened by a concurrent
+        #    message) → per-ticket count & queue
         # -----------------------------------------
         count_unf = CustomerMessage.objects.filter(
             customer=customer,
@@ -342,7 +383,7 @@ def register_customer_handlers(bot):
                 message.chat.id,
                 "⚠️ You’ve reached the message limit. An agent will get back to you soon."
             )
-            logger.warning(f"Customer {user_id} reached per-ticket message limit (ticket {ticket.id})")
+            logger.warning("Customer %s reached per-ticket message limit (ticket %s)", user_id, ticket.id)
 
     
     @bot.message_handler(content_types=['photo', 'document', 'video'])
@@ -374,6 +415,7 @@ def register_customer_handlers(bot):
         # Get/Create customer
         # Get/Create customer
         customer, _ = Customer.objects.get_or_create(telegram_id=user_id)
+        unblock(customer)
         # Use the same active-ticket logic as text handler (claimed OR unclaimed but not approved/closed)
         ticket = get_active_ticket_for_customer(customer)
 
@@ -382,17 +424,18 @@ def register_customer_handlers(bot):
 
         # Save media message with a temporary caption
         try:
-            customer_message = CustomerMessage.objects.create(
-                    customer=customer,
-                    ticket=ticket,  # attach if there’s already an active ticket
-                    message_text="[Pending caption]",
-                    message_type=message.content_type,
-                    telegram_message_id=message.message_id
-                )
+            customer_message = writer.create(
+                CustomerMessage,
+                customer=customer,
+                ticket=ticket,  # attach if there’s already an active ticket
+                message_text="[Pending caption]",
+                message_type=message.content_type,
+                telegram_message_id=message.message_id
+            )
 
-            logger.info(f"Saved preliminary media message {customer_message.id} for customer {user_id}")
+            logger.info("Saved preliminary media message %s for customer %s", customer_message.id, user_id)
         except Exception as e:
-            logger.error(f"Failed to save media message for customer {user_id}: {e}")
+            logger.error("Failed to save media message for customer %s: %s", user_id, e)
             bot.send_message(message.chat.id, "⚠️ Failed to process your message. Please try again.")
             return
         _pending_media[user_id] = {
@@ -400,7 +443,8 @@ def register_customer_handlers(bot):
             'file_id': file_id,
             'customer': customer,
             'ticket': ticket,
-            'customer_message': customer_message
+            'customer_message': customer_message,
+            'added_at': time.monotonic(),
         }
         bot.send_message(
             message.chat.id,
@@ -0,0 +1,170 @@
+# customers/broadcast.py
+"""
+Announcements to every customer (manage.py broadcast and the admins'
+/broadcast command).
+
+Recipients are read by keyset pagination (id > last_customer_id ORDER BY id),
+so every page is one index range read however far the run has got. A page
+is sent by a pool of worker threads sharing one TokenBucket at
+BROADCAST_RATE messages per second; a 429 pauses the bucket for everyone for
+its retry_after and the message is retried. After each page a single UPDATE
+adds the page's counters and moves last_customer_id past it, so a crashed run
+resumes where it stopped and resends at most one page. Customers who have
+blocked the bot (403) are marked Customer.blocked and skipped from then on,
+like banned customers.
+"""
+import datetime
+import logging
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from telebot.apihelper import ApiTelegramException
+
+from bot.ratelimit import TokenBucket
+from customers.models import Broadcast, Customer
+
+logger = logging.getLogger(__name__)
+
+SENT, BLOCKED, FAILED = 'sent', 'blocked', 'failed'
+MAX_ATTEMPTS = 3
+
+Progress = namedtuple('Progress', 'broadcast done total elapsed rate eta')
+
+
+class BroadcastUnavailable(Exception):
+    """The broadcast is finished, cancelled, or being sent by another live process."""
+
+
+def recipients(after, limit):
+    """Next page of (customer id, telegram id) after customer `after`: not banned, not blocked."""
+    return list(
+        Customer.objects.filter(id__gt=after, banned=False, blocked=False)
+        .order_by('id').values_list('id', 'telegram_id')[:limit]
+    )
+
+
+def send_one(bot, bucket, telegram_id, text):
+    """Send `text` to one chat within the rate limit. Returns SENT, BLOCKED or FAILED."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        bucket.acquire()
+        try:
+            bot.send_message(telegram_id, text)
+            return SENT
+        except ApiTelegramException as exc:
+            if exc.error_code == 403:
+                return BLOCKED
+            if exc.error_code != 429:
+                logger.warning("Broadcast to %s failed: %s", telegram_id, exc.description)
+                return FAILED
+            retry_after = ((exc.result_json or {}).get('parameters') or {}).get('retry_after', 1)
+            logger.warning("Broadcast rate limited, pausing all senders for %ss", retry_after)
+            bucket.pause(retry_after)
+        except requests.exceptions.RequestException as exc:
+            logger.warning("Broadcast to %s: network error (attempt %d): %s", telegram_id, attempt, exc)
+            time.sleep(attempt)
+    return FAILED
+
+
+def claim(broadcast_id):
+    """
+    Mark the broadcast running for this process. A 'running' broadcast whose
+    sender has saved no progress for BROADCAST_LEASE_SECONDS is taken over (its
+    process died); one that is still making progress raises BroadcastUnavailable.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=settings.BROADCAST_LEASE_SECONDS)
+    claimed = Broadcast.objects.filter(pk=broadcast_id).filter(
+        Q(status='pending') | Q(status='running', heartbeat_at__lt=stale) | Q(status='running', heartbeat_at=None)
+    ).update(status='running', heartbeat_at=now)
+    if not claimed:
+        status = Broadcast.objects.filter(pk=broadcast_id).values_list('status', flat=True).first()
+        raise BroadcastUnavailable(
+            f"Broadcast #{broadcast_id} " + (f"is {status}" if status else "does not exist")
+            + (" in another process" if status == 'running' else "")
+        )
+
+
+def cancel(broadcast_id):
+    """Stop a pending or running broadcast after its current page. Returns whether it was stoppable."""
+    return bool(Broadcast.objects.filter(pk=broadcast_id, status__in=('pending', 'running')).update(
+        status='cancelled', finished_at=timezone.now(),
+    ))
+
+
+def run_broadcast(broadcast_id, bot, rate=None, workers=None, page_size=None, progress=None):
+    """
+    Send (or resume sending) a broadcast through `bot`. `progress(Progress)` is
+    called after every page. Returns the Broadcast as saved at the end.
+    """
+    rate = rate or settings.BROADCAST_RATE
+    workers = workers or settings.BROADCAST_WORKERS
+    page_size = page_size or settings.BROADCAST_PAGE_SIZE
+    claim(broadcast_id)
+    broadcast = Broadcast.objects.get(pk=broadcast_id)
+    logger.info("Broadcast #%s starting after customer %s", broadcast.id, broadcast.last_customer_id)
+
+    bucket = TokenBucket(rate)
+    already = broadcast.sent + broadcast.blocked + broadcast.failed
+    total = already + Customer.objects.filter(
+        id__gt=broadcast.last_customer_id, banned=False, blocked=False,
+    ).count()
+    started, handled = time.monotonic(), 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"Broadcast{broadcast.id}") as pool:
+        while True:
+            page = recipients(broadcast.last_customer_id, page_size)
+            if not page:
+                break
+            results = list(pool.map(lambda row: send_one(bot, bucket, row[1], broadcast.text), page))
+            counts = Counter(results)
+            blocked_ids = [customer_id for (customer_id, _), result in zip(page, results) if result == BLOCKED]
+            if blocked_ids:
+                Customer.objects.filter(id__in=blocked_ids).update(blocked=True)
+            broadcast.last_customer_id = page[-1][0]
+            Broadcast.objects.filter(pk=broadcast.pk).update(
+                last_customer_id=broadcast.last_customer_id,
+                sent=F('sent') + counts[SENT],
+                blocked=F('blocked') + counts[BLOCKED],
+                failed=F('failed') + counts[FAILED],
+                heartbeat_at=timezone.now(),
+            )
+            broadcast.sent += counts[SENT]
+            broadcast.blocked += counts[BLOCKED]
+            broadcast.failed += counts[FAILED]
+            handled += len(page)
+            if progress:
+                elapsed = time.monotonic() - started
+                done = already + handled
+                per_second = handled / elapsed if elapsed else 0.0
+                eta = max(total - done, 0) / per_second if per_second else None
+                progress(Progress(broadcast, done, max(total, done), elapsed, per_second, eta))
+            if Broadcast.objects.filter(pk=broadcast.pk, status='cancelled').exists():
+                logger.info("Broadcast #%s cancelled after customer %s", broadcast.id, broadcast.last_customer_id)
+                broadcast.status = 'cancelled'
+                return broadcast
+
+    Broadcast.objects.filter(pk=broadcast.pk, status='running').update(status='done', finished_at=timezone.now())
+    broadcast.refresh_from_db()
+    logger.info(
+        "Broadcast #%s %s: %d sent, %d blocked, %d failed",
+        broadcast.id, broadcast.status, broadcast.sent, broadcast.blocked, broadcast.failed,
+    )
+    return broadcast
+
+
+def format_progress(progress):
+    broadcast = progress.broadcast
+    percent = 100 * progress.done // progress.total if progress.total else 100
+    line = (
+        f"📣 Broadcast #{broadcast.id}: {progress.done}/{progress.total} ({percent}%) · "
+        f"✅ {broadcast.sent} sent · 🚫 {broadcast.blocked} blocked · ⚠️ {broadcast.failed} failed · "
+        f"{progress.rate:.1f} msg/s"
+    )
+    if progress.eta is not None and progress.done < progress.total:
+        line += f" · ETA {datetime.timedelta(seconds=round(progress.eta))}"
+    return line
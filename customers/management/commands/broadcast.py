@@ -0,0 +1,63 @@
+# broadcast.py
+import telebot
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from customers import broadcast
+from customers.models import Broadcast
+
+
+class Command(BaseCommand):
+    help = (
+        'Send a message to every customer who is neither banned nor has blocked the bot, '
+        'within Telegram\'s rate limits. Progress is saved after every page, so an interrupted '
+        'broadcast continues with --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('text', nargs='?', help='Message to send')
+        parser.add_argument('--resume', type=int, metavar='ID', help='Continue an interrupted broadcast')
+        parser.add_argument('--cancel', type=int, metavar='ID', help='Stop a broadcast after its current page')
+        parser.add_argument('--list', action='store_true', help='Show recent broadcasts')
+        parser.add_argument('--rate', type=float, default=settings.BROADCAST_RATE, help='Messages per second')
+        parser.add_argument('--workers', type=int, default=settings.BROADCAST_WORKERS)
+        parser.add_argument('--page-size', type=int, default=settings.BROADCAST_PAGE_SIZE)
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for item in Broadcast.objects.order_by('-id')[:20]:
+                self.stdout.write(
+                    f"#{item.id} {item.status:<9} sent {item.sent}, blocked {item.blocked}, failed {item.failed} "
+                    f"· {item.text[:50]!r}"
+                )
+            return
+        if options['cancel']:
+            if not broadcast.cancel(options['cancel']):
+                raise CommandError(f"Broadcast #{options['cancel']} is not pending or running")
+            self.stdout.write(f"Broadcast #{options['cancel']} cancelled")
+            return
+        if options['resume']:
+            broadcast_id = options['resume']
+        elif options['text']:
+            broadcast_id = Broadcast.objects.create(text=options['text']).id
+        else:
+            raise CommandError("Give the message text, or --resume/--cancel ID, or --list")
+
+        if not settings.TELEGRAM_BOT_TOKEN:
+            raise CommandError("TELEGRAM_BOT_TOKEN is not set")
+        if settings.TELEGRAM_API_URL:
+            telebot.apihelper.API_URL = settings.TELEGRAM_API_URL
+        bot = telebot.TeleBot(settings.TELEGRAM_BOT_TOKEN, threaded=False)
+
+        try:
+            result = broadcast.run_broadcast(
+                broadcast_id, bot,
+                rate=options['rate'], workers=options['workers'], page_size=options['page_size'],
+                progress=lambda progress: self.stdout.write(broadcast.format_progress(progress)),
+            )
+        except broadcast.BroadcastUnavailable as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            f"Broadcast #{result.id} {result.status}: {result.sent} sent, {result.blocked} blocked, "
+            f"{result.failed} failed"
+        )
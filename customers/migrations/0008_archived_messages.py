@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0007_customermessage_ticket'),
+        ('tickets', '0004_one_active_ticket_per_customer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCustomerMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message_text', models.TextField()),
+                ('message_type', models.CharField(default='text', max_length=50)),
+                ('telegram_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField()),
+                ('is_forwarded', models.BooleanField(default=False)),
+                ('is_resolved_message', models.BooleanField(default=False)),
+                ('is_closed_message', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='customers.customer')),
+                ('ticket', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_messages', to='tickets.ticket')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'sent_at'], name='customers_a_custome_6e0cd5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0008_archived_messages'),
+        ('tickets', '0007_message_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customermessage',
+            index=models.Index(fields=['sent_at'], name='customers_c_sent_at_4fe142_idx'),
+        ),
+    ]
@@ -12,6 +12,7 @@ class Customer(models.Model):
     language_code = models.CharField(max_length=10, blank=True, null=True)
     open_ticket = models.BooleanField(default=False)
     banned = models.BooleanField(default=False)
+    blocked = models.BooleanField(default=False)  # Telegram answered 403: the user blocked the bot
     open_ticket_spam = models.IntegerField(default=1)
     open_ticket_link = models.CharField(max_length=255, blank=True, null=True)
     open_ticket_time = models.DateTimeField(default=get_default_open_ticket_time)
@@ -31,5 +32,57 @@ class CustomerMessage(models.Model):
     is_resolved_message = models.BooleanField(default=False)
     is_closed_message = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=['sent_at'])]  # admin date hierarchy
+
+    def __str__(self):
+        return f"Message from {self.customer.telegram_id} at {self.sent_at}"
+
+
+class ArchivedCustomerMessage(models.Model):
+    """CustomerMessage moved out of the live table by `archive_messages`; keeps the original id."""
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='archived_messages')
+    ticket = models.ForeignKey("tickets.Ticket", on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_messages')
+    message_text = models.TextField()
+    message_type = models.CharField(max_length=50, default='text')
+    telegram_message_id = models.BigIntegerField(blank=True, null=True)
+    sent_at = models.DateTimeField()
+    is_forwarded = models.BooleanField(default=False)
+    is_resolved_message = models.BooleanField(default=False)
+    is_closed_message = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['customer', 'sent_at'])]
+
+    def __str__(self):
+        return f"Archived message from {self.customer.telegram_id} at {self.sent_at}"
+
+
+class Broadcast(models.Model):
+    """
+    One announcement to every customer (customers.broadcast). Progress is
+    saved after each page of recipients, so a crashed run resumes after
+    last_customer_id.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    text = models.TextField()
+    created_by = models.BigIntegerField(null=True, blank=True)  # admin's Telegram id, empty from manage.py
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    last_customer_id = models.BigIntegerField(default=0)  # every customer up to this id has been handled
+    sent = models.PositiveIntegerField(default=0)
+    blocked = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # last progress save of the running sender
+    finished_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"Message from {self.customer.telegram_id} at {self.sent_at}"
\ No newline at end of file
+        return f"Broadcast #{self.id} ({self.status})"
@@ -1,3 +1,88 @@
-from django.test import TestCase
+import datetime
+import threading
+import time
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from bot.tests import telegram_error
+from customers import broadcast
+from customers.bot_handlers import _pending_media, expire_pending_media
+from customers.models import Broadcast, Customer, CustomerMessage
+
+
+class FakeBot:
+    """send_message() that records chats and fails for the ones listed in `errors`."""
+
+    def __init__(self, errors=None):
+        self.errors = dict(errors or {})
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text):
+        with self._lock:
+            error = self.errors.get(chat_id)
+            if isinstance(error, list):
+                error = error.pop(0) if error else None
+            if error is not None:
+                raise error
+            self.sent.append(chat_id)
+
+
+@override_settings(BROADCAST_RATE=1000, BROADCAST_WORKERS=3, BROADCAST_PAGE_SIZE=2)
+class BroadcastTests(TestCase):
+    def setUp(self):
+        for telegram_id in range(500, 508):
+            Customer.objects.create(telegram_id=telegram_id)
+        Customer.objects.filter(telegram_id=500).update(banned=True)
+        Customer.objects.filter(telegram_id=501).update(blocked=True)
+        self.item = Broadcast.objects.create(text="Maintenance tonight")
+
+    def test_sends_to_reachable_customers_and_marks_blocks(self):
+        bot = FakeBot({
+            502: telegram_error(403, "Forbidden: bot was blocked by the user", method='sendMessage'),
+            503: [telegram_error(429, "Too Many Requests", method='sendMessage', retry_after=0)],
+            504: telegram_error(400, "Bad Request: chat not found", method='sendMessage'),
+        })
+        reports = []
+        result = broadcast.run_broadcast(self.item.id, bot, progress=reports.append)
+        self.assertEqual(sorted(bot.sent), [503, 505, 506, 507])
+        self.assertEqual((result.status, result.sent, result.blocked, result.failed), ('done', 4, 1, 1))
+        self.assertTrue(Customer.objects.get(telegram_id=502).blocked)
+        self.assertEqual((reports[-1].done, reports[-1].total), (6, 6))
+        self.assertIn("6/6 (100%)", broadcast.format_progress(reports[-1]))
+
+    def test_crashed_broadcast_resumes_after_the_last_saved_page(self):
+        bot = FakeBot()
+
+        def crash(progress):
+            raise RuntimeError("process killed")
+
+        with self.assertRaises(RuntimeError):
+            broadcast.run_broadcast(self.item.id, bot, progress=crash)
+        with self.assertRaises(broadcast.BroadcastUnavailable):
+            broadcast.run_broadcast(self.item.id, bot)  # the lease is still fresh
+        Broadcast.objects.filter(pk=self.item.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(hours=1))
+        result = broadcast.run_broadcast(self.item.id, bot)
+        self.assertEqual(sorted(bot.sent), list(range(502, 508)))
+        self.assertEqual((result.status, result.sent), ('done', 6))
+
+    def test_cancel_stops_after_the_current_page(self):
+        bot = FakeBot()
+        result = broadcast.run_broadcast(self.item.id, bot, progress=lambda p: broadcast.cancel(self.item.id))
+        self.assertEqual((result.status, len(bot.sent)), ('cancelled', 2))
+        self.assertFalse(broadcast.cancel(self.item.id))
+
+
+class PendingMediaExpiryTests(TestCase):
+    def test_media_without_caption_expires(self):
+        customer = Customer.objects.create(telegram_id=601)
+        self.addCleanup(_pending_media.clear)
+        for user_id, age in ((601, 1000), (602, 10)):
+            message = CustomerMessage.objects.create(customer=customer, message_text="[Pending caption]")
+            _pending_media[user_id] = {'customer_message': message, 'added_at': time.monotonic() - age}
+        bot = FakeBot()
+        self.assertEqual(expire_pending_media(bot, max_age=900), 1)
+        self.assertEqual(list(_pending_media), [602])
+        self.assertEqual(bot.sent, [601])
+        self.assertEqual(CustomerMessage.objects.count(), 1)
@@ -1,3 +1,127 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 
-# Register your models here.
+from admin_app.changelist import HighVolumeAdmin, ReadOnlyAdmin
+from .models import (
+    AgentDailyStats, AgentHourlyStats, AgentSummary, ProjectionCheckpoint, Ticket, TicketEvent, TicketMetrics,
+    TicketSummary,
+)
+from .views import bulk_close_tickets_finally, bulk_raise_tickets
+
+
+def _telegram_bot():
+    import telebot
+
+    if settings.TELEGRAM_API_URL:
+        telebot.apihelper.API_URL = settings.TELEGRAM_API_URL
+    return telebot.TeleBot(settings.TELEGRAM_BOT_TOKEN, threaded=False)
+
+
+@admin.register(Ticket)
+class TicketAdmin(HighVolumeAdmin):
+    list_display = (
+        'id', 'customer', 'agent', 'is_claimed', 'is_resolved', 'is_resolved_approved', 'is_closed',
+        'is_closed_approved', 'created_at',
+    )
+    list_select_related = ('customer', 'agent')
+    list_filter = ('is_claimed', 'is_resolved_approved', 'is_closed_approved')
+    search_fields = ('=id', '=customer__telegram_id')
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ('customer', 'agent')
+    actions = ('raise_tickets', 'close_tickets_finally')
+
+    def _audit(self, request):
+        return {'via': 'admin', 'user': request.user.get_username()}
+
+    @admin.action(description="Raise selected tickets back to support")
+    def raise_tickets(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        result = bulk_raise_tickets(ids, **self._audit(request))
+        message = f"{result['message']} {len(ids) - result['count']} skipped."
+        if not result['ticket_ids']:
+            self.message_user(request, message, messages.SUCCESS)
+        elif settings.TELEGRAM_BOT_TOKEN:
+            from bot import jobs
+            from tickets import sweeper
+
+            jobs.submit(
+                f"announce {len(result['ticket_ids'])} raised tickets",
+                sweeper.announce_raised, _telegram_bot(), result['ticket_ids'],
+            )
+            self.message_user(request, f"{message} Posting them to the support groups.", messages.SUCCESS)
+        else:
+            self.message_user(
+                request, f"{message} TELEGRAM_BOT_TOKEN is not set: they were not posted to the support groups.",
+                messages.WARNING,
+            )
+
+    @admin.action(description="Close selected tickets permanently")
+    def close_tickets_finally(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        result = bulk_close_tickets_finally(ids, **self._audit(request))
+        self.message_user(request, f"{result['message']} {len(ids) - result['count']} skipped.", messages.SUCCESS)
+
+
+@admin.register(TicketEvent)
+class TicketEventAdmin(ReadOnlyAdmin):
+    list_display = ('id', 'ticket_id', 'kind', 'agent_id', 'actor_telegram_id', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('=ticket_id', '=customer_id', '=agent_id')
+    date_hierarchy = 'created_at'
+
+
+@admin.register(TicketSummary)
+class TicketSummaryAdmin(ReadOnlyAdmin):
+    list_display = ('ticket_id', 'state', 'agent_id', 'opened_at', 'claims', 'resolutions', 'closures', 'raises')
+    search_fields = ('=ticket_id', '=customer_id', '=agent_id')
+
+
+@admin.register(AgentSummary)
+class AgentSummaryAdmin(ReadOnlyAdmin):
+    list_display = ('agent_id', 'claims', 'resolutions', 'closures', 'approvals', 'declines', 'handled', 'last_event_at')
+    search_fields = ('=agent_id',)
+
+
+@admin.register(ProjectionCheckpoint)
+class ProjectionCheckpointAdmin(ReadOnlyAdmin):
+    list_display = ('name', 'last_event_id', 'updated_at')
+
+
+# Analytics tables are maintained by tickets.metrics; the admin only reads them.
+STAT_COLUMNS = ('agent_id', 'claims', 'resolutions', 'closures', 'approvals', 'declines', 'avg_handle', 'avg_claim_wait')
+
+
+class AgentStatsAdmin(ReadOnlyAdmin):
+    list_display = STAT_COLUMNS
+    search_fields = ('=agent_id',)
+
+    @admin.display(description='avg handle (s)')
+    def avg_handle(self, obj):
+        return round(obj.handle_seconds / obj.handle_count) if obj.handle_count else None
+
+    @admin.display(description='avg claim wait (s)')
+    def avg_claim_wait(self, obj):
+        return round(obj.claim_wait_seconds / obj.claim_wait_count) if obj.claim_wait_count else None
+
+
+@admin.register(AgentHourlyStats)
+class AgentHourlyStatsAdmin(AgentStatsAdmin):
+    list_display = ('hour',) + STAT_COLUMNS
+    date_hierarchy = 'hour'
+    ordering = ('-hour', 'agent_id')
+
+
+@admin.register(AgentDailyStats)
+class AgentDailyStatsAdmin(AgentStatsAdmin):
+    list_display = ('day',) + STAT_COLUMNS
+    date_hierarchy = 'day'
+    ordering = ('-day', 'agent_id')
+
+
+@admin.register(TicketMetrics)
+class TicketMetricsAdmin(ReadOnlyAdmin):
+    list_display = (
+        'ticket_id', 'agent_id', 'outcome', 'opened_at', 'time_to_claim', 'handle_seconds',
+        'approval_seconds', 'claims', 'declines', 'reopens',
+    )
+    search_fields = ('=ticket_id', '=customer_id', '=agent_id')
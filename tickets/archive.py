@@ -0,0 +1,106 @@
+# tickets/archive.py
+"""
+Retention for message tables.
+
+Messages of tickets that were finally closed (close_ticket_finally) more than
+ARCHIVE_AFTER_DAYS ago move from CustomerMessage/AgentMessage into the
+Archived* tables, which keep the original ids. Each batch is its own short
+transaction (copy, then delete), so the bot keeps writing while it runs and
+an interrupted run resumes where it stopped. utils.iter_conversation_history
+reads both tables, so agents still see the full history.
+"""
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from agents.models import AgentMessage, ArchivedAgentMessage
+from customers.models import ArchivedCustomerMessage, CustomerMessage
+from tickets.models import Ticket
+
+logger = logging.getLogger(__name__)
+
+# live model -> (archive model, copied columns)
+ARCHIVES = {
+    CustomerMessage: (ArchivedCustomerMessage, (
+        'id', 'customer_id', 'ticket_id', 'message_text', 'message_type', 'telegram_message_id',
+        'sent_at', 'is_forwarded', 'is_resolved_message', 'is_closed_message',
+    )),
+    AgentMessage: (ArchivedAgentMessage, (
+        'id', 'agent_id', 'customer_id', 'ticket_id', 'message_text', 'message_type',
+        'telegram_message_id', 'sent_at',
+    )),
+}
+
+
+def finalized_tickets(days):
+    """Tickets closed for good by close_ticket_finally more than `days` days ago."""
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return Ticket.objects.filter(
+        is_resolved=True, is_resolved_approved=True,
+        is_closed=True, is_closed_approved=True,
+        closed_at__lt=cutoff,
+    )
+
+
+def archive_batch(model, tickets, batch_size):
+    """Move up to `batch_size` messages of `tickets` into the archive. Returns the number moved."""
+    archive_model, columns = ARCHIVES[model]
+    with transaction.atomic():
+        rows = list(
+            model.objects.filter(ticket__in=tickets.values('id')).order_by('id').values(*columns)[:batch_size]
+        )
+        if not rows:
+            return 0
+        # ignore_conflicts: rows copied by an earlier run that died before its delete
+        archive_model.objects.bulk_create([archive_model(**row) for row in rows], ignore_conflicts=True)
+        model.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_messages(days, batch_size=500, pause=0.0, max_batches=None, dry_run=False, deadline=None):
+    """
+    Archive every eligible message in batches. Returns {'CustomerMessage': n, 'AgentMessage': n}.
+    Stops between batches once time.monotonic() passes `deadline`; the next run resumes.
+    """
+    tickets = finalized_tickets(days)
+    moved = {}
+    for model in ARCHIVES:
+        name = model.__name__
+        if dry_run:
+            moved[name] = model.objects.filter(ticket__in=tickets.values('id')).count()
+            continue
+        moved[name] = batches = 0
+        while max_batches is None or batches < max_batches:
+            count = archive_batch(model, tickets, batch_size)
+            if not count:
+                break
+            moved[name] += count
+            batches += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.info("Archive stopped at its deadline after %d %s rows", moved[name], name)
+                return moved
+            if pause:
+                time.sleep(pause)  # let handler writes through between batches
+        logger.info("Archived %d %s rows of tickets closed more than %d days ago", moved[name], name, days)
+    return moved
+
+
+def vacuum():
+    """Return freed pages to the OS (SQLite) or refresh planner stats (PostgreSQL)."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("VACUUM")
+        elif connection.vendor == 'postgresql':
+            for model in ARCHIVES:
+                cursor.execute(f"VACUUM ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def run_scheduled(deadline=None):
+    """Scheduler entry point (bot/scheduler.py): one archive pass with the configured retention."""
+    return archive_messages(
+        settings.ARCHIVE_AFTER_DAYS, batch_size=settings.ARCHIVE_BATCH_SIZE, pause=0.05, deadline=deadline,
+    )
@@ -0,0 +1,216 @@
+# tickets/assignment.py
+"""
+Load-aware ticket assignment (the opt-in `assign_tickets` maintenance job).
+
+A ticket only moves when an agent watching the support group taps Claim, so
+at peak tickets wait while agents who are not looking at the group sit
+idle. Every ASSIGNMENT_INTERVAL_SECONDS the engine:
+
+- syncs an in-memory priority queue with the unclaimed tickets, ordered by
+  how long they have waited (since they were opened, raised or released);
+- takes idle agents: registered, holding no active ticket (claim_ticket's
+  one-at-a-time rule) and not released by the sweeper within
+  ASSIGNMENT_AWAY_MINUTES, least loaded first, that is with the fewest
+  claims in the last LOAD_WINDOW_HOURS, then the longest since their last;
+- gives each ticket waiting ASSIGNMENT_MIN_WAIT_SECONDS, oldest first, to
+  the least loaded idle agent speaking the customer's language. A ticket in a
+  language some busy agent speaks waits for them; one no agent speaks goes
+  to any idle agent.
+
+Assignments go through views.claim_ticket, the same atomic claim as the
+button (recorded as a `claimed` event with via='assignment'), so a ticket
+claimed by hand meanwhile is simply skipped. As a background job, the
+ticket's support-group post (tickets/banners.py) is marked claimed and
+its buttons dropped, and the agent is sent the history. metrics() (runbot's /status
+"assignment") has the queue and the waits of recently assigned tickets.
+"""
+import datetime
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from agents.models import Agent
+from bot import jobs
+from tickets import banners, events, views
+from tickets.bot_handlers import send_history
+from tickets.models import Ticket, TicketEvent
+
+logger = logging.getLogger(__name__)
+
+LOAD_WINDOW_HOURS = 8  # claims counted towards an agent's load
+WAIT_HISTORY = 200  # assigned tickets whose waits metrics() summarises
+
+
+def _language(code):
+    """"fr-CA", "FR", "fr_ca" -> "fr"; None for no language."""
+    return (code or '').strip().lower().replace('_', '-').split('-', 1)[0] or None
+
+
+class IdleAgent:
+    __slots__ = ('id', 'telegram_id', 'language', 'claims', 'last_claimed')
+
+    def __init__(self, agent_id, telegram_id, language, claims=0, last_claimed=None):
+        self.id = agent_id
+        self.telegram_id = telegram_id
+        self.language = _language(language)
+        self.claims = claims
+        self.last_claimed = last_claimed
+
+    def load(self):
+        return (self.claims, self.last_claimed or datetime.datetime.min.replace(tzinfo=datetime.timezone.utc))
+
+
+class AssignmentEngine:
+    def __init__(self, min_wait, away_minutes):
+        self.min_wait = min_wait
+        self.away_minutes = away_minutes
+        self._lock = threading.Lock()
+        self._heap = []  # (queued since, ticket id); entries no longer in _queued are skipped
+        self._queued = {}  # ticket id -> (queued since, customer language)
+        self.waits = deque(maxlen=WAIT_HISTORY)  # seconds each recently assigned ticket waited
+        self.counts = Counter()  # assigned, failed
+
+    # ---- queue -----------------------------------------------------------
+    def refresh(self):
+        """Bring the queue in line with the unclaimed tickets: add new or re-queued ones, forget claimed ones."""
+        rows = Ticket.objects.filter(
+            is_claimed=False, is_resolved_approved=False, is_closed_approved=False,
+        ).values_list('id', 'last_updated', 'customer__language_code')
+        with self._lock:
+            queued = {}
+            for ticket_id, since, language in rows:
+                queued[ticket_id] = (since, _language(language))
+                if self._queued.get(ticket_id, (None,))[0] != since:
+                    heapq.heappush(self._heap, (since, ticket_id))
+            self._queued = queued
+            if len(self._heap) > 2 * len(queued) + 64:  # mostly stale entries
+                self._heap = [(since, ticket_id) for ticket_id, (since, _) in queued.items()]
+                heapq.heapify(self._heap)
+        return len(queued)
+
+    def _pop_ready(self, ready_before):
+        """Queued tickets waiting since before `ready_before`, oldest first; the caller pushes back what it keeps."""
+        while self._heap and self._heap[0][0] <= ready_before:
+            since, ticket_id = heapq.heappop(self._heap)
+            entry = self._queued.get(ticket_id)
+            if entry is not None and entry[0] == since:
+                yield since, ticket_id, entry[1]
+
+    # ---- agents ----------------------------------------------------------
+    def idle_agents(self, now):
+        """Agents free to take a ticket now, least loaded first."""
+        busy = Ticket.objects.filter(
+            is_claimed=True, is_resolved=False, is_closed=False, agent__isnull=False,
+        ).values('agent_id')
+        away = TicketEvent.objects.filter(
+            kind=events.RELEASED, created_at__gte=now - datetime.timedelta(minutes=self.away_minutes),
+        ).values('agent_id')
+        idle = Agent.objects.exclude(id__in=busy)
+        if self.away_minutes:
+            idle = idle.exclude(id__in=away)
+        load = {
+            agent_id: (claims, last_claimed)
+            for agent_id, claims, last_claimed in TicketEvent.objects.filter(
+                kind=events.CLAIMED, created_at__gte=now - datetime.timedelta(hours=LOAD_WINDOW_HOURS),
+            ).values('agent_id').annotate(claims=Count('id'), last=Max('created_at')).values_list(
+                'agent_id', 'claims', 'last',
+            )
+        }
+        agents = [
+            IdleAgent(agent_id, telegram_id, language, *load.get(agent_id, ()))
+            for agent_id, telegram_id, language in idle.values_list('id', 'telegram_id', 'language')
+        ]
+        agents.sort(key=IdleAgent.load)
+        return agents
+
+    # ---- running ---------------------------------------------------------
+    def run(self, bot, deadline=None, now=None):
+        """One assignment round. Returns how many tickets were assigned."""
+        now = now or timezone.now()
+        if not self.refresh():
+            return 0
+        agents = self.idle_agents(now)
+        if not agents:
+            return 0
+        spoken = {_language(language) for language in Agent.objects.values_list('language', flat=True)} - {None}
+        assigned, kept = 0, []
+        with self._lock:
+            ready = list(self._pop_ready(now - datetime.timedelta(seconds=self.min_wait)))
+        for since, ticket_id, language in ready:
+            if not agents or (deadline is not None and time.monotonic() >= deadline):
+                kept.append((since, ticket_id))
+                continue
+            speakers = [agent for agent in agents if agent.language == language]
+            candidates = speakers or ([] if language in spoken else agents)
+            if not candidates:
+                kept.append((since, ticket_id))  # for an agent who speaks it, once one is free
+                continue
+            agent = candidates[0]
+            agents.remove(agent)  # busy now, or unable to claim: either way not again this round
+            waited = (now - since).total_seconds()
+            result = views.claim_ticket(ticket_id, agent.telegram_id, via='assignment', waited_seconds=round(waited))
+            with self._lock:
+                self._queued.pop(ticket_id, None)  # still unclaimed after a failure: back at the next refresh
+                if result["status"] != "success":
+                    self.counts['failed'] += 1
+                else:
+                    self.counts['assigned'] += 1
+                    self.waits.append(waited)
+            if result["status"] != "success":
+                logger.warning(
+                    "Could not assign ticket %s to agent %s: %s", ticket_id, agent.telegram_id, result['message'],
+                )
+                continue
+            assigned += 1
+            logger.info("Assigned ticket %s to agent %s after %.0f s in the queue", ticket_id, agent.telegram_id, waited)
+            jobs.submit(f"assign #{ticket_id}", announce, bot, result["ticket"], result["agent"])
+        with self._lock:
+            for entry in kept:
+                heapq.heappush(self._heap, entry)
+        return assigned
+
+    def metrics(self):
+        now = timezone.now()
+        with self._lock:
+            oldest = min((since for since, _ in self._queued.values()), default=None)
+            waits = sorted(self.waits)
+            return {
+                "queued": len(self._queued),
+                "oldest_wait_seconds": round((now - oldest).total_seconds()) if oldest else None,
+                "assigned": self.counts['assigned'],
+                "failed": self.counts['failed'],
+                "recent_wait_p50_seconds": round(waits[len(waits) // 2]) if waits else None,
+                "recent_wait_max_seconds": round(waits[-1]) if waits else None,
+            }
+
+
+def announce(bot, ticket, agent):
+    """Mark the ticket's banner claimed, tell the agent about their assigned ticket and send its history."""
+    try:
+        if not banners.edit_ticket(bot, ticket.id, f"📩 Ticket #{ticket.id} claimed by Agent {int(agent.pk):03d}"):
+            logger.info("Ticket %s has no support-group post to mark claimed", ticket.id)
+    except Exception as e:
+        logger.warning("Failed to edit the support-group post of ticket %s: %s", ticket.id, e)
+    bot.send_message(
+        agent.telegram_id,
+        f"📥 Ticket #{ticket.id} has been assigned to you.\n\nForwarding conversation history now..."
+    )
+    send_history(bot, ticket, agent.telegram_id, "agent")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> AssignmentEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AssignmentEngine(settings.ASSIGNMENT_MIN_WAIT_SECONDS, settings.ASSIGNMENT_AWAY_MINUTES)
+        return _engine
@@ -0,0 +1,68 @@
+# tickets/banners.py
+"""
+A ticket's banner: its support-group post with the Claim/Preview buttons.
+
+A claim by button edits the banner that was tapped. An assignment
+(tickets/assignment.py) has no tap to go by, so every banner is posted
+through sender(), which keeps the latest one in Ticket.banner, and
+edit_ticket() edits that one.
+"""
+import logging
+
+from tickets.models import Ticket
+from utils import sanitize_text
+
+logger = logging.getLogger(__name__)
+
+MEDIA = ("photo", "document", "video", "animation", "audio", "voice")  # edited by caption
+
+
+def sender(send, ticket_id):
+    """send (bot.send_message, send_photo, ...) that records what it sent as the ticket's banner; for routing.post."""
+    def send_banner(chat_id, *args, **kwargs):
+        message = send(chat_id, *args, **kwargs)
+        remember(ticket_id, message)
+        return message
+    return send_banner
+
+
+def remember(ticket_id, message):
+    try:
+        media = message.content_type in MEDIA
+        banner = {
+            "chat_id": int(message.chat.id),
+            "message_id": int(message.message_id),
+            "media": media,
+            "text": str((message.caption if media else message.text) or ''),
+        }
+        Ticket.objects.filter(id=ticket_id).update(banner=banner)  # update(): leaves last_updated alone
+    except Exception as e:
+        logger.warning("Could not record the support-group post of ticket %s: %s", ticket_id, e)
+
+
+def edit(bot, chat_id, message_id, media, text, first_line):
+    """Put `first_line` above a banner's text (or caption, for media) and drop its buttons."""
+    if media:
+        # Media messages must use caption editing
+        bot.edit_message_caption(
+            chat_id=chat_id,
+            message_id=message_id,
+            caption=sanitize_text(f"{first_line}\n\n{text or ''}".strip()),
+            reply_markup=None,
+        )
+    else:
+        bot.edit_message_text(
+            sanitize_text(f"{first_line}\n\n{text or ''}".strip()),
+            chat_id,
+            message_id,
+            reply_markup=None,
+        )
+
+
+def edit_ticket(bot, ticket_id, first_line):
+    """edit() the ticket's latest banner. Returns whether there was one."""
+    banner = Ticket.objects.filter(id=ticket_id).values_list('banner', flat=True).first()
+    if not banner:
+        return False
+    edit(bot, banner["chat_id"], banner["message_id"], banner["media"], banner["text"], first_line)
+    return True
@@ -0,0 +1,251 @@
+# tickets/benchmarks.py
+"""
+Micro-benchmarks for the ticket state transitions in tickets/views.py.
+
+seed() creates a realistic background volume (customers, finished tickets
+and their messages) plus one open ticket per benchmark slot. Each transition
+is timed per call, single-threaded and with N threads contending, after its
+tickets are put into the required prior state with one bulk update.
+bench_message_writes() measures concurrent message inserts (messages/s).
+Everything lives in a reserved telegram_id range and is removed by cleanup().
+"""
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from agents.models import Agent, AgentMessage
+from bot import writer
+from customers.models import Customer, CustomerMessage
+from tickets import events, views
+from tickets.models import Ticket
+
+BENCH_ID_BASE = 8_000_000_000
+BENCH_AGENT_BASE = 8_100_000_000
+BENCH_ADMIN_ID = 8_200_000_000
+
+OPEN = dict(
+    agent=None, is_claimed=False, is_resolved=False, is_resolved_approved=False,
+    is_closed=False, is_closed_approved=False,
+)
+
+
+def _claimed(**extra):
+    return dict(OPEN, is_claimed=True, **extra)
+
+
+# name -> (prior state, call(ticket_id, agent_tid))
+# A prior state containing agent=True is bound to the ticket's own agent.
+TRANSITIONS = {
+    'claim_ticket': (OPEN, lambda tid, agent: views.claim_ticket(tid, agent)),
+    'resolve_ticket': (_claimed(agent=True), lambda tid, agent: views.resolve_ticket(tid, agent, "bench summary")),
+    'close_ticket': (_claimed(agent=True), lambda tid, agent: views.close_ticket(tid, agent, "bench summary")),
+    'approve_ticket_resolution': (
+        _claimed(agent=True, is_resolved=True),
+        lambda tid, agent: views.approve_ticket_resolution(tid, BENCH_ADMIN_ID),
+    ),
+    'decline_ticket_resolution': (
+        _claimed(agent=True, is_resolved=True),
+        lambda tid, agent: views.decline_ticket_resolution(tid, BENCH_ADMIN_ID),
+    ),
+    'approve_ticket_closure': (
+        _claimed(agent=True, is_closed=True),
+        lambda tid, agent: views.approve_ticket_closure(tid, BENCH_ADMIN_ID),
+    ),
+    'decline_ticket_closure': (
+        _claimed(agent=True, is_closed=True),
+        lambda tid, agent: views.decline_ticket_closure(tid, BENCH_ADMIN_ID),
+    ),
+    'raise_ticket': (dict(OPEN, is_resolved_approved=True), lambda tid, agent: views.raise_ticket(tid)),
+    'handle_ticket': (
+        dict(OPEN, is_closed_approved=True),
+        lambda tid, agent: views.handle_ticket(tid, BENCH_ADMIN_ID),
+    ),
+    'close_ticket_finally': (
+        dict(OPEN, is_resolved_approved=True),
+        lambda tid, agent: views.close_ticket_finally(tid, BENCH_ADMIN_ID),
+    ),
+}
+
+
+def seed(slots=200, history_customers=1000, history_tickets=3, history_messages=10, batch_size=1000):
+    """
+    Create `slots` customer/agent/open-ticket triples used by the benchmark, and
+    background volume: `history_customers` customers with finished tickets and
+    `history_messages` customer + agent messages per ticket.
+    Returns [(ticket_id, agent_telegram_id), ...] for the benchmark slots.
+    """
+    cleanup()
+    agents = Agent.objects.bulk_create(
+        [Agent(telegram_id=BENCH_AGENT_BASE + i, full_name=f"Bench Agent {i}") for i in range(slots)],
+        batch_size=batch_size,
+    )
+    customers = Customer.objects.bulk_create(
+        [Customer(telegram_id=BENCH_ID_BASE + i, full_name=f"Bench {i}") for i in range(slots + history_customers)],
+        batch_size=batch_size,
+    )
+    finished = dict(is_resolved=True, is_resolved_approved=True, is_closed=True, is_closed_approved=True)
+    old_tickets = Ticket.objects.bulk_create(
+        [Ticket(customer=c, **finished) for c in customers[slots:] for _ in range(history_tickets)],
+        batch_size=batch_size,
+    )
+    for start in range(0, len(old_tickets), batch_size):
+        chunk = old_tickets[start:start + batch_size]
+        CustomerMessage.objects.bulk_create(
+            [CustomerMessage(customer_id=t.customer_id, ticket=t, message_text=f"bench message {i}", is_forwarded=True)
+             for t in chunk for i in range(history_messages)],
+            batch_size=batch_size,
+        )
+        AgentMessage.objects.bulk_create(
+            [AgentMessage(agent=agents[t.id % slots], customer_id=t.customer_id, ticket=t, message_text=f"bench reply {i}")
+             for t in chunk for i in range(history_messages)],
+            batch_size=batch_size,
+        )
+    tickets = Ticket.objects.bulk_create([Ticket(customer=c) for c in customers[:slots]], batch_size=batch_size)
+    return [(t.id, a.telegram_id) for t, a in zip(tickets, agents)]
+
+
+def cleanup():
+    customers = Customer.objects.filter(telegram_id__gte=BENCH_ID_BASE, telegram_id__lt=BENCH_ID_BASE + 100_000_000)
+    agents = Agent.objects.filter(telegram_id__gte=BENCH_AGENT_BASE, telegram_id__lt=BENCH_AGENT_BASE + 100_000_000)
+    events.purge(customers, agents)
+
+
+def prepare(slots, state):
+    """Put every slot's ticket into `state` (bulk, untimed)."""
+    ticket_ids = [tid for tid, _ in slots]
+    fields = dict(state)
+    if fields.get('agent') is True:
+        del fields['agent']
+        Ticket.objects.filter(id__in=ticket_ids).update(**fields)
+        agent_pk = dict(Agent.objects.filter(telegram_id__in=[a for _, a in slots]).values_list('telegram_id', 'pk'))
+        for tid, agent_tid in slots:
+            Ticket.objects.filter(id=tid).update(agent_id=agent_pk[agent_tid])
+    else:
+        Ticket.objects.filter(id__in=ticket_ids).update(**fields)
+
+
+def _run_chunk(call, chunk):
+    timings, errors = [], 0
+    try:
+        for tid, agent_tid in chunk:
+            started = time.perf_counter()
+            try:
+                result = call(tid, agent_tid)
+                ok = result.get("status") == "success"
+            except Exception:
+                ok = False
+            timings.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+    return timings, errors
+
+
+def summarize(timings, errors, wall):
+    ordered = sorted(timings)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))] * 1000, 3) if ordered else None
+
+    return {
+        'calls': len(timings),
+        'errors': errors,
+        'wall_s': round(wall, 4),
+        'ops_per_s': round(len(timings) / wall, 1) if wall else None,
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3) if timings else None,
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+    }
+
+
+def _timed(call, items, threads):
+    chunks = [items[i::threads] for i in range(threads)]
+    started = time.perf_counter()
+    if threads == 1:
+        results = [_run_chunk(call, items)]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(lambda chunk: _run_chunk(call, chunk), chunks))
+    wall = time.perf_counter() - started
+    timings = [t for chunk_timings, _ in results for t in chunk_timings]
+    return summarize(timings, sum(e for _, e in results), wall)
+
+
+def bench_transition(name, slots, threads=1):
+    state, call = TRANSITIONS[name]
+    prepare(slots, state)
+    with override_settings(ADMIN_IDS=[BENCH_ADMIN_ID]):
+        return _timed(call, slots, threads)
+
+
+def bench_message_writes(slots, threads=20, per_thread=100, queued=False):
+    """
+    Insert CustomerMessage rows for the slot tickets from `threads` threads at
+    once, directly or through the bot.writer queue. ops_per_s is messages/s.
+    """
+    customer_ids = dict(Ticket.objects.filter(id__in=[tid for tid, _ in slots]).values_list('id', 'customer_id'))
+    items = [(tid, customer_ids[tid]) for tid, _ in slots]
+    total = threads * per_thread
+    items = (items * (total // len(items) + 1))[:total]
+
+    def call(ticket_id, customer_id):
+        writer.create(CustomerMessage, customer_id=customer_id, ticket_id=ticket_id, message_text="bench write")
+        return {"status": "success"}
+
+    with override_settings(WRITE_QUEUE=queued):
+        try:
+            return _timed(call, items, threads)
+        finally:
+            writer.shutdown()
+
+
+def run(slots, thread_counts=(1,), names=None):
+    results = {}
+    for name in names or TRANSITIONS:
+        results[name] = {str(n): bench_transition(name, slots, n) for n in thread_counts}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def metadata(**seed_options):
+    return {
+        'commit': git_commit(),
+        'timestamp': timezone.now().isoformat(),
+        'vendor': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'db_options': {k: str(v) for k, v in settings.DATABASES['default'].get('OPTIONS', {}).items()},
+        'seed': seed_options,
+    }
+
+
+def compare(current, baseline):
+    """Yield (transition, threads, baseline p50, current p50, change %) rows."""
+    for name, by_threads in current['results'].items():
+        for threads, stats in by_threads.items():
+            old = baseline.get('results', {}).get(name, {}).get(threads)
+            if not old or not old.get('p50_ms') or stats.get('p50_ms') is None:
+                continue
+            change = (stats['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+            yield name, threads, old['p50_ms'], stats['p50_ms'], round(change, 1)
@@ -2,7 +2,7 @@ from telebot.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardBut
 from django.conf import settings
 from agents.models import Agent, AgentMessage
 from tickets.models import Ticket
-from customers.models import CustomerMessage
+from customers.models import Broadcast, CustomerMessage
 from tickets.views import (
     claim_ticket,
     resolve_ticket,
@@ -15,14 +15,146 @@ from tickets.views import (
     handle_ticket,
     close_ticket_finally,
 )
+from django.db import connection
 from django.utils import timezone
-from utils import sanitize_text, get_agent_active_ticket
+from utils import sanitize_text, get_agent_active_ticket, iter_conversation_history
+from bot import jobs, routing, writer
+from tickets import banners, metrics, search
+from customers import broadcast
 import logging
 import datetime
+import itertools
+import threading
+import time
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+STATS_MAX_DAYS = 90
+
+def _format_duration(seconds):
+    if seconds is None:
+        return "n/a"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {secs}s" if minutes else f"{secs}s"
+
+def format_stats(summary, agent_names):
+    totals = summary['totals']
+    window = "last 24 hours" if summary['days'] <= 1 else f"last {summary['days']} days"
+    lines = [
+        f"📊 Support stats, {window}",
+        f"Claims: {totals['claims']} (avg wait {_format_duration(totals['avg_claim_wait'])})",
+        f"Resolved: {totals['resolutions']}, Closed: {totals['closures']} "
+        f"(avg handle {_format_duration(totals['avg_handle'])})",
+        f"Approved: {totals['approvals']}, Declined: {totals['declines']} "
+        f"(avg approval {_format_duration(totals['avg_approval_wait'])})",
+    ]
+    if summary['agents']:
+        lines.append("")
+        lines.append("Per agent:")
+        ranked = sorted(summary['agents'].items(), key=lambda item: -(item[1]['resolutions'] + item[1]['closures']))
+        for agent_id, row in ranked:
+            lines.append(
+                f"• {agent_names.get(agent_id) or f'Agent {agent_id:03d}'}: {row['claims']} claimed, "
+                f"{row['resolutions'] + row['closures']} done, avg handle {_format_duration(row['avg_handle'])}"
+            )
+    return "\n".join(lines)
+
+ESCALATION_LIST_MAX = 20
+
+def escalate_unclaimed(bot, minutes):
+    """
+    Remind the admins of tickets left unclaimed for `minutes` since they were
+    opened or raised (run by the maintenance scheduler, every `minutes`).
+    Returns how many tickets are waiting.
+    """
+    now = timezone.now()
+    waiting = Ticket.objects.filter(
+        is_claimed=False, is_resolved_approved=False, is_closed_approved=False,
+        last_updated__lte=now - datetime.timedelta(minutes=minutes),
+    ).order_by('last_updated')
+    count = waiting.count()
+    if not count:
+        return 0
+    lines = [f"⏰ {count} ticket(s) unclaimed for over {minutes} min:"]
+    for ticket_id, since in waiting.values_list('id', 'last_updated')[:ESCALATION_LIST_MAX]:
+        lines.append(f"• Ticket #{ticket_id}, waiting {_format_duration((now - since).total_seconds())}")
+    if count > ESCALATION_LIST_MAX:
+        lines.append(f"…and {count - ESCALATION_LIST_MAX} more")
+    for admin_id in settings.ADMIN_IDS:
+        try:
+            bot.send_message(admin_id, "\n".join(lines))
+        except Exception as e:
+            logger.warning("Could not send unclaimed-ticket reminder to admin %s: %s", admin_id, e)
+    logger.info("Reminded admins of %d unclaimed ticket(s)", count)
+    return count
+
+def send_history(bot, ticket, telegram_id, role):
+    """Stream the customer's conversation history to `telegram_id`, oldest first."""
+    forwarded = 0
+    for sent_at, sender, content in iter_conversation_history(ticket.customer):
+        if not forwarded:
+            bot.send_message(telegram_id, f"📜 Conversation history for Ticket #{ticket.id}:")
+        label = f"📨 {sender}:"
+        content = sanitize_text(content or "[Media Message]")
+        bot.send_message(telegram_id, f"{label}\n{content}\n\nSent at: {sent_at}")
+        forwarded += 1
+    if forwarded:
+        logger.info("Forwarded %s messages for ticket %s to %s %s", forwarded, ticket.id, role, telegram_id)
+        # Mark customer messages as forwarded now that the history has been sent
+        CustomerMessage.objects.filter(customer=ticket.customer).update(is_forwarded=True)
+    else:
+        bot.send_message(telegram_id, "ℹ️ No previous messages were found.")
+        logger.info("No previous messages found for ticket %s for %s %s", ticket.id, role, telegram_id)
+    return forwarded
+
+SEARCH_QUERIES_KEPT = 256  # /search queries whose paging buttons keep working
+
+SEARCH_SOURCE_LABELS = {
+    'customer': "👤 Customer",
+    'agent': "👨‍💼 Agent",
+    'customer_archive': "👤 Customer (archived)",
+    'agent_archive': "👨‍💼 Agent (archived)",
+}
+
+def format_search_results(terms, hits, page, per_page):
+    if not hits:
+        return f"🔎 No messages match \"{terms}\"." if page == 1 else "🔎 No more results."
+    first = (page - 1) * per_page + 1
+    lines = [f"🔎 Results {first}–{first + len(hits) - 1} for \"{terms}\":"]
+    for number, hit in enumerate(hits, start=first):
+        when = f" · {hit.sent_at:%Y-%m-%d %H:%M}" if hit.sent_at else ""
+        ticket = f" · Ticket #{hit.ticket_id}" if hit.ticket_id else ""
+        lines.append("")
+        lines.append(f"{number}. {SEARCH_SOURCE_LABELS[hit.source]} · Customer ID:{int(hit.customer_id):03d}{ticket}{when}")
+        lines.append(sanitize_text(hit.snippet))
+    return "\n".join(lines)
+
+def _search_markup(query_id, page, has_more):
+    buttons = []
+    if page > 1:
+        buttons.append(InlineKeyboardButton("◀ Prev", callback_data=f"searchpage_{query_id}_{page - 1}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton("Next ▶", callback_data=f"searchpage_{query_id}_{page + 1}"))
+    if not buttons:
+        return None
+    markup = InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
+
 def register_ticket_handlers(bot):
+    # Terms of the last SEARCH_QUERIES_KEPT /search commands by query id, which
+    # the paging buttons carry (callback_data is capped at 64 bytes)
+    search_queries = OrderedDict()
+    search_ids = itertools.count(1)
+    search_lock = threading.Lock()
+
+    def _can_search(telegram_id):
+        return telegram_id in settings.ADMIN_IDS or Agent.objects.filter(telegram_id=telegram_id).exists()
+
     @bot.message_handler(commands=['resolve_ticket'])
     def handle_resolve_ticket_cmd(message: Message):
         agent_tid = message.from_user.id
@@ -33,8 +165,9 @@ def register_ticket_handlers(bot):
         if not ticket:
             bot.reply_to(message, "⚠️ You have no active ticket to resolve.")
             return
-        prompt = bot.send_message(message.chat.id, "📝 Please enter the resolution summary for this ticket:")
-        bot.register_next_step_handler(prompt, _resolve_collect_summary, ticket_id=ticket.id, agent_tid=agent_tid)
+        # Register before prompting so a fast reply can't reach the generic agent handler first
+        bot.register_next_step_handler_by_chat_id(message.chat.id, _resolve_collect_summary, ticket_id=ticket.id, agent_tid=agent_tid)
+        bot.send_message(message.chat.id, "📝 Please enter the resolution summary for this ticket:")
 
     def _resolve_collect_summary(msg: Message, ticket_id: int, agent_tid: int):
         summary = (msg.text or "").strip()
@@ -44,9 +177,9 @@ def register_ticket_handlers(bot):
         result = resolve_ticket(ticket_id, agent_tid, summary)
         if result["status"] != "success":
             bot.reply_to(msg, f"❌ {result['message']}")
-            logger.error(f"Failed to resolve ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to resolve ticket %s: %s", ticket_id, result['message'])
             return
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = result["ticket"]
         bot.send_message(agent_tid, f"✅ Ticket #{ticket.id} marked as *resolved* (pending admin approval).", parse_mode="Markdown")
         markup = InlineKeyboardMarkup()
         markup.add(
@@ -62,9 +195,9 @@ def register_ticket_handlers(bot):
                     "Approve or decline:",
                     reply_markup=markup
                 )
-                logger.info(f"Sent resolution approval request for ticket {ticket.id} to admin {admin_id}")
+                logger.info("Sent resolution approval request for ticket %s to admin %s", ticket.id, admin_id)
             except Exception as e:
-                logger.error(f"Failed to notify admin {admin_id} for ticket {ticket.id}: {e}")
+                logger.error("Failed to notify admin %s for ticket %s: %s", admin_id, ticket.id, e)
 
     @bot.message_handler(commands=['close_ticket'])
     def handle_close_ticket_cmd(message: Message):
@@ -76,8 +209,9 @@ def register_ticket_handlers(bot):
         if not ticket:
             bot.reply_to(message, "⚠️ You have no active ticket to close.")
             return
-        prompt = bot.send_message(message.chat.id, "📝 Please enter the closure summary for this ticket:")
-        bot.register_next_step_handler(prompt, _close_collect_summary, ticket_id=ticket.id, agent_tid=agent_tid)
+        # Register before prompting so a fast reply can't reach the generic agent handler first
+        bot.register_next_step_handler_by_chat_id(message.chat.id, _close_collect_summary, ticket_id=ticket.id, agent_tid=agent_tid)
+        bot.send_message(message.chat.id, "📝 Please enter the closure summary for this ticket:")
 
     def _close_collect_summary(msg: Message, ticket_id: int, agent_tid: int):
         summary = (msg.text or "").strip()
@@ -87,9 +221,9 @@ def register_ticket_handlers(bot):
         result = close_ticket(ticket_id, agent_tid, summary)
         if result["status"] != "success":
             bot.reply_to(msg, f"❌ {result['message']}")
-            logger.error(f"Failed to close ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to close ticket %s: %s", ticket_id, result['message'])
             return
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = result["ticket"]
         bot.send_message(agent_tid, f"✅ Ticket #{ticket.id} marked as *closed* (pending admin approval).", parse_mode="Markdown")
         markup = InlineKeyboardMarkup()
         markup.add(
@@ -105,9 +239,141 @@ def register_ticket_handlers(bot):
                     "Approve or decline:",
                     reply_markup=markup
                 )
-                logger.info(f"Sent closure approval request for ticket {ticket.id} to admin {admin_id}")
+                logger.info("Sent closure approval request for ticket %s to admin %s", ticket.id, admin_id)
             except Exception as e:
-                logger.error(f"Failed to notify admin {admin_id} for ticket {ticket.id}: {e}")
+                logger.error("Failed to notify admin %s for ticket %s: %s", admin_id, ticket.id, e)
+
+    @bot.message_handler(commands=['stats'])
+    def handle_stats_cmd(message: Message):
+        """/stats [days]: agent throughput and timings from the rollup tables (admins only)."""
+        if message.from_user.id not in settings.ADMIN_IDS:
+            bot.reply_to(message, "🚫 This command is for admins only.")
+            return
+        args = (message.text or "").split()[1:]
+        try:
+            days = min(max(int(args[0]), 1), STATS_MAX_DAYS) if args else 7
+        except ValueError:
+            bot.reply_to(message, "⚠️ Usage: /stats [days]")
+            return
+        summary = metrics.summarize(days)
+        names = {
+            agent.id: agent.full_name
+            for agent in Agent.objects.filter(id__in=list(summary['agents'])).only('id', 'full_name')
+        }
+        bot.send_message(message.chat.id, format_stats(summary, names))
+
+    def _run_broadcast(broadcast_id, chat_id, status_message_id):
+        """Send a broadcast from a background thread, editing the admin's status message as it goes."""
+        last_report = [0.0]
+
+        def report(progress):
+            if time.monotonic() - last_report[0] < settings.BROADCAST_REPORT_SECONDS:
+                return
+            last_report[0] = time.monotonic()
+            try:
+                bot.edit_message_text(broadcast.format_progress(progress), chat_id, status_message_id)
+            except Exception as e:
+                logger.warning("Broadcast #%s progress report failed: %s", broadcast_id, e)
+
+        try:
+            result = broadcast.run_broadcast(broadcast_id, bot, progress=report)
+            bot.send_message(
+                chat_id,
+                f"📣 Broadcast #{result.id} {result.status}: {result.sent} sent, "
+                f"{result.blocked} blocked, {result.failed} failed.",
+            )
+        except broadcast.BroadcastUnavailable as e:
+            bot.send_message(chat_id, f"⚠️ {e}.")
+        except Exception:
+            logger.exception("Broadcast #%s crashed", broadcast_id)
+            bot.send_message(
+                chat_id, f"❌ Broadcast #{broadcast_id} stopped. Continue it with /broadcast_resume {broadcast_id}",
+            )
+        finally:
+            connection.close()  # this thread's own connection
+
+    def _start_broadcast(message, broadcast_id):
+        status = bot.send_message(message.chat.id, f"📣 Broadcast #{broadcast_id} starting…")
+        threading.Thread(
+            target=_run_broadcast, args=(broadcast_id, message.chat.id, status.message_id),
+            name=f"Broadcast-{broadcast_id}", daemon=True,
+        ).start()
+
+    @bot.message_handler(commands=['broadcast'])
+    def handle_broadcast_cmd(message: Message):
+        """/broadcast <text>: send an announcement to every customer (admins only)."""
+        if message.from_user.id not in settings.ADMIN_IDS:
+            bot.reply_to(message, "🚫 This command is for admins only.")
+            return
+        parts = (message.text or "").split(maxsplit=1)
+        if len(parts) < 2:
+            bot.reply_to(message, "⚠️ Usage: /broadcast <message to every customer>")
+            return
+        item = Broadcast.objects.create(text=parts[1], created_by=message.from_user.id)
+        _start_broadcast(message, item.id)
+
+    @bot.message_handler(commands=['broadcast_resume', 'broadcast_cancel'])
+    def handle_broadcast_control_cmd(message: Message):
+        """/broadcast_resume <id>, /broadcast_cancel <id> (admins only)."""
+        if message.from_user.id not in settings.ADMIN_IDS:
+            bot.reply_to(message, "🚫 This command is for admins only.")
+            return
+        command, _, arg = (message.text or "").partition(" ")
+        try:
+            broadcast_id = int(arg)
+        except ValueError:
+            bot.reply_to(message, f"⚠️ Usage: {command.split('@')[0]} <broadcast id>")
+            return
+        if command.startswith("/broadcast_cancel"):
+            done = broadcast.cancel(broadcast_id)
+            bot.reply_to(message, f"🛑 Broadcast #{broadcast_id} cancelled." if done
+                         else f"⚠️ Broadcast #{broadcast_id} is not pending or running.")
+            return
+        _start_broadcast(message, broadcast_id)
+
+    @bot.message_handler(commands=['search'])
+    def handle_search_cmd(message: Message):
+        """/search <terms>: ranked full-text search over past conversations (agents and admins)."""
+        user_id = message.from_user.id
+        if not _can_search(user_id):
+            bot.reply_to(message, "🚫 This command is for registered agents only.")
+            return
+        terms = (message.text or "").partition(" ")[2].strip()
+        if not terms:
+            bot.reply_to(message, "⚠️ Usage: /search <words>  (end a word with * to match prefixes)")
+            return
+        with search_lock:
+            query_id = next(search_ids)
+            search_queries[query_id] = terms
+            while len(search_queries) > SEARCH_QUERIES_KEPT:
+                search_queries.popitem(last=False)
+        per_page = settings.SEARCH_PAGE_SIZE
+        hits, has_more = search.search_messages(terms, page=1, per_page=per_page)
+        bot.send_message(
+            message.chat.id,
+            format_search_results(terms, hits, 1, per_page),
+            reply_markup=_search_markup(query_id, 1, has_more),
+        )
+
+    @bot.callback_query_handler(func=lambda call: call.data.startswith("searchpage_"))
+    def handle_search_page(call: CallbackQuery):
+        user_id = call.from_user.id
+        _, query_id, page = call.data.split("_")
+        with search_lock:
+            terms = search_queries.get(int(query_id))
+        if terms is None or not _can_search(user_id):
+            bot.answer_callback_query(call.id, "⚠️ This search has expired. Run /search again.", show_alert=True)
+            return
+        page = int(page)
+        per_page = settings.SEARCH_PAGE_SIZE
+        hits, has_more = search.search_messages(terms, page=page, per_page=per_page)
+        bot.answer_callback_query(call.id)
+        bot.edit_message_text(
+            format_search_results(terms, hits, page, per_page),
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=_search_markup(int(query_id), page, has_more),
+        )
 
     @bot.message_handler(func=lambda message: Agent.objects.filter(telegram_id=message.from_user.id).exists())
     def handle_agent_message(message: Message):
@@ -121,7 +387,8 @@ def register_ticket_handlers(bot):
             agent = Agent.objects.get(telegram_id=agent_tid)
             message_text = message.text or "[No text provided]"
             sent_at = datetime.datetime.fromtimestamp(message.date, tz=datetime.timezone.utc)
-            AgentMessage.objects.create(
+            writer.create(
+                AgentMessage,
                 ticket=ticket,
                 agent=agent,
                 customer=ticket.customer,
@@ -130,7 +397,7 @@ def register_ticket_handlers(bot):
                 telegram_message_id=message.message_id,
                 sent_at=sent_at
             )
-            logger.info(f"Agent message saved for ticket {ticket.id} from agent {agent_tid}: {message_text}")
+            logger.info("Agent message saved for ticket %s from agent %s", ticket.id, agent_tid, extra={"body": message_text})
             label = f"👨‍💼 Agent {int(agent.pk):03d}"
             if message.content_type == 'text':
                 bot.send_message(
@@ -157,9 +424,41 @@ def register_ticket_handlers(bot):
                 )
             bot.reply_to(message, "✅ Message sent to customer.")
         except Exception as e:
-            logger.error(f"Failed to save or forward agent message for ticket {ticket.id}: {e}")
+            logger.error("Failed to save or forward agent message for ticket %s: %s", ticket.id, e)
             bot.reply_to(message, f"❌ Failed to send message: {str(e)}")
 
+    # ---- answer-first callbacks ------------------------------------------
+    # A callback's ticket transition commits, the button is answered at once,
+    # and the notifications and history replay run as a tracked job (bot.jobs)
+    # that reports back by editing the button's message.
+
+    def _complete_in_background(call, ticket, action, notify, report, markup=None, progress=None):
+        """
+        Run notify() as job "<action> #<ticket>", then edit the button's message
+        to `report` (and `markup`), noting any failure. With `progress`, the
+        message shows it, without buttons, while the job runs.
+        """
+        chat_id, message_id = call.message.chat.id, call.message.message_id
+
+        def run():
+            if progress:
+                bot.edit_message_text(f"{report}\n\n{progress}", chat_id, message_id, reply_markup=None)
+            notify()
+
+        def done(job):
+            text = report if job.state == 'done' else f"{report}\n\n⚠️ Notifications failed: {job.error}"
+            bot.edit_message_text(text, chat_id, message_id, reply_markup=markup)
+
+        jobs.submit(f"{action} #{ticket.id}", run, on_done=done)
+
+    def _edit_banner(call, first_line):
+        """Put `first_line` above the button message's original text (or caption, for media) and drop its buttons."""
+        message = call.message
+        media = getattr(message, "content_type", "") in banners.MEDIA
+        banners.edit(
+            bot, message.chat.id, message.message_id, media, message.caption if media else message.text, first_line,
+        )
+
     @bot.callback_query_handler(func=lambda call: call.data.startswith("claim_"))
     def handle_claim_ticket(call: CallbackQuery):
         ticket_id = int(call.data.split("_")[1])
@@ -168,82 +467,33 @@ def register_ticket_handlers(bot):
         result = claim_ticket(ticket_id, user_id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to claim ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to claim ticket %s: %s", ticket_id, result['message'])
             return
 
         ticket = result["ticket"]
         agent = result["agent"]
+        bot.answer_callback_query(call.id, f"✅ Ticket #{ticket.id} is yours. History is on its way to your private chat.")
+        claimed_line = f"📩 Ticket #{ticket.id} claimed by Agent {int(agent.pk):03d}"
 
-        # 1) Remove inline buttons first (works for both text and media)
-        try:
-            bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
-        except Exception:
-            logger.warning(f"Failed to remove reply markup for ticket {ticket_id}")
+        def forward():
+            # Banner edit also removes the Claim/Preview buttons
+            try:
+                _edit_banner(call, f"{claimed_line}\n⏳ Forwarding conversation history…")
+            except Exception as e:
+                logger.warning("Failed to edit message/caption for ticket %s: %s", ticket_id, e)
+            bot.send_message(
+                agent.telegram_id,
+                f"✅ You’ve claimed Ticket #{ticket.id}.\n\nForwarding conversation history now..."
+            )
+            send_history(bot, ticket, agent.telegram_id, "agent")
 
-        # 2) Edit banner depending on message type (caption vs text)
-        try:
-            claimed_line = f"📩 Ticket #{ticket.id} claimed by Agent {int(agent.pk):03d}"
-            content_type = getattr(call.message, "content_type", "")
-
-            if content_type in ("photo", "document", "video", "animation", "audio", "voice"):
-                # Media messages must use caption editing
-                original_caption = getattr(call.message, "caption", "") or ""
-                new_caption = sanitize_text(f"{claimed_line}\n\n{original_caption}".strip())
-                bot.edit_message_caption(
-                    chat_id=call.message.chat.id,
-                    message_id=call.message.message_id,
-                    caption=new_caption
-                )
+        def report(job):
+            if job.state == 'done':
+                _edit_banner(call, claimed_line)
             else:
-                # Plain text message
-                original_text = call.message.text or ""
-                new_text = sanitize_text(f"{claimed_line}\n\n{original_text}".strip())
-                bot.edit_message_text(
-                    new_text,
-                    call.message.chat.id,
-                    call.message.message_id
-                )
-        except Exception as e:
-            logger.warning(f"Failed to edit message/caption for ticket {ticket_id}: {e}")
-
-        # 3) Notify agent that they claimed the ticket
-        bot.send_message(
-            agent.telegram_id,
-            f"✅ You’ve claimed Ticket #{ticket.id}.\n\nForwarding conversation history now..."
-        )
-
-        # 4) Send conversation history to the claiming agent
-        customer_messages = CustomerMessage.objects.filter(
-            customer=ticket.customer
-        ).order_by("sent_at")
-
-        agent_messages = AgentMessage.objects.filter(
-            ticket__customer=ticket.customer
-        ).order_by("sent_at")
+                _edit_banner(call, f"{claimed_line}\n⚠️ Forwarding the history failed: {job.error}")
 
-        # Combine and sort by timestamp
-        all_messages = [
-            (msg.sent_at, f"Customer {int(ticket.customer.pk):03d}", msg.message_text)
-            for msg in customer_messages
-        ] + [
-            (msg.sent_at, f"Agent {int(msg.agent.pk):03d} (Ticket #{msg.ticket_id})", msg.message_text)
-            for msg in agent_messages
-        ]
-        all_messages.sort(key=lambda x: x[0])
-
-        if all_messages:
-            bot.send_message(agent.telegram_id, f"📜 Conversation history for Ticket #{ticket.id}:")
-            for sent_at, sender, content in all_messages:
-                label = f"📨 {sender}:"
-                content = sanitize_text(content or "[Media Message]")
-                bot.send_message(agent.telegram_id, f"{label}\n{content}\n\nSent at: {sent_at}")
-            logger.info(f"Forwarded {len(all_messages)} messages for ticket {ticket_id} to agent {agent.telegram_id}")
-
-            # Mark customer messages as forwarded now that the agent has the history
-            customer_messages.update(is_forwarded=True)
-        else:
-            bot.send_message(agent.telegram_id, "ℹ️ No previous messages were found.")
-            logger.info(f"No previous messages found for ticket {ticket_id} for agent {agent.telegram_id}")
+        jobs.submit(f"claim #{ticket.id}", forward, on_done=report)
 
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("preview_"))
@@ -251,14 +501,14 @@ def register_ticket_handlers(bot):
         ticket_id = int(call.data.split("_")[1])
         user_id = call.from_user.id
         try:
-            ticket = Ticket.objects.get(id=ticket_id)
+            ticket = Ticket.objects.select_related('customer').get(id=ticket_id)
         except Ticket.DoesNotExist:
             bot.answer_callback_query(call.id, "❌ Ticket not found.", show_alert=True)
-            logger.error(f"Ticket {ticket_id} not found for preview by user {user_id}")
+            logger.error("Ticket %s not found for preview by user %s", ticket_id, user_id)
             return
         if not Agent.objects.filter(telegram_id=user_id).exists():
             bot.answer_callback_query(call.id, "🚫 This action is for registered agents only.", show_alert=True)
-            logger.warning(f"Non-agent {user_id} attempted to preview ticket {ticket_id}")
+            logger.warning("Non-agent %s attempted to preview ticket %s", user_id, ticket_id)
             return
         queued_messages = CustomerMessage.objects.filter(
             customer=ticket.customer,
@@ -266,9 +516,10 @@ def register_ticket_handlers(bot):
             is_forwarded=False
         ).order_by("sent_at")
 
-        if not queued_messages.exists():
+        queued_messages = list(queued_messages)
+        if not queued_messages:
             bot.send_message(user_id, f"ℹ️ No queued messages for Ticket #{ticket.id}.")
-            logger.info(f"No queued messages found for ticket {ticket_id} preview by agent {user_id}")
+            logger.info("No queued messages found for ticket %s preview by agent %s", ticket_id, user_id)
             return
         preview_text = f"📬 Queued Messages for Ticket #{ticket.id}:\n\n"
         for i, msg in enumerate(queued_messages, 1):
@@ -278,10 +529,10 @@ def register_ticket_handlers(bot):
             preview_text += f"{label}\n{content}\n\n"
         try:
             bot.send_message(user_id, preview_text, parse_mode="Markdown")
-            logger.info(f"Sent preview of {queued_messages.count()} messages for ticket {ticket_id} to agent {user_id}")
+            logger.info("Sent preview of %s messages for ticket %s to agent %s", len(queued_messages), ticket_id, user_id)
             bot.answer_callback_query(call.id, "✅ Messages previewed. Check your private chat.")
         except Exception as e:
-            logger.error(f"Failed to send preview for ticket {ticket_id} to agent {user_id}: {e}")
+            logger.error("Failed to send preview for ticket %s to agent %s: %s", ticket_id, user_id, e)
             bot.answer_callback_query(call.id, f"❌ Failed to preview messages: {str(e)}", show_alert=True)
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("approve_resolved_"))
@@ -290,11 +541,13 @@ def register_ticket_handlers(bot):
         result = approve_ticket_resolution(ticket_id, call.from_user.id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to approve resolution for ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to approve resolution for ticket %s: %s", ticket_id, result['message'])
             return
-        try:
-            ticket = Ticket.objects.get(id=ticket_id)
-            agent_telegram_id = result.get("agent_telegram_id")
+        bot.answer_callback_query(call.id, "✅ Resolution approved.")
+        ticket = result["ticket"]
+        agent_telegram_id = result.get("agent_telegram_id")
+
+        def notify():
             # Notify customer
             bot.send_message(
                 ticket.customer.telegram_id,
@@ -302,7 +555,7 @@ def register_ticket_handlers(bot):
                 f"This ticket is now closed, but can be reopened if you send further messages.",
                 parse_mode="Markdown"
             )
-            logger.info(f"Notified customer {ticket.customer.telegram_id} of resolution approval for ticket {ticket_id}")
+            logger.info("Notified customer %s of resolution approval for ticket %s", ticket.customer.telegram_id, ticket_id)
             # Notify agent if available
             if agent_telegram_id:
                 bot.send_message(
@@ -311,39 +564,21 @@ def register_ticket_handlers(bot):
                     f"You are no longer assigned to this ticket.",
                     parse_mode="Markdown"
                 )
-                logger.info(f"Notified agent {agent_telegram_id} of resolution approval and unlinking for ticket {ticket_id}")
+                logger.info("Notified agent %s of resolution approval and unlinking for ticket %s", agent_telegram_id, ticket_id)
             else:
-                logger.warning(f"No agent Telegram ID available for resolution approval notification of ticket {ticket_id}")
-            # Update admin message with action buttons
-            # new_markup = InlineKeyboardMarkup()
-            # new_markup.add(
-            #     InlineKeyboardButton("📬 Raise Ticket", callback_data=f"raise_ticket_{ticket.id}"),
-            #     InlineKeyboardButton("🤝 Handle Ticket", callback_data=f"handle_ticket_{ticket.id}"),
-            #     InlineKeyboardButton("🔒 Close Ticket Finally", callback_data=f"close_finally_{ticket.id}")
-            # )
-            # bot.edit_message_text(
-            #     f"✅ Ticket #{ticket.id} resolution approved by admin. Agent unlinked.\n\nChoose next action:",
-            #     call.message.chat.id,
-            #     call.message.message_id,
-            #     reply_markup=new_markup
-            # )
-            # bot.answer_callback_query(call.id, "✅ Resolution approved. Choose next action.")
-            # Update admin message — only offer Final Close (no Raise / Handle after resolution)
-            new_markup = InlineKeyboardMarkup()
-            new_markup.add(
-                InlineKeyboardButton("🔒 Close Ticket Finally", callback_data=f"close_finally_{ticket.id}")
-            )
-            bot.edit_message_text(
-                f"✅ Ticket #{ticket.id} resolution approved by admin. Agent unlinked.\n\n"
-                f"You can permanently close this ticket if desired:",
-                call.message.chat.id,
-                call.message.message_id,
-                reply_markup=new_markup
-            )
-            bot.answer_callback_query(call.id, "✅ Resolution approved.")
-        except Exception as e:
-            logger.error(f"Failed to notify or update for resolution approval of ticket {ticket_id}: {e}")
-            bot.answer_callback_query(call.id, f"✅ Resolution approved, but notification failed: {str(e)}", show_alert=True)
+                logger.warning("No agent Telegram ID available for resolution approval notification of ticket %s", ticket_id)
+
+        # Update admin message — only offer Final Close (no Raise / Handle after resolution)
+        new_markup = InlineKeyboardMarkup()
+        new_markup.add(
+            InlineKeyboardButton("🔒 Close Ticket Finally", callback_data=f"close_finally_{ticket.id}")
+        )
+        _complete_in_background(
+            call, ticket, "approve resolution", notify,
+            f"✅ Ticket #{ticket.id} resolution approved by admin. Agent unlinked.\n\n"
+            f"You can permanently close this ticket if desired:",
+            new_markup,
+        )
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("decline_resolved_"))
     def cb_decline_resolved(call: CallbackQuery):
@@ -351,18 +586,20 @@ def register_ticket_handlers(bot):
         result = decline_ticket_resolution(ticket_id, call.from_user.id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to decline resolution for ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to decline resolution for ticket %s: %s", ticket_id, result['message'])
             return
-        try:
-            ticket = Ticket.objects.get(id=ticket_id)
-            agent_telegram_id = result.get("agent_telegram_id")
+        bot.answer_callback_query(call.id, "✅ Resolution declined.")
+        ticket = result["ticket"]
+        agent_telegram_id = result.get("agent_telegram_id")
+
+        def notify():
             # Notify customer
             bot.send_message(
                 ticket.customer.telegram_id,
                 f"📩 Your Ticket #{ticket.id} resolution was declined by an admin. The assigned agent will continue assisting you.",
                 parse_mode="Markdown"
             )
-            logger.info(f"Notified customer {ticket.customer.telegram_id} of resolution decline for ticket {ticket_id}")
+            logger.info("Notified customer %s of resolution decline for ticket %s", ticket.customer.telegram_id, ticket_id)
             # Notify agent if available
             if agent_telegram_id:
                 bot.send_message(
@@ -370,18 +607,11 @@ def register_ticket_handlers(bot):
                     f"❌ Your resolution for Ticket #{ticket.id} was declined by an admin. Please review and resubmit or continue assisting.",
                     parse_mode="Markdown"
                 )
-                logger.info(f"Notified agent {agent_telegram_id} of resolution decline for ticket {ticket_id}")
-            # Update admin message
-            bot.edit_message_text(
-                f"❌ Ticket #{ticket.id} resolution declined by admin.",
-                call.message.chat.id,
-                call.message.message_id,
-                reply_markup=None
-            )
-            bot.answer_callback_query(call.id, "✅ Resolution declined.")
-        except Exception as e:
-            logger.error(f"Failed to notify for resolution decline of ticket {ticket_id}: {e}")
-            bot.answer_callback_query(call.id, f"✅ Resolution declined, but notification failed: {str(e)}", show_alert=True)
+                logger.info("Notified agent %s of resolution decline for ticket %s", agent_telegram_id, ticket_id)
+
+        _complete_in_background(
+            call, ticket, "decline resolution", notify, f"❌ Ticket #{ticket.id} resolution declined by admin.",
+        )
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("approve_closed_"))
     def cb_approve_closed(call: CallbackQuery):
@@ -389,11 +619,13 @@ def register_ticket_handlers(bot):
         result = approve_ticket_closure(ticket_id, call.from_user.id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to approve closure for ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to approve closure for ticket %s: %s", ticket_id, result['message'])
             return
-        try:
-            ticket = Ticket.objects.get(id=ticket_id)
-            agent_telegram_id = result.get("agent_telegram_id")
+        bot.answer_callback_query(call.id, "✅ Closure approved. Choose next action.")
+        ticket = result["ticket"]
+        agent_telegram_id = result.get("agent_telegram_id")
+
+        def notify():
             # Notify customer
             bot.send_message(
                 ticket.customer.telegram_id,
@@ -401,7 +633,7 @@ def register_ticket_handlers(bot):
                 f"This ticket is now closed, but can be reopened if you send further messages.",
                 parse_mode="Markdown"
             )
-            logger.info(f"Notified customer {ticket.customer.telegram_id} of closure approval for ticket {ticket_id}")
+            logger.info("Notified customer %s of closure approval for ticket %s", ticket.customer.telegram_id, ticket_id)
             # Notify agent if available
             if agent_telegram_id:
                 bot.send_message(
@@ -410,26 +642,22 @@ def register_ticket_handlers(bot):
                     f"You are no longer assigned to this ticket.",
                     parse_mode="Markdown"
                 )
-                logger.info(f"Notified agent {agent_telegram_id} of closure approval and unlinking for ticket {ticket_id}")
+                logger.info("Notified agent %s of closure approval and unlinking for ticket %s", agent_telegram_id, ticket_id)
             else:
-                logger.warning(f"No agent Telegram ID available for closure approval notification of ticket {ticket_id}")
-            # Update admin message with new options
-            new_markup = InlineKeyboardMarkup()
-            new_markup.add(
-                InlineKeyboardButton("📬 Raise Ticket", callback_data=f"raise_ticket_{ticket.id}"),
-                InlineKeyboardButton("🤝 Handle Ticket", callback_data=f"handle_ticket_{ticket.id}"),
-                InlineKeyboardButton("🔒 Close Ticket Finally", callback_data=f"close_finally_{ticket.id}")
-            )
-            bot.edit_message_text(
-                f"✅ Ticket #{ticket.id} closure approved by admin. Agent unlinked.\n\nChoose next action:",
-                call.message.chat.id,
-                call.message.message_id,
-                reply_markup=new_markup
-            )
-            bot.answer_callback_query(call.id, "✅ Closure approved. Choose next action.")
-        except Exception as e:
-            logger.error(f"Failed to notify or update for closure approval of ticket {ticket_id}: {e}")
-            bot.answer_callback_query(call.id, f"✅ Closure approved, but notification failed: {str(e)}", show_alert=True)
+                logger.warning("No agent Telegram ID available for closure approval notification of ticket %s", ticket_id)
+
+        # Update admin message with new options
+        new_markup = InlineKeyboardMarkup()
+        new_markup.add(
+            InlineKeyboardButton("📬 Raise Ticket", callback_data=f"raise_ticket_{ticket.id}"),
+            InlineKeyboardButton("🤝 Handle Ticket", callback_data=f"handle_ticket_{ticket.id}"),
+            InlineKeyboardButton("🔒 Close Ticket Finally", callback_data=f"close_finally_{ticket.id}")
+        )
+        _complete_in_background(
+            call, ticket, "approve closure", notify,
+            f"✅ Ticket #{ticket.id} closure approved by admin. Agent unlinked.\n\nChoose next action:",
+            new_markup,
+        )
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("decline_closed_"))
     def cb_decline_closed(call: CallbackQuery):
@@ -437,18 +665,20 @@ def register_ticket_handlers(bot):
         result = decline_ticket_closure(ticket_id, call.from_user.id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to decline closure for ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to decline closure for ticket %s: %s", ticket_id, result['message'])
             return
-        try:
-            ticket = Ticket.objects.get(id=ticket_id)
-            agent_telegram_id = result.get("agent_telegram_id")
+        bot.answer_callback_query(call.id, "✅ Closure declined.")
+        ticket = result["ticket"]
+        agent_telegram_id = result.get("agent_telegram_id")
+
+        def notify():
             # Notify customer
             bot.send_message(
                 ticket.customer.telegram_id,
                 f"📩 Your Ticket #{ticket.id} closure was declined by an admin. The assigned agent will continue assisting you.",
                 parse_mode="Markdown"
             )
-            logger.info(f"Notified customer {ticket.customer.telegram_id} of closure decline for ticket {ticket_id}")
+            logger.info("Notified customer %s of closure decline for ticket %s", ticket.customer.telegram_id, ticket_id)
             # Notify agent if available
             if agent_telegram_id:
                 bot.send_message(
@@ -456,18 +686,11 @@ def register_ticket_handlers(bot):
                     f"❌ Your closure for Ticket #{ticket.id} was declined by an admin. Please review and resubmit or continue assisting.",
                     parse_mode="Markdown"
                 )
-                logger.info(f"Notified agent {agent_telegram_id} of closure decline for ticket {ticket_id}")
-            # Update admin message
-            bot.edit_message_text(
-                f"❌ Ticket #{ticket.id} closure declined by admin.",
-                call.message.chat.id,
-                call.message.message_id,
-                reply_markup=None
-            )
-            bot.answer_callback_query(call.id, "✅ Closure declined.")
-        except Exception as e:
-            logger.error(f"Failed to notify for closure decline of ticket {ticket_id}: {e}")
-            bot.answer_callback_query(call.id, f"✅ Closure declined, but notification failed: {str(e)}", show_alert=True)
+                logger.info("Notified agent %s of closure decline for ticket %s", agent_telegram_id, ticket_id)
+
+        _complete_in_background(
+            call, ticket, "decline closure", notify, f"❌ Ticket #{ticket.id} closure declined by admin.",
+        )
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("raise_ticket_"))
     def cb_raise_ticket(call: CallbackQuery):
@@ -475,40 +698,38 @@ def register_ticket_handlers(bot):
         result = raise_ticket(ticket_id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to raise ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to raise ticket %s: %s", ticket_id, result['message'])
             return
-        try:
-            ticket = Ticket.objects.get(id=ticket_id)
+        bot.answer_callback_query(call.id, "✅ Ticket raised.")
+        ticket = result["ticket"]
+
+        def notify():
             # Notify customer
             bot.send_message(
                 ticket.customer.telegram_id,
                 f"📩 Your Ticket #{ticket.id} has been reopened and will be reassigned to a new agent.",
                 parse_mode="Markdown"
             )
-            logger.info(f"Notified customer {ticket.customer.telegram_id} of ticket raise for {ticket_id}")
+            logger.info("Notified customer %s of ticket raise for %s", ticket.customer.telegram_id, ticket_id)
             # Post to support group
             markup = InlineKeyboardMarkup()
             markup.add(
                 InlineKeyboardButton("🎫 Claim Ticket", callback_data=f"claim_{ticket.id}"),
                 InlineKeyboardButton("👀 Preview Messages", callback_data=f"preview_{ticket.id}")
             )
-            bot.send_message(
-                settings.SUPPORT_CHAT,
+            posted = routing.post(
+                banners.sender(bot.send_message, ticket.id), ticket.customer.language_code,
                 f"📩 Ticket #{ticket.id} reopened for re-claim.\n\nSummary: {sanitize_text(ticket.resolution_summary or ticket.closure_summary or 'No summary provided')}",
                 reply_markup=markup
             )
-            logger.info(f"Posted reopened ticket {ticket_id} to support group {settings.SUPPORT_CHAT}")
-            # Update admin message
-            bot.edit_message_text(
-                f"✅ Ticket #{ticket.id} raised back to support group.",
-                call.message.chat.id,
-                call.message.message_id,
-                reply_markup=None
-            )
-            bot.answer_callback_query(call.id, "✅ Ticket raised.")
-        except Exception as e:
-            logger.error(f"Failed to notify or post for raise of ticket {ticket_id}: {e}")
-            bot.answer_callback_query(call.id, f"✅ Ticket raised, but notification failed: {str(e)}", show_alert=True)
+            if posted is not None:
+                logger.info("Posted reopened ticket %s to support group %s", ticket_id, posted.chat.id)
+            else:
+                logger.info("Queued reopened ticket %s for its support group", ticket_id)
+
+        _complete_in_background(
+            call, ticket, "raise", notify, f"✅ Ticket #{ticket.id} raised back to support group.",
+        )
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("handle_ticket_"))
     def cb_handle_ticket(call: CallbackQuery):
@@ -517,62 +738,31 @@ def register_ticket_handlers(bot):
         result = handle_ticket(ticket_id, admin_id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to handle ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to handle ticket %s: %s", ticket_id, result['message'])
             return
-        try:
-            ticket = Ticket.objects.get(id=ticket_id)
+        bot.answer_callback_query(call.id, "✅ Ticket handled by you. History is on its way to your private chat.")
+        ticket = result["ticket"]
+
+        def notify():
             # Notify customer
             bot.send_message(
                 ticket.customer.telegram_id,
                 f"📩 An admin is now handling your Ticket #{ticket.id}.",
                 parse_mode="Markdown"
             )
-            logger.info(f"Notified customer {ticket.customer.telegram_id} of admin handling for ticket {ticket_id}")
+            logger.info("Notified customer %s of admin handling for ticket %s", ticket.customer.telegram_id, ticket_id)
             # Notify admin
             bot.send_message(
                 admin_id,
                 f"✅ You are now assigned to Ticket #{ticket.id}.\n\nForwarding conversation history now..."
             )
-            logger.info(f"Notified admin {admin_id} of assignment for ticket {ticket_id}")
-            # Fetch and combine CustomerMessage and AgentMessage for the ticket's customer
-            customer_messages = CustomerMessage.objects.filter(
-                customer=ticket.customer
-            ).order_by("sent_at")
-            agent_messages = AgentMessage.objects.filter(
-                ticket__customer=ticket.customer
-            ).order_by("sent_at")
-            # Combine messages and sort by sent_at
-            all_messages = [
-                (msg.sent_at, f"Customer {int(msg.customer.pk):03d}", msg.message_text)
-                for msg in customer_messages
-            ] + [
-                (msg.sent_at, f"Agent {int(msg.agent.pk):03d} (Ticket #{msg.ticket_id})", msg.message_text)
-                for msg in agent_messages
-            ]
-            all_messages.sort(key=lambda x: x[0]) # Sort by sent_at
-            if all_messages:
-                bot.send_message(admin_id, f"📜 Conversation history for Ticket #{ticket.id}:")
-                for sent_at, sender, content in all_messages:
-                    label = f"📨 {sender}:"
-                    content = sanitize_text(content or "[Media Message]")
-                    bot.send_message(admin_id, f"{label}\n{content}\n\nSent at: {sent_at}")
-                logger.info(f"Forwarded {len(all_messages)} messages for ticket {ticket_id} to admin {admin_id}")
-                # Mark customer messages as forwarded
-                customer_messages.update(is_forwarded=True)
-            else:
-                bot.send_message(admin_id, "ℹ️ No previous messages were found.")
-                logger.info(f"No previous messages found for ticket {ticket_id} for admin {admin_id}")
-            # Update admin message
-            bot.edit_message_text(
-                f"✅ Ticket #{ticket.id} assigned to you for handling.",
-                call.message.chat.id,
-                call.message.message_id,
-                reply_markup=None
-            )
-            bot.answer_callback_query(call.id, "✅ Ticket handled by you.")
-        except Exception as e:
-            logger.error(f"Failed to notify or forward history for handle of ticket {ticket_id}: {e}")
-            bot.answer_callback_query(call.id, f"✅ Ticket handled, but notification or history forwarding failed: {str(e)}", show_alert=True)
+            logger.info("Notified admin %s of assignment for ticket %s", admin_id, ticket_id)
+            send_history(bot, ticket, admin_id, "admin")
+
+        _complete_in_background(
+            call, ticket, "handle", notify, f"✅ Ticket #{ticket.id} assigned to you for handling.",
+            progress="⏳ Forwarding conversation history…",
+        )
 
     @bot.callback_query_handler(func=lambda call: call.data.startswith("close_finally_"))
     def cb_close_ticket_finally(call: CallbackQuery):
@@ -581,18 +771,20 @@ def register_ticket_handlers(bot):
         result = close_ticket_finally(ticket_id, admin_id)
         if result["status"] != "success":
             bot.answer_callback_query(call.id, f"❌ {result['message']}", show_alert=True)
-            logger.error(f"Failed to permanently close ticket {ticket_id}: {result['message']}")
+            logger.error("Failed to permanently close ticket %s: %s", ticket_id, result['message'])
             return
-        try:
-            ticket = Ticket.objects.get(id=ticket_id)
-            agent_telegram_id = result.get("agent_telegram_id")
+        bot.answer_callback_query(call.id, "✅ Ticket permanently closed.")
+        ticket = result["ticket"]
+        agent_telegram_id = result.get("agent_telegram_id")
+
+        def notify():
             # Notify customer
             bot.send_message(
                 ticket.customer.telegram_id,
                 f"🔒 Your Ticket #{ticket.id} has been permanently closed by an admin.\nSummary: {sanitize_text(ticket.resolution_summary or ticket.closure_summary or 'No summary provided')}",
                 parse_mode="Markdown"
             )
-            logger.info(f"Notified customer {ticket.customer.telegram_id} of final closure for ticket {ticket_id}")
+            logger.info("Notified customer %s of final closure for ticket %s", ticket.customer.telegram_id, ticket_id)
             # Notify original agent if available
             if agent_telegram_id:
                 bot.send_message(
@@ -600,15 +792,8 @@ def register_ticket_handlers(bot):
                     f"🔒 Ticket #{ticket.id} has been permanently closed by an admin.\nSummary: {sanitize_text(ticket.resolution_summary or ticket.closure_summary or 'No summary provided')}",
                     parse_mode="Markdown"
                 )
-                logger.info(f"Notified agent {agent_telegram_id} of final closure for ticket {ticket_id}")
-            # Update admin message
-            bot.edit_message_text(
-                f"🔒 Ticket #{ticket.id} permanently closed by admin.",
-                call.message.chat.id,
-                call.message.message_id,
-                reply_markup=None
-            )
-            bot.answer_callback_query(call.id, "✅ Ticket permanently closed.")
-        except Exception as e:
-            logger.error(f"Failed to notify for final closure of ticket {ticket_id}: {e}")
-            bot.answer_callback_query(call.id, f"✅ Ticket closed, but notification failed: {str(e)}", show_alert=True)
\ No newline at end of file
+                logger.info("Notified agent %s of final closure for ticket %s", agent_telegram_id, ticket_id)
+
+        _complete_in_background(
+            call, ticket, "close finally", notify, f"🔒 Ticket #{ticket.id} permanently closed by admin.",
+        )
@@ -0,0 +1,87 @@
+# tickets/events.py
+"""
+Append-only ticket event log.
+
+Every lifecycle transition in tickets/views.py (and ticket creation in
+utils.get_or_create_active_ticket) appends one TicketEvent inside the same
+transaction as the state change, so the log and the Ticket row never
+disagree. Reporting reads the projections built from this log
+(tickets/projections.py) and the analytics rollups (tickets/metrics.py)
+instead of scanning the live tables.
+"""
+from django.utils import timezone
+
+from tickets import metrics
+from tickets.models import (
+    AgentDailyStats, AgentHourlyStats, AgentSummary, TicketEvent, TicketMetrics, TicketSummary,
+)
+
+CREATED = 'created'
+CLAIMED = 'claimed'
+RESOLVED = 'resolved'
+CLOSED = 'closed'
+RESOLUTION_APPROVED = 'resolution_approved'
+RESOLUTION_DECLINED = 'resolution_declined'
+CLOSURE_APPROVED = 'closure_approved'
+CLOSURE_DECLINED = 'closure_declined'
+RAISED = 'raised'
+HANDLED = 'handled'
+CLOSED_FINALLY = 'closed_finally'
+RELEASED = 'released'  # claim dropped by the stale-ticket sweeper
+
+_UNSET = object()
+
+
+def record_event(ticket, kind, actor=None, agent_id=_UNSET, **data):
+    """
+    Append a `kind` event for `ticket`. `agent_id` defaults to the agent on the
+    ticket right now, so call it before the view unlinks the agent (or pass the
+    new agent when the transition assigns one). Extra keyword arguments are
+    stored in the event's JSON `data`. The ticket's metrics and the agent's
+    rollups are updated in the same transaction.
+    """
+    event = TicketEvent.objects.create(
+        ticket_id=ticket.pk,
+        customer_id=ticket.customer_id,
+        agent_id=ticket.agent_id if agent_id is _UNSET else agent_id,
+        actor_telegram_id=actor,
+        kind=kind,
+        data=data,
+    )
+    metrics.apply_event(event, opened_at=ticket.created_at)
+    return event
+
+
+def record_bulk(rows, kind, actor=None, **data):
+    """
+    Set-based record_event() for bulk admin actions: `rows` are (ticket_id,
+    customer_id, agent_id) tuples. One INSERT for the events and one UPDATE for
+    their metrics, whatever the number of tickets.
+    """
+    now = timezone.now()
+    created = TicketEvent.objects.bulk_create([
+        TicketEvent(
+            ticket_id=ticket_id, customer_id=customer_id, agent_id=agent_id,
+            actor_telegram_id=actor, kind=kind, created_at=now, data=data,
+        )
+        for ticket_id, customer_id, agent_id in rows
+    ])
+    metrics.apply_bulk(kind, [ticket_id for ticket_id, _, _ in rows], now)
+    return created
+
+
+def purge(customers, agents):
+    """
+    Delete `customers` and `agents` (querysets), with their tickets and
+    messages, for tools that create throwaway data (loadtest, benchmarks).
+    The event log and the reporting tables have no foreign keys, so their
+    rows are deleted explicitly.
+    """
+    customer_ids, agent_ids = customers.values('id'), agents.values('id')
+    TicketEvent.objects.filter(customer_id__in=customer_ids).delete()
+    TicketSummary.objects.filter(customer_id__in=customer_ids).delete()
+    TicketMetrics.objects.filter(customer_id__in=customer_ids).delete()
+    for model in (AgentSummary, AgentHourlyStats, AgentDailyStats):
+        model.objects.filter(agent_id__in=agent_ids).delete()
+    customers.delete()
+    agents.delete()
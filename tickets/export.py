@@ -0,0 +1,246 @@
+# tickets/export.py
+"""
+Streaming transcript export for audits (manage.py export_transcripts).
+
+Tickets are read in id order, and their messages as four cursors (live and
+archived, customer and agent side), each ordered by (ticket_id, sent_at, id)
+and read with .iterator(chunk_size). heapq.merge interleaves the four into
+one stream, which is then cut into one group per ticket. Memory stays at a
+few chunks whatever the size of the export, and because tickets are written
+in id order the resume checkpoint is just the last ticket id written plus
+the output file's size at that point.
+"""
+import csv
+import heapq
+import json
+import logging
+import os
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter, itemgetter
+
+from django.db.models import Max
+
+from agents.models import AgentMessage, ArchivedAgentMessage
+from customers.models import ArchivedCustomerMessage, CustomerMessage
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl', 'text')
+
+# (model, sender); agent-side tables also carry agent_id
+MESSAGE_SOURCES = (
+    (CustomerMessage, 'customer'),
+    (ArchivedCustomerMessage, 'customer'),
+    (AgentMessage, 'agent'),
+    (ArchivedAgentMessage, 'agent'),
+)
+
+TICKET_FIELDS = (
+    'id', 'customer_id', 'customer__telegram_id', 'agent_id', 'created_at', 'is_claimed',
+    'is_resolved', 'is_resolved_approved', 'is_closed', 'is_closed_approved',
+)
+
+CSV_COLUMNS = (
+    'ticket_id', 'customer_id', 'sender', 'agent_id', 'message_id', 'sent_at', 'message_type', 'message_text',
+)
+
+TranscriptMessage = namedtuple('TranscriptMessage', 'ticket_id sent_at id message_type message_text agent_id sender')
+
+
+def _tagged(rows, sender):
+    for row in rows:
+        yield TranscriptMessage(*row[:5], row[5] if sender == 'agent' else None, sender)
+
+
+def iter_messages(tickets, chunk_size=2000):
+    """All messages of `tickets` (a Ticket queryset), ordered by ticket, then time."""
+    streams = []
+    for model, sender in MESSAGE_SOURCES:
+        columns = ['ticket_id', 'sent_at', 'id', 'message_type', 'message_text']
+        if sender == 'agent':
+            columns.append('agent_id')
+        rows = model.objects.filter(ticket__in=tickets.values('id')).order_by(
+            'ticket_id', 'sent_at', 'id'
+        ).values_list(*columns).iterator(chunk_size=chunk_size)
+        streams.append(_tagged(rows, sender))
+    previous = None
+    for message in heapq.merge(*streams, key=itemgetter(0, 1, 2)):
+        # a message archived while the export runs can be read from both tables;
+        # both copies sort next to each other, keep the first
+        if previous is not None and (message.sender, message.id) == (previous.sender, previous.id):
+            continue
+        previous = message
+        yield message
+
+
+def iter_transcripts(tickets, chunk_size=2000):
+    """
+    Yield (ticket values dict, messages iterator) for every ticket in id order.
+    Each messages iterator must be consumed before advancing to the next ticket.
+    """
+    last_id = tickets.aggregate(last=Max('id'))['last']
+    if last_id is None:
+        return
+    tickets = tickets.filter(id__lte=last_id)  # ignore tickets opened mid-export
+    groups = groupby(iter_messages(tickets, chunk_size), key=attrgetter('ticket_id'))
+    group = next(groups, None)
+    for ticket in tickets.order_by('id').values(*TICKET_FIELDS).iterator(chunk_size=chunk_size):
+        while group is not None and group[0] < ticket['id']:
+            group = next(groups, None)  # messages of a ticket deleted since the query started
+        if group is not None and group[0] == ticket['id']:
+            yield ticket, group[1]
+            group = next(groups, None)
+        else:
+            yield ticket, iter(())
+
+
+def ticket_state(ticket):
+    if ticket['is_closed_approved'] or ticket['is_resolved_approved']:
+        return 'closed' if ticket['is_closed_approved'] else 'resolved'
+    if ticket['is_closed'] or ticket['is_resolved']:
+        return 'awaiting approval'
+    return 'claimed' if ticket['is_claimed'] else 'open'
+
+
+class _FileWriter:
+    """One output file for the whole export; resuming truncates it to the checkpointed size."""
+
+    def __init__(self, path, offset=None):
+        if offset is None:
+            self.file = open(path, 'w', encoding='utf-8', newline='')
+        else:
+            self.file = open(path, 'r+', encoding='utf-8', newline='')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+
+    def position(self):
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter(_FileWriter):
+    def __init__(self, path, offset=None):
+        super().__init__(path, offset)
+        self.csv = csv.writer(self.file)
+        if offset is None:
+            self.csv.writerow(CSV_COLUMNS)
+
+    def write(self, ticket, messages):
+        count = 0
+        for message in messages:
+            self.csv.writerow((
+                ticket['id'], ticket['customer_id'], message.sender, message.agent_id or '',
+                message.id, message.sent_at.isoformat(), message.message_type, message.message_text,
+            ))
+            count += 1
+        return count
+
+
+class JsonlWriter(_FileWriter):
+    def write(self, ticket, messages):
+        count = 0
+        for message in messages:
+            self.file.write(json.dumps({
+                'ticket_id': ticket['id'],
+                'customer_id': ticket['customer_id'],
+                'sender': message.sender,
+                'agent_id': message.agent_id,
+                'message_id': message.id,
+                'sent_at': message.sent_at.isoformat(),
+                'message_type': message.message_type,
+                'message_text': message.message_text,
+            }, ensure_ascii=False))
+            self.file.write('\n')
+            count += 1
+        return count
+
+
+class TextWriter:
+    """One ticket_<id>.txt per ticket in the `path` directory, rewritten whole on resume."""
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, ticket, messages):
+        count = 0
+        with open(os.path.join(self.path, f"ticket_{ticket['id']}.txt"), 'w', encoding='utf-8') as f:
+            f.write(
+                f"Ticket #{ticket['id']} for Customer {int(ticket['customer_id']):03d} "
+                f"(Telegram {ticket['customer__telegram_id']}), opened {ticket['created_at'].isoformat()}, "
+                f"{ticket_state(ticket)}\n\n"
+            )
+            for message in messages:
+                sender = (
+                    f"Agent {int(message.agent_id):03d}" if message.sender == 'agent'
+                    else f"Customer {int(ticket['customer_id']):03d}"
+                )
+                f.write(f"[{message.sent_at:%Y-%m-%d %H:%M:%S}] {sender}: {message.message_text}\n")
+                count += 1
+        return count
+
+    def position(self):
+        return None
+
+    def close(self):
+        pass
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'text': TextWriter}
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)  # atomic: a crash leaves the previous checkpoint intact
+
+
+def export_transcripts(tickets, fmt, output, chunk_size=2000, checkpoint=None, checkpoint_every=500,
+                       progress=None):
+    """
+    Write the transcripts of `tickets` to `output` (a file, or a directory for
+    'text'). With a `checkpoint` path, progress is saved every
+    `checkpoint_every` tickets and an existing checkpoint for the same output
+    is resumed. `progress(state)` is called at every checkpoint. Returns the
+    final state: tickets and messages written, last ticket id.
+    """
+    state = load_checkpoint(checkpoint)
+    if state and (state['format'], state['output']) != (fmt, output):
+        raise ValueError(f"Checkpoint {checkpoint} belongs to a {state['format']} export to {state['output']}")
+    if state:
+        tickets = tickets.filter(id__gt=state['last_ticket_id'])
+        logger.info("Resuming export to %s after ticket %s", output, state['last_ticket_id'])
+    else:
+        state = {'format': fmt, 'output': output, 'last_ticket_id': 0, 'offset': None,
+                 'tickets': 0, 'messages': 0, 'done': False}
+    writer = WRITERS[fmt](output, offset=state['offset'])
+    try:
+        for ticket, messages in iter_transcripts(tickets, chunk_size):
+            state['messages'] += writer.write(ticket, messages)
+            state['tickets'] += 1
+            state['last_ticket_id'] = ticket['id']
+            if state['tickets'] % checkpoint_every == 0:
+                state['offset'] = writer.position()
+                if checkpoint:
+                    save_checkpoint(checkpoint, state)
+                if progress:
+                    progress(state)
+        state['offset'] = writer.position()
+        state['done'] = True
+        if checkpoint:
+            save_checkpoint(checkpoint, state)
+    finally:
+        writer.close()
+    return state
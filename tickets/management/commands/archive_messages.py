@@ -0,0 +1,36 @@
+# archive_messages.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tickets import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Move messages of tickets finally closed more than N days ago into the archive tables, '
+        'in short batched transactions. Conversation history keeps reading both.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help='Archive tickets finally closed more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches per table')
+        parser.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to reclaim space')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        moved = archive.archive_messages(
+            options['days'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+        )
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        for name, count in moved.items():
+            self.stdout.write(f"{verb} {count} {name} rows")
+        if options['vacuum'] and not options['dry_run']:
+            archive.vacuum()
+            self.stdout.write("Vacuumed")
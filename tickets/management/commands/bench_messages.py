@@ -0,0 +1,46 @@
+# bench_messages.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from tickets import benchmarks
+
+MODES = {'direct': False, 'queued': True}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark concurrent CustomerMessage inserts (messages/s), written directly by each thread '
+        'and through the single-writer queue. Run once per SQLITE_PROFILE to compare journaling settings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=50, help='Open tickets the messages are spread over')
+        parser.add_argument('--threads', type=int, default=20, help='Concurrent writers (runbot uses 20)')
+        parser.add_argument('--per-thread', type=int, default=100, help='Messages inserted by each thread')
+        parser.add_argument('--modes', default='direct,queued', help='Comma-separated: direct, queued')
+        parser.add_argument('--output', help='Write results JSON to this path')
+        parser.add_argument('--keep-data', action='store_true')
+
+    def handle(self, *args, **options):
+        seed_options = {'slots': options['slots'], 'history_customers': 0}
+        slots = benchmarks.seed(**seed_options)
+        results = {'meta': benchmarks.metadata(**seed_options), 'results': {}}
+        try:
+            for mode in options['modes'].split(','):
+                stats = benchmarks.bench_message_writes(
+                    slots, threads=options['threads'], per_thread=options['per_thread'], queued=MODES[mode],
+                )
+                results['results'][mode] = stats
+                self.stdout.write(
+                    f"{mode:7} threads={options['threads']:<3} messages/s={stats['ops_per_s']} "
+                    f"p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms errors={stats['errors']}"
+                )
+        finally:
+            if not options['keep_data']:
+                benchmarks.cleanup()
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
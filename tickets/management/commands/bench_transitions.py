@@ -0,0 +1,60 @@
+# bench_transitions.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the ticket state transitions in tickets/views.py against the configured database '
+        '(SQLite or PostgreSQL). Seeds its own data in a reserved ID range and removes it afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=200, help='Tickets transitioned per measurement')
+        parser.add_argument('--history-customers', type=int, default=1000)
+        parser.add_argument('--history-tickets', type=int, default=3, help='Finished tickets per history customer')
+        parser.add_argument('--history-messages', type=int, default=10, help='Customer and agent messages per ticket')
+        parser.add_argument('--threads', default='1,8', help='Comma-separated thread counts, e.g. 1,4,16')
+        parser.add_argument('--only', help='Comma-separated transition names (default: all)')
+        parser.add_argument('--output', help='Write results JSON to this path')
+        parser.add_argument('--compare', help='Baseline results JSON to compare p50 latencies against')
+        parser.add_argument('--keep-data', action='store_true')
+
+    def handle(self, *args, **options):
+        names = options['only'].split(',') if options['only'] else list(benchmarks.TRANSITIONS)
+        unknown = set(names) - set(benchmarks.TRANSITIONS)
+        if unknown:
+            raise CommandError(f"Unknown transitions: {', '.join(sorted(unknown))}")
+        thread_counts = [int(n) for n in options['threads'].split(',')]
+        seed_options = {k: options[k] for k in ('slots', 'history_customers', 'history_tickets', 'history_messages')}
+
+        self.stdout.write(f"Seeding {seed_options}...")
+        slots = benchmarks.seed(**seed_options)
+        try:
+            results = {'meta': benchmarks.metadata(**seed_options), 'results': {}}
+            for name in names:
+                results['results'][name] = {}
+                for threads in thread_counts:
+                    stats = benchmarks.bench_transition(name, slots, threads)
+                    results['results'][name][str(threads)] = stats
+                    self.stdout.write(
+                        f"{name:28} threads={threads:<3} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms "
+                        f"ops/s={stats['ops_per_s']} errors={stats['errors']}"
+                    )
+        finally:
+            if not options['keep_data']:
+                benchmarks.cleanup()
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)
+            self.stdout.write(f"Compared with {baseline.get('meta', {}).get('commit') or options['compare']}:")
+            for name, threads, old, new, change in benchmarks.compare(results, baseline):
+                self.stdout.write(f"{name:28} threads={threads:<3} p50 {old}ms -> {new}ms ({change:+}%)")
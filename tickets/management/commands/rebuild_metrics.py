@@ -0,0 +1,18 @@
+# rebuild_metrics.py
+from django.core.management.base import BaseCommand
+
+from tickets import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute TicketMetrics and the hourly/daily agent rollups from the ticket event log. '
+        'They are kept up to date on every transition; use this after changing how they are computed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        replayed = metrics.rebuild(options['batch_size'])
+        self.stdout.write(f"Replayed {replayed} events")
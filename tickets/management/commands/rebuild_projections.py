@@ -0,0 +1,27 @@
+# rebuild_projections.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tickets import projections
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold new ticket events into the reporting projections (per-ticket and per-agent summaries), '
+        'starting from each projection\'s checkpoint. With --full, empty them and replay the whole log.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild from the first event')
+        parser.add_argument('--projection', action='append',
+                            choices=[p.name for p in projections.PROJECTIONS],
+                            help='Only this projection (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=settings.PROJECTION_BATCH_SIZE)
+        parser.add_argument('--settle-seconds', type=float, default=settings.PROJECTION_SETTLE_SECONDS,
+                            help='Leave events younger than this for the next run')
+
+    def handle(self, *args, **options):
+        run = projections.rebuild if options['full'] else projections.update_projections
+        applied = run(options['projection'], options['batch_size'], options['settle_seconds'])
+        for name, count in applied.items():
+            self.stdout.write(f"{name}: applied {count} events")
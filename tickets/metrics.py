@@ -0,0 +1,182 @@
+# tickets/metrics.py
+"""
+Support analytics maintained incrementally.
+
+events.record_event() calls apply_event() for every transition, inside the
+transition's transaction. It updates the ticket's TicketMetrics row (time
+to claim, handle time, approval latency) and adds the event's counters and
+durations to the agent's AgentHourlyStats and AgentDailyStats buckets with
+one upsert each. summarize() then reads a bounded number of rollup
+rows (agents x buckets in the window), so /stats and the admin cost the same
+however long the ticket history is.
+"""
+import datetime
+import logging
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from tickets import events
+from tickets.models import AgentDailyStats, AgentHourlyStats, Ticket, TicketEvent, TicketMetrics
+
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = (
+    'claims', 'claim_wait_seconds', 'claim_wait_count', 'resolutions', 'closures',
+    'handle_seconds', 'handle_count', 'approvals', 'declines', 'approval_wait_seconds',
+    'approval_wait_count',
+)
+
+
+def _seconds(start, end):
+    return max((end - start).total_seconds(), 0.0)
+
+
+def apply_event(event, opened_at=None):
+    """Fold one TicketEvent into TicketMetrics and the agent rollups. Call inside the event's transaction."""
+    metrics = TicketMetrics.objects.filter(ticket_id=event.ticket_id).first()
+    if metrics is None:
+        opened_at = opened_at or event.created_at
+        metrics = TicketMetrics(
+            ticket_id=event.ticket_id, customer_id=event.customer_id, opened_at=opened_at, queued_at=opened_at,
+        )
+    at, kind = event.created_at, event.kind
+    stats = {}
+
+    if kind in (events.CLAIMED, events.HANDLED):
+        if metrics.queued_at:
+            stats.update(claim_wait_seconds=_seconds(metrics.queued_at, at), claim_wait_count=1)
+        if metrics.first_claimed_at is None:
+            metrics.first_claimed_at = at
+            metrics.time_to_claim = _seconds(metrics.opened_at, at)
+        metrics.agent_id = event.agent_id
+        metrics.work_started_at = at
+        metrics.queued_at = None
+        metrics.claims += 1
+        stats['claims'] = 1
+    elif kind in (events.RESOLVED, events.CLOSED):
+        metrics.submitted_at = at
+        stats['resolutions' if kind == events.RESOLVED else 'closures'] = 1
+        if metrics.work_started_at:
+            handle = _seconds(metrics.work_started_at, at)
+            metrics.handle_seconds += handle
+            stats.update(handle_seconds=handle, handle_count=1)
+    elif kind in (events.RESOLUTION_APPROVED, events.CLOSURE_APPROVED,
+                  events.RESOLUTION_DECLINED, events.CLOSURE_DECLINED):
+        if metrics.submitted_at:
+            wait = _seconds(metrics.submitted_at, at)
+            metrics.approval_seconds += wait
+            stats.update(approval_wait_seconds=wait, approval_wait_count=1)
+        metrics.submitted_at = None
+        if kind in (events.RESOLUTION_APPROVED, events.CLOSURE_APPROVED):
+            metrics.outcome = 'resolved' if kind == events.RESOLUTION_APPROVED else 'closed'
+            metrics.finished_at = at
+            stats['approvals'] = 1
+        else:
+            metrics.work_started_at = at  # back with the agent
+            metrics.declines += 1
+            stats['declines'] = 1
+    elif kind == events.RAISED:
+        metrics.queued_at = at
+        metrics.outcome = ''
+        metrics.finished_at = None
+        metrics.reopens += 1
+    elif kind == events.CLOSED_FINALLY:
+        metrics.outcome = 'finalized'
+        metrics.finished_at = at
+    elif kind == events.RELEASED:
+        metrics.queued_at = at  # back in the queue; the agent's time on it is not handle time
+        metrics.work_started_at = None
+
+    metrics.save(force_insert=metrics._state.adding)
+    if stats and event.agent_id is not None:
+        hour = timezone.localtime(at, datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+        _bump(AgentHourlyStats, stats, agent_id=event.agent_id, hour=hour)
+        _bump(AgentDailyStats, stats, agent_id=event.agent_id, day=hour.date())
+    return metrics
+
+
+def apply_bulk(kind, ticket_ids, at):
+    """Set-based apply_event() for the kinds that touch no agent rollups (raised, closed finally, released)."""
+    rows = TicketMetrics.objects.filter(ticket_id__in=ticket_ids)
+    if kind == events.RAISED:
+        rows.update(queued_at=at, outcome='', finished_at=None, reopens=F('reopens') + 1)
+    elif kind == events.CLOSED_FINALLY:
+        rows.update(outcome='finalized', finished_at=at)
+    elif kind == events.RELEASED:
+        rows.update(queued_at=at, work_started_at=None)
+    else:
+        raise ValueError(f"{kind} events cannot be applied in bulk")
+
+
+def _bump(model, increments, **key):
+    """
+    Add `increments` to the bucket row identified by `key`, creating it on first
+    use, in a single INSERT ... ON CONFLICT DO UPDATE (SQLite >= 3.24 and
+    PostgreSQL), so concurrent transitions never race on the bucket's creation.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    values = {
+        name: model._meta.get_field(name).get_db_prep_save(value, connection) for name, value in key.items()
+    }
+    values.update({field: increments.get(field, 0) for field in STAT_FIELDS})
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(c) for c in values)}) VALUES ({', '.join(['%s'] * len(values))}) "
+        f"ON CONFLICT ({', '.join(qn(c) for c in key)}) DO UPDATE SET "
+        + ", ".join(f"{qn(c)} = {table}.{qn(c)} + EXCLUDED.{qn(c)}" for c in increments)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, list(values.values()))
+
+
+def summarize(days=7, now=None):
+    """
+    Totals and per-agent figures for the last `days` days: the hourly rollups for
+    a one-day window, the daily rollups otherwise. Averages are in seconds.
+    """
+    now = now or timezone.now()
+    if days <= 1:
+        rows = AgentHourlyStats.objects.filter(hour__gt=now - datetime.timedelta(hours=24))
+    else:
+        since = timezone.localtime(now, datetime.timezone.utc).date() - datetime.timedelta(days=days - 1)
+        rows = AgentDailyStats.objects.filter(day__gte=since)
+    sums = rows.values('agent_id').annotate(**{f'sum_{f}': Sum(f) for f in STAT_FIELDS}).order_by()
+    per_agent = {
+        row['agent_id']: _with_averages({f: row[f'sum_{f}'] for f in STAT_FIELDS})
+        for row in sums
+    }
+    totals = {f: sum(agent[f] for agent in per_agent.values()) for f in STAT_FIELDS}
+    return {'days': days, 'totals': _with_averages(totals), 'agents': per_agent}
+
+
+def _with_averages(row):
+    row['avg_claim_wait'] = row['claim_wait_seconds'] / row['claim_wait_count'] if row['claim_wait_count'] else None
+    row['avg_handle'] = row['handle_seconds'] / row['handle_count'] if row['handle_count'] else None
+    row['avg_approval_wait'] = (
+        row['approval_wait_seconds'] / row['approval_wait_count'] if row['approval_wait_count'] else None
+    )
+    return row
+
+
+def rebuild(batch_size=1000):
+    """Recompute TicketMetrics and the rollups by replaying the whole event log. Returns the events replayed."""
+    replayed = 0
+    with transaction.atomic():
+        for model in (TicketMetrics, AgentHourlyStats, AgentDailyStats):
+            model.objects.all().delete()
+        last_id = 0
+        while True:
+            batch = list(TicketEvent.objects.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                break
+            opened = dict(
+                Ticket.objects.filter(id__in={e.ticket_id for e in batch}).values_list('id', 'created_at')
+            )
+            for event in batch:
+                apply_event(event, opened_at=opened.get(event.ticket_id))
+            replayed += len(batch)
+            last_id = batch[-1].id
+    logger.info("Rebuilt ticket metrics from %d events", replayed)
+    return replayed
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:49
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def supersede_duplicate_active_tickets(apps, schema_editor):
+    """
+    Keep one active ticket per customer (claimed first, then newest) so the
+    constraint can be created. The others are closed as superseded and their
+    customer messages move to the kept ticket.
+    """
+    Ticket = apps.get_model('tickets', 'Ticket')
+    CustomerMessage = apps.get_model('customers', 'CustomerMessage')
+    active = Ticket.objects.filter(is_resolved_approved=False, is_closed_approved=False)
+    duplicated = active.values('customer_id').annotate(n=Count('id')).filter(n__gt=1)
+    for row in duplicated:
+        keep, *others = active.filter(customer_id=row['customer_id']).order_by('-is_claimed', '-created_at', '-id')
+        other_ids = [t.id for t in others]
+        CustomerMessage.objects.filter(ticket_id__in=other_ids).update(ticket_id=keep.id)
+        Ticket.objects.filter(id__in=other_ids).update(
+            is_claimed=False,
+            is_closed=True,
+            is_closed_approved=True,
+            closed_at=timezone.now(),
+            closure_summary=f"Superseded by ticket #{keep.id}",
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0002_agentmessage'),
+        ('customers', '0007_customermessage_ticket'),
+        ('tickets', '0003_ticket_closed_at_ticket_closure_summary_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(supersede_duplicate_active_tickets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ticket',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_closed_approved', False), ('is_resolved_approved', False)), fields=('customer',), name='one_active_ticket_per_customer'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_one_active_ticket_per_customer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentSummary',
+            fields=[
+                ('agent_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('claims', models.PositiveIntegerField(default=0)),
+                ('resolutions', models.PositiveIntegerField(default=0)),
+                ('closures', models.PositiveIntegerField(default=0)),
+                ('approvals', models.PositiveIntegerField(default=0)),
+                ('declines', models.PositiveIntegerField(default=0)),
+                ('handled', models.PositiveIntegerField(default=0)),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectionCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TicketEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('ticket_id', models.BigIntegerField(db_index=True)),
+                ('customer_id', models.BigIntegerField()),
+                ('agent_id', models.BigIntegerField(blank=True, null=True)),
+                ('actor_telegram_id', models.BigIntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('created', 'Created'), ('claimed', 'Claimed'), ('resolved', 'Resolved'), ('closed', 'Closed'), ('resolution_approved', 'Resolution approved'), ('resolution_declined', 'Resolution declined'), ('closure_approved', 'Closure approved'), ('closure_declined', 'Closure declined'), ('raised', 'Raised'), ('handled', 'Handled'), ('closed_finally', 'Closed finally')], max_length=32)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('data', models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TicketSummary',
+            fields=[
+                ('ticket_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('customer_id', models.BigIntegerField(db_index=True)),
+                ('agent_id', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('state', models.CharField(max_length=32)),
+                ('opened_at', models.DateTimeField()),
+                ('first_claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('finalized_at', models.DateTimeField(blank=True, null=True)),
+                ('last_event_at', models.DateTimeField()),
+                ('claims', models.PositiveIntegerField(default=0)),
+                ('resolutions', models.PositiveIntegerField(default=0)),
+                ('closures', models.PositiveIntegerField(default=0)),
+                ('declines', models.PositiveIntegerField(default=0)),
+                ('raises', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.4 on 2026-10-19 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_ticket_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketMetrics',
+            fields=[
+                ('ticket_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('customer_id', models.BigIntegerField(db_index=True)),
+                ('agent_id', models.BigIntegerField(blank=True, null=True)),
+                ('opened_at', models.DateTimeField()),
+                ('queued_at', models.DateTimeField(blank=True, null=True)),
+                ('first_claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('work_started_at', models.DateTimeField(blank=True, null=True)),
+                ('submitted_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('outcome', models.CharField(blank=True, max_length=32)),
+                ('time_to_claim', models.FloatField(blank=True, null=True)),
+                ('handle_seconds', models.FloatField(default=0)),
+                ('approval_seconds', models.FloatField(default=0)),
+                ('claims', models.PositiveIntegerField(default=0)),
+                ('declines', models.PositiveIntegerField(default=0)),
+                ('reopens', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'ticket metrics',
+            },
+        ),
+        migrations.CreateModel(
+            name='AgentDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_id', models.BigIntegerField()),
+                ('claims', models.PositiveIntegerField(default=0)),
+                ('claim_wait_seconds', models.FloatField(default=0)),
+                ('claim_wait_count', models.PositiveIntegerField(default=0)),
+                ('resolutions', models.PositiveIntegerField(default=0)),
+                ('closures', models.PositiveIntegerField(default=0)),
+                ('handle_seconds', models.FloatField(default=0)),
+                ('handle_count', models.PositiveIntegerField(default=0)),
+                ('approvals', models.PositiveIntegerField(default=0)),
+                ('declines', models.PositiveIntegerField(default=0)),
+                ('approval_wait_seconds', models.FloatField(default=0)),
+                ('approval_wait_count', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField()),
+            ],
+            options={
+                'verbose_name_plural': 'agent daily stats',
+                'constraints': [models.UniqueConstraint(fields=('day', 'agent_id'), name='agent_daily_stats_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AgentHourlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_id', models.BigIntegerField()),
+                ('claims', models.PositiveIntegerField(default=0)),
+                ('claim_wait_seconds', models.FloatField(default=0)),
+                ('claim_wait_count', models.PositiveIntegerField(default=0)),
+                ('resolutions', models.PositiveIntegerField(default=0)),
+                ('closures', models.PositiveIntegerField(default=0)),
+                ('handle_seconds', models.FloatField(default=0)),
+                ('handle_count', models.PositiveIntegerField(default=0)),
+                ('approvals', models.PositiveIntegerField(default=0)),
+                ('declines', models.PositiveIntegerField(default=0)),
+                ('approval_wait_seconds', models.FloatField(default=0)),
+                ('approval_wait_count', models.PositiveIntegerField(default=0)),
+                ('hour', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'agent hourly stats',
+                'constraints': [models.UniqueConstraint(fields=('hour', 'agent_id'), name='agent_hourly_stats_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+from django.db import migrations
+
+# table -> (source name, rowid code). Must match tickets/search.py SOURCES.
+SOURCES = {
+    'customers_customermessage': ('customer', 1),
+    'agents_agentmessage': ('agent', 2),
+    'customers_archivedcustomermessage': ('customer_archive', 3),
+    'agents_archivedagentmessage': ('agent_archive', 4),
+}
+
+
+def sqlite_statements():
+    yield (
+        "CREATE VIRTUAL TABLE message_search USING fts5("
+        "message_text, source UNINDEXED, message_id UNINDEXED, customer_id UNINDEXED, "
+        "ticket_id UNINDEXED, sent_at UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    for table, (source, code) in SOURCES.items():
+        columns = "rowid, message_text, source, message_id, customer_id, ticket_id, sent_at"
+        values = f"{{row}}.id * 8 + {code}, {{row}}.message_text, '{source}', {{row}}.id, " \
+                 "{row}.customer_id, {row}.ticket_id, {row}.sent_at"
+        yield f"INSERT INTO message_search ({columns}) SELECT {values.format(row=table)} FROM {table}"
+        yield (
+            f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO message_search ({columns}) VALUES ({values.format(row='new')}); END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM message_search WHERE rowid = old.id * 8 + {code}; END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_update AFTER UPDATE OF message_text, ticket_id ON {table} BEGIN "
+            f"UPDATE message_search SET message_text = new.message_text, ticket_id = new.ticket_id "
+            f"WHERE rowid = old.id * 8 + {code}; END"
+        )
+
+
+def postgresql_statements():
+    for table in SOURCES:
+        yield (
+            f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+            f"(to_tsvector('simple', coalesce(message_text, ''))) STORED"
+        )
+        yield f"CREATE INDEX {table}_search_idx ON {table} USING GIN (search_vector)"
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': sqlite_statements, 'postgresql': postgresql_statements}.get(vendor)
+    for sql in statements() if statements else ():
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for table in SOURCES:
+            for action in ('insert', 'delete', 'update'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_{action}")
+        schema_editor.execute("DROP TABLE IF EXISTS message_search")
+    elif vendor == 'postgresql':
+        for table in SOURCES:
+            schema_editor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_archived_messages'),
+        ('customers', '0008_archived_messages'),
+        ('tickets', '0006_ticket_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_admin_indexes'),
+        ('customers', '0009_admin_indexes'),
+        ('tickets', '0007_message_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['created_at'], name='tickets_tic_created_5dd600_idx'),
+        ),
+    ]
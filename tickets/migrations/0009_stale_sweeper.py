@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0008_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='swept_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ticketevent',
+            name='kind',
+            field=models.CharField(choices=[('created', 'Created'), ('claimed', 'Claimed'), ('resolved', 'Resolved'), ('closed', 'Closed'), ('resolution_approved', 'Resolution approved'), ('resolution_declined', 'Resolution declined'), ('closure_approved', 'Closure approved'), ('closure_declined', 'Closure declined'), ('raised', 'Raised'), ('handled', 'Handled'), ('closed_finally', 'Closed finally'), ('released', 'Released (agent silent)')], max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0009_stale_sweeper'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='banner',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from customers.models import Customer
 from agents.models import Agent
 
@@ -16,6 +17,168 @@ class Ticket(models.Model):
     closed_at = models.DateTimeField(null=True, blank=True)  # Timestamp of when the ticket was closed
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
+    swept_at = models.DateTimeField(null=True, blank=True)  # last re-post or nudge by tickets/sweeper.py
+    banner = models.JSONField(null=True, blank=True)  # latest support-group post with Claim buttons (tickets/banners.py)
+
+    class Meta:
+        constraints = [
+            # At most one ticket per customer that is not finally approved (resolved or closed)
+            models.UniqueConstraint(
+                fields=['customer'],
+                condition=models.Q(is_resolved_approved=False, is_closed_approved=False),
+                name='one_active_ticket_per_customer',
+            ),
+        ]
+        indexes = [models.Index(fields=['created_at'])]  # admin date hierarchy
+
+    def __str__(self):
+        return f"Ticket #{self.id} for Customer {self.customer_id}"
+
+
+class TicketEvent(models.Model):
+    """
+    Append-only log of ticket transitions, written by tickets.events.record_event()
+    in the same transaction as the change. Rows are never updated; ids are
+    plain integers so the log outlives deleted tickets and agents.
+    """
+    KIND_CHOICES = [
+        ('created', 'Created'),
+        ('claimed', 'Claimed'),
+        ('resolved', 'Resolved'),
+        ('closed', 'Closed'),
+        ('resolution_approved', 'Resolution approved'),
+        ('resolution_declined', 'Resolution declined'),
+        ('closure_approved', 'Closure approved'),
+        ('closure_declined', 'Closure declined'),
+        ('raised', 'Raised'),
+        ('handled', 'Handled'),
+        ('closed_finally', 'Closed finally'),
+        ('released', 'Released (agent silent)'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    ticket_id = models.BigIntegerField(db_index=True)
+    customer_id = models.BigIntegerField()
+    agent_id = models.BigIntegerField(null=True, blank=True)  # agent on the ticket when the event happened
+    actor_telegram_id = models.BigIntegerField(null=True, blank=True)  # who triggered it
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    data = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"Ticket #{self.ticket_id} {self.kind} at {self.created_at}"
+
+
+class ProjectionCheckpoint(models.Model):
+    """Last TicketEvent id applied to a projection (tickets/projections.py)."""
+    name = models.CharField(max_length=64, primary_key=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id}"
+
+
+class TicketSummary(models.Model):
+    """Per-ticket projection of TicketEvent; rebuildable with `manage.py rebuild_projections`."""
+    ticket_id = models.BigIntegerField(primary_key=True)
+    customer_id = models.BigIntegerField(db_index=True)
+    agent_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    state = models.CharField(max_length=32)
+    opened_at = models.DateTimeField()
+    first_claimed_at = models.DateTimeField(null=True, blank=True)
+    finalized_at = models.DateTimeField(null=True, blank=True)
+    last_event_at = models.DateTimeField()
+    claims = models.PositiveIntegerField(default=0)
+    resolutions = models.PositiveIntegerField(default=0)
+    closures = models.PositiveIntegerField(default=0)
+    declines = models.PositiveIntegerField(default=0)
+    raises = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Ticket #{self.ticket_id} summary ({self.state})"
+
+
+class AgentSummary(models.Model):
+    """Per-agent projection of TicketEvent; rebuildable with `manage.py rebuild_projections`."""
+    agent_id = models.BigIntegerField(primary_key=True)
+    claims = models.PositiveIntegerField(default=0)
+    resolutions = models.PositiveIntegerField(default=0)
+    closures = models.PositiveIntegerField(default=0)
+    approvals = models.PositiveIntegerField(default=0)  # resolutions/closures approved by an admin
+    declines = models.PositiveIntegerField(default=0)  # resolutions/closures declined by an admin
+    handled = models.PositiveIntegerField(default=0)  # tickets taken over as admin
+    last_event_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Agent {self.agent_id} summary"
+
+
+class TicketMetrics(models.Model):
+    """
+    Per-ticket timings, updated by tickets.metrics.apply_event() in the same
+    transaction as each transition. Durations are in seconds.
+    """
+    ticket_id = models.BigIntegerField(primary_key=True)
+    customer_id = models.BigIntegerField(db_index=True)
+    agent_id = models.BigIntegerField(null=True, blank=True)  # last agent who claimed it
+    opened_at = models.DateTimeField()
+    queued_at = models.DateTimeField(null=True, blank=True)  # created or last raised, while unclaimed
+    first_claimed_at = models.DateTimeField(null=True, blank=True)
+    work_started_at = models.DateTimeField(null=True, blank=True)  # claimed, or handed back by a decline
+    submitted_at = models.DateTimeField(null=True, blank=True)  # last resolve/close awaiting approval
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    outcome = models.CharField(max_length=32, blank=True)  # resolved, closed or finalized
+    time_to_claim = models.FloatField(null=True, blank=True)  # opened -> first claim
+    handle_seconds = models.FloatField(default=0)  # work start -> resolve/close, summed
+    approval_seconds = models.FloatField(default=0)  # resolve/close -> admin decision, summed
+    claims = models.PositiveIntegerField(default=0)
+    declines = models.PositiveIntegerField(default=0)
+    reopens = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'ticket metrics'
+
+    def __str__(self):
+        return f"Ticket #{self.ticket_id} metrics"
+
+
+class AgentStats(models.Model):
+    """Counters and duration totals for one agent over one time bucket; averages are total / count."""
+    agent_id = models.BigIntegerField()
+    claims = models.PositiveIntegerField(default=0)
+    claim_wait_seconds = models.FloatField(default=0)  # how long the tickets they claimed had waited
+    claim_wait_count = models.PositiveIntegerField(default=0)
+    resolutions = models.PositiveIntegerField(default=0)
+    closures = models.PositiveIntegerField(default=0)
+    handle_seconds = models.FloatField(default=0)
+    handle_count = models.PositiveIntegerField(default=0)
+    approvals = models.PositiveIntegerField(default=0)
+    declines = models.PositiveIntegerField(default=0)
+    approval_wait_seconds = models.FloatField(default=0)
+    approval_wait_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class AgentHourlyStats(AgentStats):
+    hour = models.DateTimeField()  # UTC, truncated to the hour
+
+    class Meta:
+        verbose_name_plural = 'agent hourly stats'
+        constraints = [models.UniqueConstraint(fields=['hour', 'agent_id'], name='agent_hourly_stats_unique')]
+
+    def __str__(self):
+        return f"Agent {self.agent_id} @ {self.hour:%Y-%m-%d %H:00}"
+
+
+class AgentDailyStats(AgentStats):
+    day = models.DateField()  # UTC
+
+    class Meta:
+        verbose_name_plural = 'agent daily stats'
+        constraints = [models.UniqueConstraint(fields=['day', 'agent_id'], name='agent_daily_stats_unique')]
 
     def __str__(self):
-        return f"Ticket #{self.id} for Customer {self.customer.id}"
+        return f"Agent {self.agent_id} @ {self.day}"
@@ -0,0 +1,190 @@
+# tickets/projections.py
+"""
+Reporting projections built from the TicketEvent log (tickets/events.py).
+
+Each projection keeps a ProjectionCheckpoint with the last event id it has
+applied. update_projections() reads only the events after that checkpoint,
+folds them into the summary rows in batches and moves the checkpoint forward
+in the same transaction, so an interrupted run resumes where it stopped and
+never applies an event twice. rebuild() empties a projection and replays
+the whole log, e.g. after the folding rules change.
+
+Events younger than PROJECTION_SETTLE_SECONDS are left for the next run:
+ids are assigned at INSERT but become visible at COMMIT, so a slow
+transaction can commit a lower id after a higher one was already applied.
+"""
+import abc
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from tickets import events
+from tickets.models import AgentSummary, ProjectionCheckpoint, TicketEvent, TicketSummary
+
+logger = logging.getLogger(__name__)
+
+# event kind -> TicketSummary.state after it
+TICKET_STATES = {
+    events.CREATED: 'open',
+    events.CLAIMED: 'claimed',
+    events.RESOLVED: 'resolution_pending',
+    events.CLOSED: 'closure_pending',
+    events.RESOLUTION_APPROVED: 'resolved',
+    events.RESOLUTION_DECLINED: 'claimed',
+    events.CLOSURE_APPROVED: 'closed',
+    events.CLOSURE_DECLINED: 'claimed',
+    events.RAISED: 'open',
+    events.HANDLED: 'claimed',
+    events.CLOSED_FINALLY: 'finalized',
+    events.RELEASED: 'open',
+}
+
+# event kind -> counter it increments on the projection row
+TICKET_COUNTERS = {
+    events.CLAIMED: 'claims',
+    events.HANDLED: 'claims',
+    events.RESOLVED: 'resolutions',
+    events.CLOSED: 'closures',
+    events.RESOLUTION_DECLINED: 'declines',
+    events.CLOSURE_DECLINED: 'declines',
+    events.RAISED: 'raises',
+}
+AGENT_COUNTERS = {
+    events.CLAIMED: 'claims',
+    events.RESOLVED: 'resolutions',
+    events.CLOSED: 'closures',
+    events.RESOLUTION_APPROVED: 'approvals',
+    events.CLOSURE_APPROVED: 'approvals',
+    events.RESOLUTION_DECLINED: 'declines',
+    events.CLOSURE_DECLINED: 'declines',
+    events.HANDLED: 'handled',
+}
+
+
+class Projection(abc.ABC):
+    """Folds batches of events (in id order) into one summary table."""
+    name = None
+    model = None
+
+    def reset(self):
+        self.model.objects.all().delete()
+
+    @abc.abstractmethod
+    def apply(self, batch):
+        """Fold `batch` into the summary rows."""
+
+    def _save(self, rows):
+        """Upsert `rows` (unsaved or loaded instances) in one statement."""
+        pk = self.model._meta.pk.name
+        fields = [f.name for f in self.model._meta.concrete_fields if f.name != pk]
+        self.model.objects.bulk_create(rows, update_conflicts=True, unique_fields=[pk], update_fields=fields)
+
+
+class TicketSummaryProjection(Projection):
+    name = 'ticket_summary'
+    model = TicketSummary
+
+    def apply(self, batch):
+        rows = TicketSummary.objects.in_bulk({event.ticket_id for event in batch})
+        for event in batch:
+            row = rows.get(event.ticket_id)
+            if row is None:
+                row = rows[event.ticket_id] = TicketSummary(
+                    ticket_id=event.ticket_id, customer_id=event.customer_id, opened_at=event.created_at,
+                )
+            row.state = TICKET_STATES[event.kind]
+            row.last_event_at = event.created_at
+            if event.kind in (events.CLAIMED, events.HANDLED):
+                row.agent_id = event.agent_id
+                row.first_claimed_at = row.first_claimed_at or event.created_at
+            elif event.kind in (events.RESOLUTION_APPROVED, events.CLOSURE_APPROVED, events.RAISED, events.RELEASED):
+                row.agent_id = None
+            elif event.kind == events.CLOSED_FINALLY:
+                row.agent_id = None
+                row.finalized_at = event.created_at
+            counter = TICKET_COUNTERS.get(event.kind)
+            if counter:
+                setattr(row, counter, getattr(row, counter) + 1)
+        self._save(list(rows.values()))
+
+
+class AgentSummaryProjection(Projection):
+    name = 'agent_summary'
+    model = AgentSummary
+
+    def apply(self, batch):
+        batch = [event for event in batch if event.agent_id is not None and event.kind in AGENT_COUNTERS]
+        rows = AgentSummary.objects.in_bulk({event.agent_id for event in batch})
+        for event in batch:
+            row = rows.get(event.agent_id)
+            if row is None:
+                row = rows[event.agent_id] = AgentSummary(agent_id=event.agent_id)
+            counter = AGENT_COUNTERS[event.kind]
+            setattr(row, counter, getattr(row, counter) + 1)
+            row.last_event_at = event.created_at
+        if rows:
+            self._save(list(rows.values()))
+
+
+PROJECTIONS = [TicketSummaryProjection(), AgentSummaryProjection()]
+
+
+def _get(name):
+    for projection in PROJECTIONS:
+        if projection.name == name:
+            return projection
+    raise KeyError(name)
+
+
+def update_projection(projection, batch_size=1000, settle_seconds=None, deadline=None):
+    """
+    Apply every settled event after the checkpoint. Returns the number applied.
+    Stops between batches once time.monotonic() passes `deadline`.
+    """
+    if settle_seconds is None:
+        settle_seconds = settings.PROJECTION_SETTLE_SECONDS
+    cutoff = timezone.now() - datetime.timedelta(seconds=settle_seconds)
+    applied = 0
+    while True:
+        with transaction.atomic():
+            checkpoint, _ = ProjectionCheckpoint.objects.select_for_update().get_or_create(name=projection.name)
+            batch = list(
+                TicketEvent.objects.filter(id__gt=checkpoint.last_event_id, created_at__lte=cutoff)
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            projection.apply(batch)
+            checkpoint.last_event_id = batch[-1].id
+            checkpoint.save()
+        applied += len(batch)
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+    if applied:
+        logger.info("Projection %s applied %d events", projection.name, applied)
+    return applied
+
+
+def update_projections(names=None, batch_size=1000, settle_seconds=None, deadline=None):
+    """Bring the named projections (default: all) up to date. Returns {name: events applied}."""
+    targets = [_get(name) for name in names] if names else PROJECTIONS
+    return {p.name: update_projection(p, batch_size, settle_seconds, deadline) for p in targets}
+
+
+def rebuild(names=None, batch_size=1000, settle_seconds=None):
+    """Empty the named projections (default: all) and replay the whole event log."""
+    targets = [_get(name) for name in names] if names else PROJECTIONS
+    for projection in targets:
+        with transaction.atomic():
+            projection.reset()
+            ProjectionCheckpoint.objects.update_or_create(name=projection.name, defaults={'last_event_id': 0})
+    return update_projections([p.name for p in targets], batch_size, settle_seconds)
+
+
+def run_scheduled(deadline=None):
+    """Scheduler entry point (bot/scheduler.py): bring every projection up to date."""
+    return update_projections(batch_size=settings.PROJECTION_BATCH_SIZE, deadline=deadline)
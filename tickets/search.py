@@ -0,0 +1,176 @@
+# tickets/search.py
+"""
+Full-text search over customer and agent messages, live and archived.
+
+SQLite: the message_search FTS5 table (migration tickets 0007), kept in sync
+by triggers on the four message tables, so queued bulk inserts, archiving
+and raw updates are all indexed without any Python hook. Its rowid encodes
+the source table and message id (id * 8 + code), so the delete and update
+triggers hit one row instead of scanning.
+
+PostgreSQL: a generated `search_vector` tsvector column with a GIN index on
+each message table, queried with the same 'simple' (no stemming) parsing.
+
+Other backends fall back to icontains.
+"""
+import datetime
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from agents.models import AgentMessage, ArchivedAgentMessage
+from customers.models import ArchivedCustomerMessage, CustomerMessage
+
+# source name -> (model, rowid code). Must match migration tickets 0007.
+SOURCES = {
+    'customer': (CustomerMessage, 1),
+    'agent': (AgentMessage, 2),
+    'customer_archive': (ArchivedCustomerMessage, 3),
+    'agent_archive': (ArchivedAgentMessage, 4),
+}
+
+SearchHit = namedtuple('SearchHit', 'source message_id customer_id ticket_id sent_at snippet')
+
+
+def match_expression(terms):
+    """
+    Turn free text into an FTS5 query: every word is quoted (so FTS operators
+    and punctuation in user input are literal) and all must match. A trailing
+    * keeps prefix matching, e.g. "refund pay*".
+    """
+    words = []
+    for word in terms.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            words.append(f'"{word}"' + ('*' if prefix else ''))
+    return " ".join(words)
+
+
+def search_messages(terms, page=1, per_page=5, customer_id=None):
+    """Ranked matches, best first. Returns (hits for `page`, whether another page exists)."""
+    offset = (page - 1) * per_page
+    if connection.vendor == 'sqlite':
+        hits = _search_sqlite(terms, per_page + 1, offset, customer_id)
+    elif connection.vendor == 'postgresql':
+        hits = _search_postgresql(terms, per_page + 1, offset, customer_id)
+    else:
+        hits = _search_fallback(terms, per_page + 1, offset, customer_id)
+    return hits[:per_page], len(hits) > per_page
+
+
+def matching_ids(source, terms, limit=1000):
+    """Ids of the best `limit` matches in one source table (used by the admin search)."""
+    model, _ = SOURCES[source]
+    if connection.vendor == 'sqlite':
+        expression = match_expression(terms)
+        if not expression:
+            return []
+        sql = (
+            "SELECT message_id FROM message_search WHERE message_search MATCH %s AND source = %s "
+            "ORDER BY rank LIMIT %s"
+        )
+        params = [expression, source, limit]
+    elif connection.vendor == 'postgresql':
+        table = connection.ops.quote_name(model._meta.db_table)
+        sql = (
+            f"SELECT id FROM {table} WHERE search_vector @@ plainto_tsquery('simple', %s) "
+            f"ORDER BY ts_rank(search_vector, plainto_tsquery('simple', %s)) DESC LIMIT %s"
+        )
+        params = [terms, terms, limit]
+    else:
+        return list(model.objects.filter(message_text__icontains=terms).values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_sqlite(terms, limit, offset, customer_id):
+    expression = match_expression(terms)
+    if not expression:
+        return []
+    sql = (
+        "SELECT source, message_id, customer_id, ticket_id, sent_at, "
+        "snippet(message_search, 0, '«', '»', '…', 12) "
+        "FROM message_search WHERE message_search MATCH %s"
+    )
+    params = [expression]
+    if customer_id is not None:
+        sql += " AND customer_id = %s"
+        params.append(customer_id)
+    sql += " ORDER BY rank LIMIT %s OFFSET %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit, offset])
+        rows = cursor.fetchall()
+    return [
+        SearchHit(source, message_id, customer, ticket, _parse_sent_at(sent_at), snippet)
+        for source, message_id, customer, ticket, sent_at, snippet in rows
+    ]
+
+
+def _search_postgresql(terms, limit, offset, customer_id):
+    qn = connection.ops.quote_name
+    selects, params = [], []
+    for source, (model, _) in SOURCES.items():
+        where = "search_vector @@ plainto_tsquery('simple', %s)"
+        params += [terms, terms]  # rank, then where
+        if customer_id is not None:
+            where += " AND customer_id = %s"
+            params.append(customer_id)
+        selects.append(
+            f"SELECT '{source}' AS source, id, customer_id, ticket_id, sent_at, message_text, "
+            f"ts_rank(search_vector, plainto_tsquery('simple', %s)) AS rank "
+            f"FROM {qn(model._meta.db_table)} WHERE {where}"
+        )
+    sql = (
+        "SELECT source, id, customer_id, ticket_id, sent_at, "
+        "ts_headline('simple', message_text, plainto_tsquery('simple', %s), "
+        "'StartSel=«, StopSel=», MaxWords=12, MinWords=4') "
+        f"FROM ({' UNION ALL '.join(selects)}) hits ORDER BY rank DESC, sent_at DESC LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [terms] + params + [limit, offset])
+        return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+def _search_fallback(terms, limit, offset, customer_id):
+    hits = []
+    for source, (model, _) in SOURCES.items():
+        queryset = model.objects.filter(message_text__icontains=terms)
+        if customer_id is not None:
+            queryset = queryset.filter(customer_id=customer_id)
+        for row in queryset.order_by('-sent_at').values(
+            'id', 'customer_id', 'ticket_id', 'sent_at', 'message_text',
+        )[:limit + offset]:
+            hits.append(SearchHit(
+                source, row['id'], row['customer_id'], row['ticket_id'], row['sent_at'], row['message_text'][:120],
+            ))
+    hits.sort(key=lambda hit: hit.sent_at, reverse=True)
+    return hits[offset:offset + limit]
+
+
+def _parse_sent_at(value):
+    """FTS5 columns hold the raw TEXT Django stored; parse it back to an aware UTC datetime."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+class FullTextSearchMixin:
+    """
+    ModelAdmin mixin: the changelist search box uses the full-text index of
+    `search_source` (a SOURCES key) instead of LIKE '%term%' over message_text.
+    """
+    search_source = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        ids = matching_ids(self.search_source, search_term, limit=settings.SEARCH_ADMIN_LIMIT)
+        return queryset.filter(pk__in=ids), False
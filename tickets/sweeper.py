@@ -0,0 +1,230 @@
+# tickets/sweeper.py
+"""
+Stale-ticket sweeper (the `sweep_stale_tickets` maintenance job).
+
+Nothing moves a ticket that nobody claims, or whose agent stops replying:
+it stays active, the customer keeps waiting, and it is never finalized or
+archived. Every STALE_SWEEP_MINUTES the sweeper:
+
+- re-posts tickets unclaimed for STALE_REPOST_MINUTES to their support
+  group (bot.routing) with fresh Claim/Preview buttons (the first post has long scrolled away), and
+  again every STALE_REPOST_MINUTES while nobody claims them;
+- nudges the agent of a claimed ticket with no agent reply for
+  STALE_NUDGE_MINUTES, repeated every STALE_NUDGE_MINUTES of silence;
+- releases the claim after STALE_RELEASE_MINUTES without a reply (a
+  `released` event): the ticket is re-posted and the agent told;
+- finalizes tickets approved as resolved or closed more than
+  STALE_FINALIZE_DAYS ago (views.bulk_close_tickets_finally), which makes
+  them eligible for archiving.
+
+Each step handles at most STALE_BATCH_SIZE tickets per round of set-based
+statements and repeats until nothing is left or the job's deadline passes.
+Re-posts stop early too, once neither the ticket's group nor the fallback
+chat has budget left (routing.try_post); the rest wait for the next sweep.
+Ticket.swept_at holds the last re-post or nudge, so they do not repeat every
+sweep. A threshold of 0 turns its step off.
+"""
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from agents.models import AgentMessage
+from bot import routing
+from tickets import banners, views
+from tickets.models import Ticket
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = Q(is_resolved_approved=False, is_closed_approved=False)
+
+
+def _minutes(minutes):
+    hours, minutes = divmod(int(minutes), 60)
+    if not hours:
+        return f"{minutes} min"
+    return f"{hours} h {minutes} min" if minutes else f"{hours} h"
+
+
+def _claim_markup(ticket_id):
+    markup = InlineKeyboardMarkup()
+    markup.add(
+        InlineKeyboardButton("🎫 Claim Ticket", callback_data=f"claim_{ticket_id}"),
+        InlineKeyboardButton("👀 Preview Messages", callback_data=f"preview_{ticket_id}")
+    )
+    return markup
+
+
+def _send(bot, chat_id, text, **kwargs):
+    try:
+        bot.send_message(chat_id, text, **kwargs)
+        return True
+    except Exception as e:
+        logger.warning("Sweeper message to %s failed: %s", chat_id, e)
+        return False
+
+
+def _post(bot, language, ticket_id, text):
+    """Post `text` with Claim/Preview buttons to the support group for `language`, queued if it has no budget."""
+    try:
+        routing.post(banners.sender(bot.send_message, ticket_id), language, text, reply_markup=_claim_markup(ticket_id))
+        return True
+    except Exception as e:
+        logger.warning("Sweeper post of ticket %s to its support group failed: %s", ticket_id, e)
+        return False
+
+
+def _try_post(bot, language, ticket_id, text):
+    """_post(), but only if some support chat has budget now: True if posted, False if not, None if it failed."""
+    try:
+        return routing.try_post(
+            banners.sender(bot.send_message, ticket_id), language, text, reply_markup=_claim_markup(ticket_id),
+        )
+    except Exception as e:
+        logger.warning("Sweeper post of ticket %s to its support group failed: %s", ticket_id, e)
+        return None
+
+
+def _rounds(select, batch_size, deadline):
+    """Batches from select(batch_size) until one comes back empty or the deadline passes."""
+    while deadline is None or time.monotonic() < deadline:
+        batch = select(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def silent_claims(before):
+    """Claimed tickets still being worked on whose agent has not replied since `before`."""
+    return Ticket.objects.filter(
+        ACTIVE, is_claimed=True, is_resolved=False, is_closed=False, agent__isnull=False, last_updated__lt=before,
+    ).exclude(Exists(AgentMessage.objects.filter(ticket=OuterRef('pk'), sent_at__gte=before)))
+
+
+def repost_unclaimed(bot, minutes, batch_size, deadline=None, now=None):
+    now = now or timezone.now()
+    before = now - datetime.timedelta(minutes=minutes)
+    waiting = Ticket.objects.filter(ACTIVE, is_claimed=False, last_updated__lt=before).filter(
+        Q(swept_at__isnull=True) | Q(swept_at__lt=before)
+    ).order_by('last_updated')
+    reposted, failed = 0, set()
+    columns = ('id', 'customer_id', 'customer__language_code', 'last_updated')
+
+    def select(n):
+        return list(waiting.exclude(id__in=failed).values_list(*columns)[:n])
+
+    for batch in _rounds(select, batch_size, deadline):
+        posted, stopped = [], False
+        for ticket_id, customer_id, language, since in batch:
+            if deadline is not None and time.monotonic() >= deadline:
+                stopped = True
+                break
+            waited = (now - since).total_seconds() // 60
+            result = _try_post(
+                bot, language, ticket_id,
+                f"📩 Ticket #{ticket_id} is still unclaimed after {_minutes(waited)}.\n\nCustomer ID:{int(customer_id):03d}",
+            )
+            if result is None:
+                failed.add(ticket_id)  # tried again next sweep
+            elif not result:
+                stopped = True  # no budget left: next sweep
+                break
+            else:
+                posted.append(ticket_id)
+        Ticket.objects.filter(id__in=posted).update(swept_at=now)
+        reposted += len(posted)
+        if stopped:
+            break
+    return reposted
+
+
+def nudge_silent_agents(bot, minutes, release_minutes, batch_size, deadline=None, now=None):
+    now = now or timezone.now()
+    before = now - datetime.timedelta(minutes=minutes)
+    silent = silent_claims(before).filter(Q(swept_at__isnull=True) | Q(swept_at__lt=before)).order_by('id')
+    release = f" It goes back to the queue after {_minutes(release_minutes)} without a reply." if release_minutes else ""
+    nudged = 0
+    for batch in _rounds(lambda n: list(silent.values_list('id', 'agent__telegram_id')[:n]), batch_size, deadline):
+        Ticket.objects.filter(id__in=[ticket_id for ticket_id, _ in batch]).update(swept_at=now)
+        for ticket_id, agent_telegram_id in batch:
+            nudged += _send(
+                bot, agent_telegram_id,
+                f"⏰ Ticket #{ticket_id} has had no reply from you for {_minutes(minutes)}. "
+                f"Please answer the customer, or resolve or close the ticket.{release}",
+            )
+    return nudged
+
+
+def release_silent_claims(bot, minutes, batch_size, deadline=None, now=None):
+    now = now or timezone.now()
+    before = now - datetime.timedelta(minutes=minutes)
+    silent = silent_claims(before).order_by('id')
+    released = 0
+    columns = ('id', 'agent__telegram_id', 'customer__language_code')
+    for batch in _rounds(lambda n: list(silent.values_list(*columns)[:n]), batch_size, deadline):
+        agents = {ticket_id: (agent_telegram_id, language) for ticket_id, agent_telegram_id, language in batch}
+        rows = views.bulk_release_tickets(list(agents), before, via='sweeper')
+        if not rows:
+            break  # every candidate changed or is locked by a handler: next sweep
+        for ticket_id, customer_id, _ in rows:
+            agent_telegram_id, language = agents[ticket_id]
+            _send(
+                bot, agent_telegram_id,
+                f"🔁 Ticket #{ticket_id} went back to the queue after {_minutes(minutes)} without a reply from you.",
+            )
+            _post(
+                bot, language, ticket_id,
+                f"📩 Ticket #{ticket_id} was released after {_minutes(minutes)} without an agent reply.\n\n"
+                f"Customer ID:{int(customer_id):03d}",
+            )
+        released += len(rows)
+    return released
+
+
+def announce_raised(bot, ticket_ids):
+    """Post tickets raised back to support (the admin's bulk action) to their support groups. Returns how many."""
+    raised = Ticket.objects.filter(id__in=ticket_ids, is_claimed=False).order_by('id')
+    posted = 0
+    for ticket_id, customer_id, language in raised.values_list('id', 'customer_id', 'customer__language_code'):
+        posted += _post(
+            bot, language, ticket_id,
+            f"📩 Ticket #{ticket_id} was raised back to support.\n\nCustomer ID:{int(customer_id):03d}",
+        )
+    return posted
+
+
+def finalize_approved(days, batch_size, deadline=None, now=None):
+    now = now or timezone.now()
+    approved = Ticket.objects.filter(views.APPROVED, last_updated__lt=now - datetime.timedelta(days=days)).exclude(
+        views.FINALIZED
+    ).order_by('id')
+    finalized = 0
+    for batch in _rounds(lambda n: list(approved.values_list('id', flat=True)[:n]), batch_size, deadline):
+        count = views.bulk_close_tickets_finally(batch, via='sweeper')['count']
+        if not count:
+            break
+        finalized += count
+    return finalized
+
+
+def sweep(bot, deadline=None, now=None):
+    """One sweep with the configured thresholds. Returns {step: tickets handled}."""
+    batch = settings.STALE_BATCH_SIZE
+    done = {}
+    if settings.STALE_RELEASE_MINUTES:
+        done['released'] = release_silent_claims(bot, settings.STALE_RELEASE_MINUTES, batch, deadline, now)
+    if settings.STALE_NUDGE_MINUTES:
+        done['nudged'] = nudge_silent_agents(
+            bot, settings.STALE_NUDGE_MINUTES, settings.STALE_RELEASE_MINUTES, batch, deadline, now,
+        )
+    if settings.STALE_REPOST_MINUTES:
+        done['reposted'] = repost_unclaimed(bot, settings.STALE_REPOST_MINUTES, batch, deadline, now)
+    if settings.STALE_FINALIZE_DAYS:
+        done['finalized'] = finalize_approved(settings.STALE_FINALIZE_DAYS, batch, deadline, now)
+    if any(done.values()):
+        logger.info("Stale-ticket sweep: %s", done)
+    return done
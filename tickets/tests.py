@@ -1,3 +1,724 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import telebot
+from telebot import types
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from agents.models import Agent, AgentMessage, ArchivedAgentMessage
+from bot import routing
+from bot.instrumentation import assert_max_queries, instrument
+from customers.models import ArchivedCustomerMessage, Customer, CustomerMessage
+from tickets import archive, assignment, benchmarks, events, export, metrics, projections, search, sweeper, views
+from tickets.bot_handlers import escalate_unclaimed, format_stats, register_ticket_handlers
+from tickets.models import (
+    AgentDailyStats, AgentHourlyStats, AgentSummary, ProjectionCheckpoint, Ticket, TicketEvent, TicketMetrics,
+    TicketSummary,
+)
+from utils import get_or_create_active_ticket, iter_conversation_history
+
+ADMIN_ID = 900001
+
+BOT_API_METHODS = (
+    'send_message', 'reply_to', 'send_photo', 'send_document', 'send_video',
+    'answer_callback_query', 'edit_message_text', 'edit_message_caption',
+    'edit_message_reply_markup',
+)
+
+
+def make_bot(*register):
+    """TeleBot with the Bot API calls mocked out, handlers run inline."""
+    bot = telebot.TeleBot("123456:TEST", threaded=False)
+    for name in BOT_API_METHODS:
+        setattr(bot, name, mock.MagicMock())
+    for register_handlers in register or (register_ticket_handlers,):
+        register_handlers(bot)
+    return bot
+
+
+def make_callback(data, user_id, chat_id=-100):
+    return types.CallbackQuery.de_json({
+        "id": "1",
+        "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+        "chat_instance": "test",
+        "data": data,
+        "message": {
+            "message_id": 10,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "supergroup"},
+            "text": "📩 Customer ID:001",
+        },
+    })
+
+
+def make_message(text, user_id, chat_id=None):
+    return types.Message.de_json({
+        "message_id": 20,
+        "date": 0,
+        "text": text,
+        "chat": {"id": chat_id or user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+    })
+
+
+# Budgets include the row-lock re-check, the TicketEvent insert and the metrics
+# updates each transition makes (views._lock_ticket, events.record_event:
+# TicketMetrics read + write, one upsert per agent rollup table)
+@override_settings(ADMIN_IDS=[ADMIN_ID], SUPPORT_CHAT=-100, SUPPORT_CHAT_RATE_PER_MINUTE=0, JOB_WORKERS=0)
+class HandlerQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=1001, full_name="Customer")
+        self.agents = [Agent.objects.create(telegram_id=2000 + i, full_name=f"Agent {i}") for i in range(3)]
+        old_ticket = Ticket.objects.create(customer=self.customer, is_resolved_approved=True)
+        self.ticket = Ticket.objects.create(customer=self.customer)
+        for i in range(30):
+            CustomerMessage.objects.create(customer=self.customer, ticket=old_ticket, message_text=f"c{i}")
+            AgentMessage.objects.create(
+                agent=self.agents[i % 3], customer=self.customer, ticket=old_ticket, message_text=f"a{i}"
+            )
+        self.bot = make_bot()
+
+    def test_claim_with_history_has_no_n_plus_one(self):
+        with assert_max_queries(17, max_repeats=1):
+            self.bot.process_new_callback_query([make_callback(f"claim_{self.ticket.id}", self.agents[0].telegram_id)])
+        self.ticket.refresh_from_db()
+        self.assertTrue(self.ticket.is_claimed)
+
+    def test_handle_ticket_with_history_has_no_n_plus_one(self):
+        Ticket.objects.filter(id=self.ticket.id).update(is_closed_approved=True)
+        with assert_max_queries(14, max_repeats=1):
+            self.bot.process_new_callback_query([make_callback(f"handle_ticket_{self.ticket.id}", ADMIN_ID)])
+        self.ticket.refresh_from_db()
+        self.assertTrue(self.ticket.is_claimed)
+
+    def test_approve_resolution_does_not_refetch_ticket(self):
+        Ticket.objects.filter(id=self.ticket.id).update(
+            agent=self.agents[0], is_claimed=True, is_resolved=True
+        )
+        with assert_max_queries(14, max_repeats=1):
+            self.bot.process_new_callback_query([make_callback(f"approve_resolved_{self.ticket.id}", ADMIN_ID)])
+        self.ticket.refresh_from_db()
+        self.assertTrue(self.ticket.is_resolved_approved)
+
+
+@override_settings(ADMIN_IDS=[ADMIN_ID], SUPPORT_CHAT=-100, SUPPORT_CHAT_RATE_PER_MINUTE=0, JOB_WORKERS=0)
+class AnswerFirstCallbackTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=1201, full_name="Customer")
+        self.agent = Agent.objects.create(telegram_id=2201, full_name="Agent")
+        self.ticket = Ticket.objects.create(
+            customer=self.customer, agent=self.agent, is_claimed=True, is_resolved=True
+        )
+        self.bot = make_bot()
+        self.calls = mock.Mock()
+        self.calls.attach_mock(self.bot.answer_callback_query, 'answer')
+        self.calls.attach_mock(self.bot.send_message, 'send')
+        self.calls.attach_mock(self.bot.edit_message_text, 'edit')
+
+    def test_button_is_answered_before_notifications(self):
+        self.bot.process_new_callback_query([make_callback(f"approve_resolved_{self.ticket.id}", ADMIN_ID)])
+        self.assertEqual(
+            [name for name, args, kwargs in self.calls.mock_calls], ['answer', 'send', 'send', 'edit']
+        )
+        text = self.bot.edit_message_text.call_args.args[0]
+        self.assertIn("resolution approved", text)
+        self.assertNotIn("failed", text)
+
+    def test_failed_notification_is_reported_on_the_message(self):
+        self.bot.send_message.side_effect = RuntimeError("blocked by user")
+        self.bot.process_new_callback_query([make_callback(f"approve_resolved_{self.ticket.id}", ADMIN_ID)])
+        self.ticket.refresh_from_db()
+        self.assertTrue(self.ticket.is_resolved_approved)
+        self.bot.answer_callback_query.assert_called_once_with("1", "✅ Resolution approved.")
+        self.assertIn("⚠️ Notifications failed: RuntimeError: blocked by user",
+                      self.bot.edit_message_text.call_args.args[0])
+
+
+@override_settings(ADMIN_IDS=[ADMIN_ID])
+class EscalationTests(TestCase):
+    def test_admins_are_reminded_of_unclaimed_tickets(self):
+        waiting = Ticket.objects.create(customer=Customer.objects.create(telegram_id=1301))
+        Ticket.objects.create(customer=Customer.objects.create(telegram_id=1302))  # too recent
+        claimed = Ticket.objects.create(customer=Customer.objects.create(telegram_id=1303), is_claimed=True)
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Ticket.objects.filter(id__in=[waiting.id, claimed.id]).update(last_updated=an_hour_ago)
+        bot = make_bot()
+        self.assertEqual(escalate_unclaimed(bot, minutes=30), 1)
+        bot.send_message.assert_called_once()
+        chat_id, text = bot.send_message.call_args.args
+        self.assertEqual(chat_id, ADMIN_ID)
+        self.assertIn(f"Ticket #{waiting.id}, waiting 1h 0m", text)
+
+
+@override_settings(
+    SUPPORT_CHAT=-100, SUPPORT_CHAT_RATE_PER_MINUTE=0, STALE_REPOST_MINUTES=60, STALE_NUDGE_MINUTES=60,
+    STALE_RELEASE_MINUTES=240, STALE_FINALIZE_DAYS=14, STALE_BATCH_SIZE=2,
+)
+class StaleSweeperTests(TestCase):
+    def ticket(self, telegram_id, age, **state):
+        customer = Customer.objects.create(telegram_id=telegram_id)
+        ticket = Ticket.objects.create(customer=customer, **state)
+        Ticket.objects.filter(id=ticket.id).update(last_updated=timezone.now() - age)
+        return ticket
+
+    def test_sweep(self):
+        agent = Agent.objects.create(telegram_id=2401)
+        unclaimed = self.ticket(1401, timedelta(hours=2))
+        fresh = self.ticket(1402, timedelta(minutes=5))
+        quiet = self.ticket(1403, timedelta(hours=2), agent=agent, is_claimed=True)
+        abandoned = [self.ticket(1404 + i, timedelta(hours=5), agent=agent, is_claimed=True) for i in range(3)]
+        answered = self.ticket(1407, timedelta(hours=5), agent=agent, is_claimed=True)
+        AgentMessage.objects.create(agent=agent, customer=answered.customer, ticket=answered, message_text="hi")
+        approved = self.ticket(1408, timedelta(days=20), agent=agent, is_resolved=True, is_resolved_approved=True)
+        bot = make_bot()
+
+        done = sweeper.sweep(bot)
+
+        self.assertEqual(done, {'released': 3, 'nudged': 1, 'reposted': 1, 'finalized': 1})
+        self.assertEqual(
+            set(Ticket.objects.filter(is_claimed=True).values_list('id', flat=True)), {quiet.id, answered.id}
+        )
+        self.assertEqual(
+            TicketEvent.objects.filter(kind=events.RELEASED).count(), len(abandoned)
+        )
+        approved.refresh_from_db()
+        self.assertTrue(approved.is_closed_approved)
+        chats = [call.args[0] for call in bot.send_message.call_args_list]
+        self.assertEqual(chats.count(-100), len(abandoned) + 1)  # released and unclaimed re-posted
+        self.assertEqual(chats.count(agent.telegram_id), len(abandoned) + 1)  # told of releases, one nudge
+        self.assertNotIn(f"#{fresh.id} ", " ".join(call.args[1] for call in bot.send_message.call_args_list))
+        self.assertIn(f"Ticket #{unclaimed.id} is still unclaimed after 2 h", bot.send_message.call_args_list[-1].args[1])
+
+        bot.send_message.reset_mock()
+        self.assertEqual(sweeper.sweep(bot), {'released': 0, 'nudged': 0, 'reposted': 0, 'finalized': 0})
+        bot.send_message.assert_not_called()
+
+    @override_settings(SUPPORT_ROUTES={'fr': -200})
+    def test_reposts_go_to_the_customers_language_group(self):
+        french = self.ticket(1411, timedelta(hours=2))
+        Customer.objects.filter(id=french.customer_id).update(language_code='fr-CA')
+        english = self.ticket(1412, timedelta(hours=2))
+        bot = make_bot()
+
+        sweeper.repost_unclaimed(bot, 60, 10)
+
+        posts = {call.args[1].split()[2]: call.args[0] for call in bot.send_message.call_args_list}
+        self.assertEqual(posts, {f"#{french.id}": -200, f"#{english.id}": -100})
+
+    def test_reposts_only_what_the_support_group_has_budget_for(self):
+        waiting = [self.ticket(1421 + i, timedelta(hours=2)) for i in range(5)]
+        router = routing.SupportRouter(per_minute=3, max_wait=0, clock=lambda: 0.0, background=False)
+        bot = make_bot()
+
+        with mock.patch.object(routing, 'get_router', return_value=router):
+            self.assertEqual(sweeper.repost_unclaimed(bot, 60, 2), 3)
+
+        self.assertEqual(bot.send_message.call_count, 3)
+        swept = Ticket.objects.filter(swept_at__isnull=False).values_list('id', flat=True)
+        self.assertEqual(set(swept), {ticket.id for ticket in waiting[:3]})
+
+
+@override_settings(SUPPORT_CHAT=-100, SUPPORT_CHAT_RATE_PER_MINUTE=0, JOB_WORKERS=0)
+class AssignmentEngineTests(TestCase):
+    def ticket(self, telegram_id, age, language=None):
+        customer = Customer.objects.create(telegram_id=telegram_id, language_code=language)
+        ticket = Ticket.objects.create(customer=customer)
+        Ticket.objects.filter(id=ticket.id).update(last_updated=timezone.now() - age)
+        return ticket
+
+    def test_assigns_oldest_first_by_language_and_load(self):
+        french = Agent.objects.create(telegram_id=2501, language='fr')
+        busy_english = Agent.objects.create(telegram_id=2502, language='en')
+        idle_english = Agent.objects.create(telegram_id=2503, language='EN')
+        german = Agent.objects.create(telegram_id=2504, language='de')
+        Ticket.objects.create(customer=Customer.objects.create(telegram_id=1501), agent=busy_english, is_claimed=True)
+        TicketEvent.objects.create(ticket_id=0, customer_id=0, agent_id=idle_english.id, kind=events.CLAIMED)
+        old_english = self.ticket(1502, timedelta(minutes=30), 'en-GB')
+        new_english = self.ticket(1503, timedelta(minutes=10), 'en')
+        french_ticket = self.ticket(1504, timedelta(minutes=20), 'fr-CA')
+        portuguese = self.ticket(1505, timedelta(minutes=15), 'pt')
+        just_opened = self.ticket(1506, timedelta(seconds=30))
+        Ticket.objects.filter(id=old_english.id).update(
+            banner={"chat_id": -100, "message_id": 30, "media": False, "text": "📩 Customer ID:002"},
+        )
+        engine = assignment.AssignmentEngine(min_wait=120, away_minutes=60)
+        bot = make_bot()
+
+        self.assertEqual(engine.run(bot), 3)
+
+        owners = dict(Ticket.objects.filter(agent__isnull=False).values_list('id', 'agent_id'))
+        self.assertEqual(owners[old_english.id], idle_english.id)
+        self.assertEqual(owners[french_ticket.id], french.id)
+        self.assertEqual(owners[portuguese.id], german.id)  # nobody speaks it: any idle agent
+        self.assertNotIn(new_english.id, owners)  # both English speakers are busy now
+        self.assertNotIn(just_opened.id, owners)  # still time for a manual claim
+        event = TicketEvent.objects.get(ticket_id=old_english.id, kind=events.CLAIMED)
+        self.assertEqual(event.data['via'], 'assignment')
+        self.assertGreaterEqual(event.data['waited_seconds'], 30 * 60)
+        chats = [call.args[0] for call in bot.send_message.call_args_list]
+        self.assertIn(french.telegram_id, chats)
+        self.assertNotIn(-100, chats)  # the support group's post is edited instead
+        bot.edit_message_text.assert_called_once_with(
+            f"📩 Ticket #{old_english.id} claimed by Agent {idle_english.pk:03d}\n\n📩 Customer ID:002", -100, 30,
+            reply_markup=None,
+        )
+        metrics = engine.metrics()
+        self.assertEqual((metrics['queued'], metrics['assigned']), (2, 3))
+        self.assertGreaterEqual(metrics['recent_wait_max_seconds'], 30 * 60)
+
+    def test_announce_marks_the_latest_support_group_post_claimed(self):
+        agent = Agent.objects.create(telegram_id=2511)
+        ticket = self.ticket(1511, timedelta(hours=2))
+        bot = make_bot()
+        bot.send_message.return_value = types.Message.de_json({
+            "message_id": 40, "date": 0, "chat": {"id": -100, "type": "supergroup"}, "text": "📩 Still unclaimed",
+        })
+        sweeper.repost_unclaimed(bot, 60, 10)
+
+        assignment.announce(bot, ticket, agent)
+
+        bot.edit_message_text.assert_called_once_with(
+            f"📩 Ticket #{ticket.id} claimed by Agent {agent.pk:03d}\n\n📩 Still unclaimed", -100, 40, reply_markup=None,
+        )
+
+    def test_skips_tickets_claimed_by_hand_and_agents_released_as_away(self):
+        away = Agent.objects.create(telegram_id=2511)
+        ticket = self.ticket(1511, timedelta(minutes=30))
+        TicketEvent.objects.create(ticket_id=0, customer_id=0, agent_id=away.id, kind=events.RELEASED)
+        engine = assignment.AssignmentEngine(min_wait=0, away_minutes=60)
+        self.assertEqual(engine.run(make_bot()), 0)
+
+        present = Agent.objects.create(telegram_id=2512)
+        engine.refresh()
+        views.claim_ticket(ticket.id, away.telegram_id)
+        self.assertEqual(engine.run(make_bot()), 0)
+        self.assertEqual(engine.metrics()['queued'], 0)
+        self.assertFalse(Ticket.objects.filter(agent=present).exists())
+
+
+class TransitionLockTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=1101)
+        self.agent = Agent.objects.create(telegram_id=2101)
+        self.ticket = Ticket.objects.create(customer=self.customer)
+
+    def test_lock_rechecks_state_read_before_the_transaction(self):
+        stale = Ticket.objects.get(id=self.ticket.id)
+        Ticket.objects.filter(id=self.ticket.id).update(is_claimed=True, agent=self.agent)
+        with transaction.atomic():
+            self.assertFalse(views._lock_ticket(stale, is_claimed=False))
+            self.assertTrue(views._lock_ticket(stale, is_claimed=True))
+
+    def test_concurrent_claim_is_rejected(self):
+        with mock.patch.object(views, '_lock_ticket', return_value=False):
+            result = views.claim_ticket(self.ticket.id, self.agent.telegram_id)
+        self.assertEqual(result["status"], "error")
+        self.ticket.refresh_from_db()
+        self.assertFalse(self.ticket.is_claimed)
+
+    def test_history_is_merged_in_time_order(self):
+        other = Ticket.objects.create(customer=self.customer, is_resolved_approved=True)
+        base = timezone.now()
+        for minutes, text in ((1, "c1"), (3, "c3")):
+            message = CustomerMessage.objects.create(customer=self.customer, ticket=other, message_text=text)
+            CustomerMessage.objects.filter(id=message.id).update(sent_at=base + timedelta(minutes=minutes))
+        reply = AgentMessage.objects.create(agent=self.agent, customer=self.customer, ticket=other, message_text="a2")
+        AgentMessage.objects.filter(id=reply.id).update(sent_at=base + timedelta(minutes=2))
+        texts = [text for _, _, text in iter_conversation_history(self.customer, chunk_size=1)]
+        self.assertEqual(texts, ["c1", "a2", "c3"])
+
+
+class ActiveTicketConstraintTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=1201)
+
+    def test_second_active_ticket_is_rejected_by_the_database(self):
+        Ticket.objects.create(customer=self.customer)
+        Ticket.objects.create(customer=self.customer, is_closed_approved=True)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ticket.objects.create(customer=self.customer)
+
+    def test_get_or_create_rereads_after_losing_the_race(self):
+        winner = Ticket.objects.create(customer=self.customer)
+        with mock.patch('utils.get_active_ticket_for_customer', side_effect=[None, winner]):
+            ticket, created = get_or_create_active_ticket(self.customer)
+        self.assertFalse(created)
+        self.assertEqual(ticket, winner)
+        self.assertEqual(Ticket.objects.filter(customer=self.customer).count(), 1)
+
+    @override_settings(ADMIN_IDS=[ADMIN_ID])
+    def test_reopening_with_another_active_ticket_fails_cleanly(self):
+        old = Ticket.objects.create(customer=self.customer, is_resolved_approved=True)
+        Ticket.objects.create(customer=self.customer)
+        self.assertEqual(views.raise_ticket(old.id)["status"], "error")
+        self.assertEqual(views.handle_ticket(old.id, ADMIN_ID)["status"], "error")
+        old.refresh_from_db()
+        self.assertTrue(old.is_resolved_approved)
+
+
+class BulkTransitionTests(TestCase):
+    def setUp(self):
+        self.customers = [Customer.objects.create(telegram_id=7300 + i) for i in range(3)]
+        approved = dict(is_resolved=True, is_resolved_approved=True)
+        # Customer 0 has two approved tickets, customer 2 already has an open one
+        self.tickets = [Ticket.objects.create(customer=self.customers[i], **approved) for i in (0, 0, 1, 2)]
+        Ticket.objects.create(customer=self.customers[2])
+
+    def test_raise_skips_customers_that_would_get_two_active_tickets(self):
+        result = views.bulk_raise_tickets([t.id for t in self.tickets], via='admin')
+        self.assertEqual(result['count'], 2)
+        raised = set(Ticket.objects.filter(is_resolved_approved=False, is_claimed=False).values_list('id', flat=True))
+        self.assertIn(self.tickets[1].id, raised)  # the newer of customer 0's tickets
+        self.assertNotIn(self.tickets[0].id, raised)
+        self.assertEqual(TicketEvent.objects.filter(kind=events.RAISED).count(), 2)
+
+    @override_settings(TELEGRAM_BOT_TOKEN="123456:TEST", SUPPORT_CHAT=-100, SUPPORT_CHAT_RATE_PER_MINUTE=0, JOB_WORKERS=0)
+    def test_admin_raise_posts_the_raised_tickets_to_support(self):
+        from tickets.admin import TicketAdmin
+
+        bot = make_bot()
+        model_admin = TicketAdmin(Ticket, admin.site)
+        request = mock.Mock(user=mock.Mock(get_username=lambda: "root"))
+        with mock.patch('tickets.admin._telegram_bot', return_value=bot), \
+                mock.patch.object(model_admin, 'message_user') as message_user:
+            model_admin.raise_tickets(request, Ticket.objects.filter(id__in=[t.id for t in self.tickets]))
+        self.assertIn("Posting them to the support groups", message_user.call_args.args[1])
+        posted = [call.args[1] for call in bot.send_message.call_args_list]
+        self.assertEqual(len(posted), 2)
+        self.assertIn(f"Ticket #{self.tickets[1].id} was raised back to support", posted[0])
+        self.assertEqual(bot.send_message.call_args.args[0], -100)
+        self.assertIn("claim_", bot.send_message.call_args.kwargs['reply_markup'].keyboard[0][0].callback_data)
+
+    def test_close_finally_is_set_based(self):
+        ids = [t.id for t in self.tickets]
+        with assert_max_queries(10):
+            result = views.bulk_close_tickets_finally(ids)
+        self.assertEqual(result['count'], 4)
+        self.assertEqual(Ticket.objects.filter(views.FINALIZED).count(), 4)
+        self.assertEqual(TicketEvent.objects.filter(kind=events.CLOSED_FINALLY).count(), 4)
+        self.assertEqual(views.bulk_close_tickets_finally(ids)['count'], 0)
+
+
+class MessageArchiveTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=1301)
+        self.agent = Agent.objects.create(telegram_id=2301)
+        self.old = Ticket.objects.create(
+            customer=self.customer, is_resolved=True, is_resolved_approved=True, is_closed=True,
+            is_closed_approved=True, closed_at=timezone.now() - timedelta(days=100),
+        )
+        self.current = Ticket.objects.create(customer=self.customer)
+        for i in range(5):
+            CustomerMessage.objects.create(customer=self.customer, ticket=self.old, message_text=f"old {i}")
+            AgentMessage.objects.create(agent=self.agent, customer=self.customer, ticket=self.old, message_text=f"reply {i}")
+        CustomerMessage.objects.create(customer=self.customer, ticket=self.current, message_text="new")
+
+    def test_moves_finalized_ticket_messages_in_batches(self):
+        self.assertEqual(archive.archive_messages(90, dry_run=True), {'CustomerMessage': 5, 'AgentMessage': 5})
+        moved = archive.archive_messages(90, batch_size=2)
+        self.assertEqual(moved, {'CustomerMessage': 5, 'AgentMessage': 5})
+        self.assertEqual(list(CustomerMessage.objects.values_list('message_text', flat=True)), ["new"])
+        self.assertFalse(AgentMessage.objects.exists())
+        self.assertEqual(ArchivedCustomerMessage.objects.filter(ticket=self.old).count(), 5)
+        self.assertEqual(ArchivedAgentMessage.objects.filter(ticket=self.old).count(), 5)
+
+    def test_recent_tickets_are_kept(self):
+        self.assertEqual(archive.archive_messages(101), {'CustomerMessage': 0, 'AgentMessage': 0})
+
+    def test_history_reads_live_and_archived_messages(self):
+        before = [text for _, _, text in iter_conversation_history(self.customer)]
+        archive.archive_messages(90)
+        after = [text for _, _, text in iter_conversation_history(self.customer)]
+        self.assertEqual(sorted(after), sorted(before))
+        self.assertEqual(len(after), 11)
+
+
+@override_settings(ADMIN_IDS=[ADMIN_ID])
+class TicketEventProjectionTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=7001)
+        self.agent = Agent.objects.create(telegram_id=7002)
+        self.ticket, _ = get_or_create_active_ticket(self.customer)
+        views.claim_ticket(self.ticket.id, self.agent.telegram_id)
+        views.resolve_ticket(self.ticket.id, self.agent.telegram_id, "fixed")
+        views.approve_ticket_resolution(self.ticket.id, ADMIN_ID)
+
+    def test_every_transition_is_appended(self):
+        kinds = list(TicketEvent.objects.filter(ticket_id=self.ticket.id).order_by('id').values_list('kind', flat=True))
+        self.assertEqual(kinds, [events.CREATED, events.CLAIMED, events.RESOLVED, events.RESOLUTION_APPROVED])
+        approved = TicketEvent.objects.get(kind=events.RESOLUTION_APPROVED)
+        self.assertEqual((approved.agent_id, approved.actor_telegram_id), (self.agent.id, ADMIN_ID))
+
+    def test_projections_fold_incrementally_from_checkpoint(self):
+        self.assertEqual(projections.update_projections(settle_seconds=0), {'ticket_summary': 4, 'agent_summary': 4})
+        views.raise_ticket(self.ticket.id)
+        self.assertEqual(projections.update_projections(settle_seconds=0), {'ticket_summary': 1, 'agent_summary': 1})
+
+        summary = TicketSummary.objects.get(ticket_id=self.ticket.id)
+        self.assertEqual((summary.state, summary.agent_id, summary.claims, summary.raises), ('open', None, 1, 1))
+        agent = AgentSummary.objects.get(agent_id=self.agent.id)
+        self.assertEqual((agent.claims, agent.resolutions, agent.approvals), (1, 1, 1))
+        self.assertEqual(
+            ProjectionCheckpoint.objects.get(name='ticket_summary').last_event_id,
+            TicketEvent.objects.latest('id').id,
+        )
+
+    def test_rebuild_matches_incremental_result(self):
+        projections.update_projections(settle_seconds=0)
+        before = list(TicketSummary.objects.values())
+        projections.rebuild(settle_seconds=0)
+        self.assertEqual(list(TicketSummary.objects.values()), before)
+
+    def test_unsettled_events_wait_for_the_next_run(self):
+        self.assertEqual(projections.update_projections(settle_seconds=60), {'ticket_summary': 0, 'agent_summary': 0})
+
+
+class TicketMetricsTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+
+    def apply(self, kind, minutes, agent_id=7):
+        event = TicketEvent(
+            ticket_id=1, customer_id=3, agent_id=agent_id, kind=kind,
+            created_at=self.start + timedelta(minutes=minutes),
+        )
+        return metrics.apply_event(event, opened_at=self.start)
+
+    def test_lifecycle_timings_and_rollups(self):
+        self.apply(events.CREATED, 0, agent_id=None)
+        self.apply(events.CLAIMED, 5)
+        self.apply(events.RESOLVED, 25)
+        self.apply(events.RESOLUTION_DECLINED, 30)
+        self.apply(events.CLOSED, 40)
+        ticket = self.apply(events.CLOSURE_APPROVED, 70)
+
+        self.assertEqual((ticket.time_to_claim, ticket.handle_seconds, ticket.approval_seconds), (300, 1800, 2100))
+        self.assertEqual((ticket.outcome, ticket.declines), ('closed', 1))
+        # Events at minutes 5-40 fall in the first hour, the approval in the next
+        self.assertEqual(AgentHourlyStats.objects.get(hour=self.start).closures, 1)
+        self.assertEqual(AgentHourlyStats.objects.count(), 2)
+
+        summary = metrics.summarize(days=1, now=self.start + timedelta(hours=2))
+        totals = summary['totals']
+        self.assertEqual((totals['claims'], totals['resolutions'], totals['closures']), (1, 1, 1))
+        self.assertEqual((totals['approvals'], totals['declines']), (1, 1))
+        self.assertEqual(totals['avg_claim_wait'], 300)
+        self.assertEqual(totals['avg_handle'], 900)
+        self.assertIn("Claims: 1 (avg wait 5m 0s)", format_stats(summary, {7: "Ada"}))
+        self.assertIn("• Ada: 1 claimed, 2 done, avg handle 15m 0s", format_stats(summary, {7: "Ada"}))
+
+    @override_settings(ADMIN_IDS=[ADMIN_ID])
+    def test_stats_command_is_admin_only(self):
+        bot = make_bot()
+        bot.process_new_messages([make_message("/stats 30", ADMIN_ID), make_message("/stats", 1234)])
+        self.assertIn("last 30 days", bot.send_message.call_args.args[1])
+        self.assertIn("admins only", bot.reply_to.call_args.args[1])
+
+    def test_transitions_update_metrics_and_rebuild_agrees(self):
+        customer = Customer.objects.create(telegram_id=7101)
+        agent = Agent.objects.create(telegram_id=7102)
+        ticket, _ = get_or_create_active_ticket(customer)
+        views.claim_ticket(ticket.id, agent.telegram_id)
+        views.close_ticket(ticket.id, agent.telegram_id, "done")
+        before = list(AgentDailyStats.objects.values('agent_id', 'claims', 'closures', 'handle_count'))
+        self.assertEqual(before, [{'agent_id': agent.id, 'claims': 1, 'closures': 1, 'handle_count': 1}])
+        self.assertEqual(metrics.rebuild(), 3)
+        self.assertEqual(list(AgentDailyStats.objects.values('agent_id', 'claims', 'closures', 'handle_count')), before)
+        self.assertEqual(TicketMetrics.objects.get(ticket_id=ticket.id).claims, 1)
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=7201)
+        self.agent = Agent.objects.create(telegram_id=7202)
+        self.ticket = Ticket.objects.create(customer=self.customer)
+        CustomerMessage.objects.create(customer=self.customer, ticket=self.ticket, message_text="My refund never arrived")
+        CustomerMessage.objects.create(customer=self.customer, ticket=self.ticket, message_text="Refund refund please")
+        AgentMessage.objects.create(
+            agent=self.agent, customer=self.customer, ticket=self.ticket, message_text="The refund was sent today",
+        )
+
+    def test_ranked_paginated_results_from_both_sides(self):
+        hits, has_more = search.search_messages("refund", per_page=2)
+        self.assertTrue(has_more)
+        self.assertEqual(hits[0].snippet, "«Refund» «refund» please")
+        page, has_more = search.search_messages("refund", page=2, per_page=2)
+        self.assertFalse(has_more)
+        self.assertEqual([(hit.source, hit.ticket_id) for hit in page], [('agent', self.ticket.id)])
+        self.assertEqual(search.search_messages("arri*")[0][0].customer_id, self.customer.id)
+
+    def test_index_follows_updates_deletes_and_archiving(self):
+        message = CustomerMessage.objects.get(message_text__startswith="My refund")
+        CustomerMessage.objects.filter(pk=message.pk).update(message_text="parcel lost")
+        self.assertEqual(len(search.search_messages("refund")[0]), 2)
+        CustomerMessage.objects.filter(pk=message.pk).delete()
+        self.assertEqual(search.search_messages("parcel")[0], [])
+        Ticket.objects.filter(pk=self.ticket.pk).update(
+            is_resolved=True, is_resolved_approved=True, is_closed=True, is_closed_approved=True,
+            closed_at=timezone.now() - timedelta(days=100),
+        )
+        archive.archive_messages(90)
+        sources = sorted(hit.source for hit in search.search_messages("refund")[0])
+        self.assertEqual(sources, ['agent_archive', 'customer_archive'])
+
+    def test_user_input_is_never_parsed_as_query_syntax(self):
+        self.assertEqual(search.search_messages('refund OR "x AND (')[0], [])
+        self.assertEqual(search.match_expression('a"b NEAR'), '"a""b" "NEAR"')
+
+    def test_search_command_pages_with_buttons(self):
+        bot = make_bot()
+        with override_settings(SEARCH_PAGE_SIZE=2):
+            bot.process_new_messages([make_message("/search refund", self.agent.telegram_id)])
+            self.assertIn("Results 1–2", bot.send_message.call_args.args[1])
+            first_next = bot.send_message.call_args.kwargs['reply_markup'].keyboard[0][0].callback_data
+            bot.process_new_messages([make_message("/search arrived", self.agent.telegram_id)])
+            # Paging the older results message still pages its own query
+            bot.process_new_callback_query([make_callback(first_next, self.agent.telegram_id)])
+        self.assertIn("Results 3–3 for \"refund\"", bot.edit_message_text.call_args.args[0])
+        bot.process_new_callback_query([make_callback("searchpage_999_2", self.agent.telegram_id)])
+        self.assertIn("expired", bot.answer_callback_query.call_args.args[1])
+        bot.process_new_messages([make_message("/search refund", 7299)])
+        self.assertIn("agents only", bot.reply_to.call_args.args[1])
+
+    def test_admin_search_uses_the_index(self):
+        model_admin = admin.site._registry[CustomerMessage]
+        queryset, _ = model_admin.get_search_results(None, CustomerMessage.objects.all(), "arrived")
+        self.assertEqual([m.message_text for m in queryset], ["My refund never arrived"])
+
+
+class ExportTranscriptsTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(telegram_id=7301)
+        self.agent = Agent.objects.create(telegram_id=7302)
+        start = timezone.now() - timedelta(hours=1)
+        self.tickets = []
+        for t in range(3):
+            ticket = Ticket.objects.create(customer=Customer.objects.create(telegram_id=7310 + t), agent=self.agent)
+            for i in range(3):
+                for model, extra in ((CustomerMessage, {}), (AgentMessage, {'agent': self.agent})):
+                    message = model.objects.create(
+                        customer=ticket.customer, ticket=ticket, message_text=f"{model.__name__} {i}", **extra,
+                    )
+                    minutes = i * 2 + (model is AgentMessage)
+                    model.objects.filter(pk=message.pk).update(sent_at=start + timedelta(minutes=minutes))
+            self.tickets.append(ticket)
+        Ticket.objects.filter(pk=self.tickets[0].pk).update(
+            is_resolved=True, is_resolved_approved=True, is_closed=True, is_closed_approved=True,
+            closed_at=timezone.now() - timedelta(days=100),
+        )
+        archive.archive_messages(90)  # the first ticket is read from the archive tables
+        self.empty = Ticket.objects.create(customer=self.customer)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def read_csv(self, path):
+        with open(path, newline='', encoding='utf-8') as f:
+            return list(csv.reader(f))[1:]
+
+    def test_messages_are_merged_per_ticket_in_time_order(self):
+        path = os.path.join(self.dir, 'out.csv')
+        call_command('export_transcripts', path, stdout=io.StringIO())
+        rows = self.read_csv(path)
+        self.assertEqual(len(rows), 18)
+        self.assertEqual([int(row[0]) for row in rows[::6]], [t.id for t in self.tickets])
+        self.assertEqual(
+            [row[7] for row in rows[:6]],
+            ["CustomerMessage 0", "AgentMessage 0", "CustomerMessage 1", "AgentMessage 1",
+             "CustomerMessage 2", "AgentMessage 2"],
+        )
+        call_command('export_transcripts', self.dir, format='text', stdout=io.StringIO())
+        with open(os.path.join(self.dir, f"ticket_{self.empty.id}.txt"), encoding='utf-8') as f:
+            self.assertIn("open", f.read())
+
+    def test_filters(self):
+        path = os.path.join(self.dir, 'out.jsonl')
+        call_command('export_transcripts', path, format='jsonl', customer=[7311], stdout=io.StringIO())
+        with open(path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual({r['ticket_id'] for r in records}, {self.tickets[1].id})
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        call_command('export_transcripts', path, '--format', 'jsonl', '--since', tomorrow, stdout=io.StringIO())
+        self.assertEqual(os.path.getsize(path), 0)
+
+    @override_settings(ADMIN_IDS=[ADMIN_ID])
+    def test_agent_filter_includes_finished_tickets(self):
+        other = Agent.objects.create(telegram_id=7303)
+        ticket = Ticket.objects.create(customer=Customer.objects.create(telegram_id=7320))
+        self.assertEqual(views.claim_ticket(ticket.id, other.telegram_id)['status'], "success")
+        AgentMessage.objects.create(agent=other, customer=ticket.customer, ticket=ticket, message_text="on it")
+        views.resolve_ticket(ticket.id, other.telegram_id, "done")
+        self.assertEqual(views.approve_ticket_resolution(ticket.id, ADMIN_ID)['status'], "success")
+        self.assertFalse(Ticket.objects.filter(agent=other).exists())
+
+        path = os.path.join(self.dir, 'out.jsonl')
+        out = io.StringIO()
+        call_command('export_transcripts', path, format='jsonl', agent=[other.telegram_id], stdout=out)
+        self.assertIn("Exported 1 tickets", out.getvalue())
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual({json.loads(line)['message_text'] for line in f}, {"on it"})
+        call_command('export_transcripts', path, format='jsonl', agent=[self.agent.telegram_id], stdout=out)
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual({json.loads(line)['ticket_id'] for line in f}, {t.id for t in self.tickets})
+
+    def test_interrupted_export_resumes_from_checkpoint(self):
+        full, partial = os.path.join(self.dir, 'full.csv'), os.path.join(self.dir, 'partial.csv')
+        checkpoint = os.path.join(self.dir, 'export.json')
+        export.export_transcripts(Ticket.objects.all(), 'csv', full)
+
+        def interrupt(state):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            export.export_transcripts(
+                Ticket.objects.all(), 'csv', partial, checkpoint=checkpoint, checkpoint_every=2, progress=interrupt,
+            )
+        with open(partial, 'a', encoding='utf-8') as f:
+            f.write("half a row")  # written after the checkpoint, must not survive the resume
+        state = export.export_transcripts(Ticket.objects.all(), 'csv', partial, checkpoint=checkpoint)
+        self.assertTrue(state['done'])
+        self.assertEqual((state['tickets'], state['messages']), (4, 18))
+        with open(full, encoding='utf-8') as a, open(partial, encoding='utf-8') as b:
+            self.assertEqual(a.read(), b.read())
+
+
+class InstrumentationTests(TestCase):
+    @override_settings(QUERY_BUDGET_DEFAULT=3, N_PLUS_ONE_THRESHOLD=5)
+    def test_repeated_query_shapes_are_reported_with_handler_name(self):
+        customers = [Customer.objects.create(telegram_id=i) for i in range(6)]
+
+        def handle_loop(_message):
+            for customer in customers:
+                Customer.objects.get(pk=customer.pk)
+
+        with self.assertLogs('bot.instrumentation', 'WARNING') as logs:
+            instrument(handle_loop)(None)
+        output = "\n".join(logs.output)
+        self.assertIn("Handler handle_loop ran 6 queries (budget 3)", output)
+        self.assertIn("Possible N+1 in handle_loop: 6 x", output)
+
+    def test_assert_max_queries_fails_over_budget(self):
+        with self.assertRaises(AssertionError):
+            with assert_max_queries(1):
+                Customer.objects.count()
+                Customer.objects.count()
+
+
+class TransitionBenchmarkTests(TestCase):
+    def test_every_transition_runs_cleanly(self):
+        slots = benchmarks.seed(slots=5, history_customers=5, history_tickets=1, history_messages=2)
+        results = benchmarks.run(slots)
+        self.assertEqual(set(results), set(benchmarks.TRANSITIONS))
+        for name, by_threads in results.items():
+            self.assertEqual(by_threads['1']['calls'], 5, name)
+            self.assertEqual(by_threads['1']['errors'], 0, name)
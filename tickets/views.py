@@ -1,26 +1,52 @@
 
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 from tickets.models import Ticket
-from agents.models import Agent
+from agents.models import Agent, AgentMessage
 from customers.models import Customer, CustomerMessage
 from admin_app.models import AdminDecision
+from tickets import events
+from tickets.events import record_event
 import logging
 
 logger = logging.getLogger(__name__)
 
-def claim_ticket(ticket_id: int, telegram_id: int):
+APPROVED = Q(is_closed_approved=True) | Q(is_resolved_approved=True)
+FINALIZED = Q(is_closed=True, is_closed_approved=True, is_resolved=True, is_resolved_approved=True)
+
+def _lock_ticket(ticket, *conditions, **expected):
+    """
+    Call inside transaction.atomic(): lock the ticket row and confirm it still
+    matches the state checked before the transaction. With skip_locked, a ticket
+    another worker is transitioning right now is reported as a conflict instead
+    of queueing behind its lock. (SQLite has no row locks; BEGIN IMMEDIATE
+    serialises the writers there and the state re-check still applies.)
+    """
+    return Ticket.objects.select_for_update(skip_locked=True).filter(
+        *conditions, pk=ticket.pk, **expected
+    ).values_list('pk', flat=True).first() is not None
+
+def _already_open(ticket):
+    logger.warning("Customer %s already has an active ticket, ticket %s not reopened", ticket.customer.telegram_id, ticket.id)
+    return {"status": "error", "message": "This customer already has another open ticket."}
+
+def _conflict(ticket_id):
+    logger.warning("Ticket %s changed concurrently, transition skipped", ticket_id)
+    return {"status": "error", "message": "This ticket was just updated by someone else. Please try again."}
+
+def claim_ticket(ticket_id: int, telegram_id: int, **data):
     try:
         agent = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.error(f"Agent not found for telegram_id {telegram_id}")
+        logger.error("Agent not found for telegram_id %s", telegram_id)
         return {"status": "error", "message": "Only registered agents can claim tickets."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found")
+        logger.error("Ticket %s not found", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     has_active = Ticket.objects.filter(
         agent=agent,
@@ -29,25 +55,33 @@ def claim_ticket(ticket_id: int, telegram_id: int):
         is_closed=False
     ).exists()
     if has_active:
-        logger.warning(f"Agent {telegram_id} attempted to claim ticket {ticket_id} with active ticket")
+        logger.warning("Agent %s attempted to claim ticket %s with active ticket", telegram_id, ticket_id)
         return {"status": "error", "message": "You already have an active ticket. Please resolve or close it before claiming another."}
     if ticket.is_claimed:
-        logger.warning(f"Ticket {ticket_id} already claimed")
+        logger.warning("Ticket %s already claimed", ticket_id)
         return {"status": "error", "message": "Ticket already claimed."}
-    with transaction.atomic():
-        ticket.agent = agent
-        ticket.is_claimed = True
-        ticket.is_resolved = False
-        ticket.is_closed = False
-        ticket.is_resolved_approved = False
-        ticket.is_closed_approved = False
-        ticket.customer.open_ticket = True
-        ticket.customer.open_ticket_spam = 0
-        ticket.customer.save()
-        ticket.save()
-        # Mark all unforwarded messages for this ticket as forwarded
-        CustomerMessage.objects.filter(ticket=ticket, is_forwarded=False).update(is_forwarded=True)
-    logger.info(f"Ticket {ticket_id} claimed by agent {telegram_id}")
+    try:
+        with transaction.atomic():
+            if not _lock_ticket(ticket, is_claimed=False):
+                logger.warning("Ticket %s claimed concurrently", ticket_id)
+                return {"status": "error", "message": "Ticket already claimed."}
+            record_event(ticket, events.CLAIMED, actor=telegram_id, agent_id=agent.id, **data)
+            ticket.agent = agent
+            ticket.is_claimed = True
+            ticket.is_resolved = False
+            ticket.is_closed = False
+            ticket.is_resolved_approved = False
+            ticket.is_closed_approved = False
+            ticket.customer.open_ticket = True
+            ticket.customer.open_ticket_spam = 0
+            ticket.customer.save()
+            ticket.save()
+            # Mark all unforwarded messages for this ticket as forwarded
+            CustomerMessage.objects.filter(ticket=ticket, is_forwarded=False).update(is_forwarded=True)
+    except IntegrityError:
+        # Reopening would give the customer a second active ticket
+        return _already_open(ticket)
+    logger.info("Ticket %s claimed by agent %s", ticket_id, telegram_id)
     return {
         "status": "success",
         "ticket": ticket,
@@ -58,76 +92,85 @@ def resolve_ticket(ticket_id: int, telegram_id: int, summary: str):
     try:
         agent = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.error(f"Agent not found for telegram_id {telegram_id}")
+        logger.error("Agent not found for telegram_id %s", telegram_id)
         return {"status": "error", "message": "Only registered agents can resolve tickets."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found")
+        logger.error("Ticket %s not found", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     if ticket.is_resolved:
-        logger.warning(f"Ticket {ticket_id} already resolved")
+        logger.warning("Ticket %s already resolved", ticket_id)
         return {"status": "error", "message": "This ticket is already resolved."}
     if ticket.is_closed:
-        logger.warning(f"Ticket {ticket_id} is closed, cannot resolve")
+        logger.warning("Ticket %s is closed, cannot resolve", ticket_id)
         return {"status": "error", "message": "This ticket is closed and cannot be resolved."}
     with transaction.atomic():
+        if not _lock_ticket(ticket, is_resolved=False, is_closed=False):
+            return _conflict(ticket_id)
+        record_event(ticket, events.RESOLVED, actor=telegram_id)
         ticket.is_resolved = True
         ticket.resolution_summary = summary
         ticket.resolved_at = timezone.now()
         ticket.is_resolved_approved = False
         ticket.save()
-    logger.info(f"Ticket {ticket_id} marked as resolved by agent {telegram_id}")
-    return {"status": "success", "message": "Ticket has been marked as resolved. Waiting for admin approval."}
+    logger.info("Ticket %s marked as resolved by agent %s", ticket_id, telegram_id)
+    return {"status": "success", "message": "Ticket has been marked as resolved. Waiting for admin approval.", "ticket": ticket}
 
 def close_ticket(ticket_id: int, telegram_id: int, summary: str):
     try:
         agent = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.error(f"Agent not found for telegram_id {telegram_id}")
+        logger.error("Agent not found for telegram_id %s", telegram_id)
         return {"status": "error", "message": "Only registered agents can close tickets."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found")
+        logger.error("Ticket %s not found", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     if ticket.is_closed:
-        logger.warning(f"Ticket {ticket_id} already closed")
+        logger.warning("Ticket %s already closed", ticket_id)
         return {"status": "error", "message": "This ticket is already closed."}
     if ticket.is_resolved:
-        logger.warning(f"Ticket {ticket_id} is resolved, cannot close")
+        logger.warning("Ticket %s is resolved, cannot close", ticket_id)
         return {"status": "error", "message": "This ticket is resolved and cannot be closed."}
     with transaction.atomic():
+        if not _lock_ticket(ticket, is_resolved=False, is_closed=False):
+            return _conflict(ticket_id)
+        record_event(ticket, events.CLOSED, actor=telegram_id)
         ticket.is_closed = True
         ticket.closure_summary = summary
         ticket.closed_at = timezone.now()
         ticket.is_closed_approved = False
         ticket.save()
-    logger.info(f"Ticket {ticket_id} marked as closed by agent {telegram_id}")
-    return {"status": "success", "message": "Ticket has been marked as closed. Waiting for admin approval."}
+    logger.info("Ticket %s marked as closed by agent %s", ticket_id, telegram_id)
+    return {"status": "success", "message": "Ticket has been marked as closed. Waiting for admin approval.", "ticket": ticket}
 
 def approve_ticket_resolution(ticket_id: int, telegram_id: int):
     # Check if the user is an admin
     if telegram_id not in settings.ADMIN_IDS:
-        logger.error(f"Unauthorized resolution approval attempt by telegram_id {telegram_id} for ticket {ticket_id}")
+        logger.error("Unauthorized resolution approval attempt by telegram_id %s for ticket %s", telegram_id, ticket_id)
         return {"status": "error", "message": "Only admins can approve this action."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found for resolution approval")
+        logger.error("Ticket %s not found for resolution approval", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     if not ticket.is_resolved:
-        logger.warning(f"Ticket {ticket_id} not resolved, cannot approve")
+        logger.warning("Ticket %s not resolved, cannot approve", ticket_id)
         return {"status": "error", "message": "This ticket has not been resolved."}
     # Try to get admin as Agent, but allow None
     admin = None
     try:
         admin = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.warning(f"Admin with telegram_id {telegram_id} is not an Agent, proceeding with null admin")
+        logger.warning("Admin with telegram_id %s is not an Agent, proceeding with null admin", telegram_id)
     # Store agent Telegram ID before unlinking
     agent_telegram_id = ticket.agent.telegram_id if ticket.agent else None
     with transaction.atomic():
+        if not _lock_ticket(ticket, is_resolved=True):
+            return _conflict(ticket_id)
+        record_event(ticket, events.RESOLUTION_APPROVED, actor=telegram_id)
         ticket.is_resolved_approved = True
         ticket.is_closed = False
         ticket.is_claimed = False
@@ -144,32 +187,36 @@ def approve_ticket_resolution(ticket_id: int, telegram_id: int):
         )
         # Mark all messages for this ticket as forwarded to reset message count
         CustomerMessage.objects.filter(ticket=ticket).update(is_forwarded=True)
-    logger.info(f"Resolution approved for ticket {ticket_id} by admin {telegram_id}, agent unlinked")
+    logger.info("Resolution approved for ticket %s by admin %s, agent unlinked", ticket_id, telegram_id)
     return {
         "status": "success",
         "message": "Ticket resolution has been approved and agent unlinked.",
-        "agent_telegram_id": agent_telegram_id
+        "agent_telegram_id": agent_telegram_id,
+        "ticket": ticket,
     }
 
 def decline_ticket_resolution(ticket_id: int, telegram_id: int):
     # Check if the user is an admin
     if telegram_id not in settings.ADMIN_IDS:
-        logger.error(f"Unauthorized resolution decline attempt by telegram_id {telegram_id} for ticket {ticket_id}")
+        logger.error("Unauthorized resolution decline attempt by telegram_id %s for ticket %s", telegram_id, ticket_id)
         return {"status": "error", "message": "Only admins can approve this action."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found for resolution decline")
+        logger.error("Ticket %s not found for resolution decline", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     # Try to get admin as Agent, but allow None
     admin = None
     try:
         admin = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.warning(f"Admin with telegram_id {telegram_id} is not an Agent, proceeding with null admin")
+        logger.warning("Admin with telegram_id %s is not an Agent, proceeding with null admin", telegram_id)
     # Store agent Telegram ID for notifications
     agent_telegram_id = ticket.agent.telegram_id if ticket.agent else None
     with transaction.atomic():
+        if not _lock_ticket(ticket):
+            return _conflict(ticket_id)
+        record_event(ticket, events.RESOLUTION_DECLINED, actor=telegram_id)
         ticket.is_resolved = False
         ticket.is_resolved_approved = False
         ticket.resolution_summary = None
@@ -181,35 +228,39 @@ def decline_ticket_resolution(ticket_id: int, telegram_id: int):
             decision_type='resolve',
             decision='declined'
         )
-    logger.info(f"Resolution declined for ticket {ticket_id} by admin {telegram_id}")
+    logger.info("Resolution declined for ticket %s by admin %s", ticket_id, telegram_id)
     return {
         "status": "success",
         "message": "Ticket resolution has been declined.",
-        "agent_telegram_id": agent_telegram_id
+        "agent_telegram_id": agent_telegram_id,
+        "ticket": ticket,
     }
 
 def approve_ticket_closure(ticket_id: int, telegram_id: int):
     # Check if the user is an admin
     if telegram_id not in settings.ADMIN_IDS:
-        logger.error(f"Unauthorized closure approval attempt by telegram_id {telegram_id} for ticket {ticket_id}")
+        logger.error("Unauthorized closure approval attempt by telegram_id %s for ticket %s", telegram_id, ticket_id)
         return {"status": "error", "message": "Only admins can approve this action."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found for closure approval")
+        logger.error("Ticket %s not found for closure approval", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     if not ticket.is_closed:
-        logger.warning(f"Ticket {ticket_id} not closed, cannot approve")
+        logger.warning("Ticket %s not closed, cannot approve", ticket_id)
         return {"status": "error", "message": "This ticket has not been closed."}
     # Try to get admin as Agent, but allow None
     admin = None
     try:
         admin = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.warning(f"Admin with telegram_id {telegram_id} is not an Agent, proceeding with null admin")
+        logger.warning("Admin with telegram_id %s is not an Agent, proceeding with null admin", telegram_id)
     # Store agent Telegram ID before unlinking
     agent_telegram_id = ticket.agent.telegram_id if ticket.agent else None
     with transaction.atomic():
+        if not _lock_ticket(ticket, is_closed=True):
+            return _conflict(ticket_id)
+        record_event(ticket, events.CLOSURE_APPROVED, actor=telegram_id)
         ticket.is_closed_approved = True
         ticket.is_closed = False
         ticket.is_claimed = False
@@ -226,32 +277,36 @@ def approve_ticket_closure(ticket_id: int, telegram_id: int):
         )
         # Mark all messages for this ticket as forwarded to reset message count
         CustomerMessage.objects.filter(ticket=ticket).update(is_forwarded=True)
-    logger.info(f"Closure approved for ticket {ticket_id} by admin {telegram_id}, agent unlinked")
+    logger.info("Closure approved for ticket %s by admin %s, agent unlinked", ticket_id, telegram_id)
     return {
         "status": "success",
         "message": "Ticket closure has been approved and agent unlinked.",
-        "agent_telegram_id": agent_telegram_id
+        "agent_telegram_id": agent_telegram_id,
+        "ticket": ticket,
     }
 
 def decline_ticket_closure(ticket_id: int, telegram_id: int):
     # Check if the user is an admin
     if telegram_id not in settings.ADMIN_IDS:
-        logger.error(f"Unauthorized closure decline attempt by telegram_id {telegram_id} for ticket {ticket_id}")
+        logger.error("Unauthorized closure decline attempt by telegram_id %s for ticket %s", telegram_id, ticket_id)
         return {"status": "error", "message": "Only admins can approve this action."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found for closure decline")
+        logger.error("Ticket %s not found for closure decline", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     # Try to get admin as Agent, but allow None
     admin = None
     try:
         admin = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.warning(f"Admin with telegram_id {telegram_id} is not an Agent, proceeding with null admin")
+        logger.warning("Admin with telegram_id %s is not an Agent, proceeding with null admin", telegram_id)
     # Store agent Telegram ID for notifications
     agent_telegram_id = ticket.agent.telegram_id if ticket.agent else None
     with transaction.atomic():
+        if not _lock_ticket(ticket):
+            return _conflict(ticket_id)
+        record_event(ticket, events.CLOSURE_DECLINED, actor=telegram_id)
         ticket.is_closed = False
         ticket.is_closed_approved = False
         ticket.closure_summary = None
@@ -263,95 +318,113 @@ def decline_ticket_closure(ticket_id: int, telegram_id: int):
             decision_type='close',
             decision='declined'
         )
-    logger.info(f"Closure declined for ticket {ticket_id} by admin {telegram_id}")
+    logger.info("Closure declined for ticket %s by admin %s", ticket_id, telegram_id)
     return {
         "status": "success",
         "message": "Ticket closure has been declined.",
-        "agent_telegram_id": agent_telegram_id
+        "agent_telegram_id": agent_telegram_id,
+        "ticket": ticket,
     }
 
 def raise_ticket(ticket_id: int):
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found for raising")
+        logger.error("Ticket %s not found for raising", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     if not (ticket.is_closed_approved or ticket.is_resolved_approved):
-        logger.warning(f"Ticket {ticket_id} neither closed nor resolved approved, cannot raise")
+        logger.warning("Ticket %s neither closed nor resolved approved, cannot raise", ticket_id)
         return {"status": "error", "message": "This ticket's closure or resolution has not been approved."}
-    with transaction.atomic():
-        ticket.is_closed = False
-        ticket.is_closed_approved = False
-        ticket.is_resolved = False
-        ticket.is_resolved_approved = False
-        ticket.is_claimed = False
-        ticket.agent = None
-        ticket.customer.open_ticket = True
-        ticket.customer.open_ticket_spam = 0
-        ticket.customer.save()
-        ticket.save()
-        # Mark all messages for this ticket as forwarded to reset message count
-        CustomerMessage.objects.filter(ticket=ticket).update(is_forwarded=True)
-    logger.info(f"Ticket {ticket_id} raised back to support group, reset open_ticket_spam for customer {ticket.customer.telegram_id}")
-    return {"status": "success", "message": "Ticket raised back to support group."}
+    try:
+        with transaction.atomic():
+            if not _lock_ticket(ticket, APPROVED):
+                return _conflict(ticket_id)
+            record_event(ticket, events.RAISED)
+            ticket.is_closed = False
+            ticket.is_closed_approved = False
+            ticket.is_resolved = False
+            ticket.is_resolved_approved = False
+            ticket.is_claimed = False
+            ticket.agent = None
+            ticket.customer.open_ticket = True
+            ticket.customer.open_ticket_spam = 0
+            ticket.customer.save()
+            ticket.save()
+            # Mark all messages for this ticket as forwarded to reset message count
+            CustomerMessage.objects.filter(ticket=ticket).update(is_forwarded=True)
+    except IntegrityError:
+        # Reopening would give the customer a second active ticket
+        return _already_open(ticket)
+    logger.info("Ticket %s raised back to support group, reset open_ticket_spam for customer %s", ticket_id, ticket.customer.telegram_id)
+    return {"status": "success", "message": "Ticket raised back to support group.", "ticket": ticket}
 
 def handle_ticket(ticket_id: int, telegram_id: int):
     # Check if the user is an admin
     if telegram_id not in settings.ADMIN_IDS:
-        logger.error(f"Unauthorized handle attempt by telegram_id {telegram_id} for ticket {ticket_id}")
+        logger.error("Unauthorized handle attempt by telegram_id %s for ticket %s", telegram_id, ticket_id)
         return {"status": "error", "message": "Only admins can handle this action."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found for handling")
+        logger.error("Ticket %s not found for handling", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     if not (ticket.is_closed_approved or ticket.is_resolved_approved):
-        logger.warning(f"Ticket {ticket_id} neither closed nor resolved approved, cannot handle")
+        logger.warning("Ticket %s neither closed nor resolved approved, cannot handle", ticket_id)
         return {"status": "error", "message": "This ticket's closure or resolution has not been approved."}
     # Try to get admin as Agent, but allow None for assignment
     admin = None
     try:
         admin = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.warning(f"Admin with telegram_id {telegram_id} is not an Agent, assigning ticket with null agent")
-    with transaction.atomic():
-        ticket.agent = admin  # Can be None
-        ticket.is_claimed = True
-        ticket.is_closed = False
-        ticket.is_closed_approved = False
-        ticket.is_resolved = False
-        ticket.is_resolved_approved = False
-        ticket.customer.open_ticket = True
-        ticket.customer.open_ticket_spam = 0
-        ticket.customer.save()
-        ticket.save()
-        # Mark all messages for this ticket as forwarded to reset message count
-        CustomerMessage.objects.filter(ticket=ticket).update(is_forwarded=True)
-    logger.info(f"Ticket {ticket_id} assigned to admin {telegram_id} for handling")
-    return {"status": "success", "message": "Ticket assigned to admin for handling."}
+        logger.warning("Admin with telegram_id %s is not an Agent, assigning ticket with null agent", telegram_id)
+    try:
+        with transaction.atomic():
+            if not _lock_ticket(ticket, APPROVED):
+                return _conflict(ticket_id)
+            record_event(ticket, events.HANDLED, actor=telegram_id, agent_id=admin.id if admin else None)
+            ticket.agent = admin  # Can be None
+            ticket.is_claimed = True
+            ticket.is_closed = False
+            ticket.is_closed_approved = False
+            ticket.is_resolved = False
+            ticket.is_resolved_approved = False
+            ticket.customer.open_ticket = True
+            ticket.customer.open_ticket_spam = 0
+            ticket.customer.save()
+            ticket.save()
+            # Mark all messages for this ticket as forwarded to reset message count
+            CustomerMessage.objects.filter(ticket=ticket).update(is_forwarded=True)
+    except IntegrityError:
+        # Reopening would give the customer a second active ticket
+        return _already_open(ticket)
+    logger.info("Ticket %s assigned to admin %s for handling", ticket_id, telegram_id)
+    return {"status": "success", "message": "Ticket assigned to admin for handling.", "ticket": ticket}
 
 def close_ticket_finally(ticket_id: int, telegram_id: int):
     # Check if the user is an admin
     if telegram_id not in settings.ADMIN_IDS:
-        logger.error(f"Unauthorized final closure attempt by telegram_id {telegram_id} for ticket {ticket_id}")
+        logger.error("Unauthorized final closure attempt by telegram_id %s for ticket %s", telegram_id, ticket_id)
         return {"status": "error", "message": "Only admins can approve this action."}
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_related('customer', 'agent').get(id=ticket_id)
     except Ticket.DoesNotExist:
-        logger.error(f"Ticket {ticket_id} not found for final closure")
+        logger.error("Ticket %s not found for final closure", ticket_id)
         return {"status": "error", "message": "Ticket not found."}
     if not (ticket.is_closed_approved or ticket.is_resolved_approved):
-        logger.warning(f"Ticket {ticket_id} neither closed nor resolved approved, cannot close finally")
+        logger.warning("Ticket %s neither closed nor resolved approved, cannot close finally", ticket_id)
         return {"status": "error", "message": "This ticket's closure or resolution has not been approved."}
     # Try to get admin as Agent, but allow None
     admin = None
     try:
         admin = Agent.objects.get(telegram_id=telegram_id)
     except Agent.DoesNotExist:
-        logger.warning(f"Admin with telegram_id {telegram_id} is not an Agent, proceeding with null admin")
+        logger.warning("Admin with telegram_id %s is not an Agent, proceeding with null admin", telegram_id)
     # Store agent Telegram ID for notifications
     agent_telegram_id = ticket.agent.telegram_id if ticket.agent else None
     with transaction.atomic():
+        if not _lock_ticket(ticket, APPROVED):
+            return _conflict(ticket_id)
+        record_event(ticket, events.CLOSED_FINALLY, actor=telegram_id)
         ticket.is_closed = True
         ticket.is_closed_approved = True
         ticket.is_resolved = True
@@ -370,9 +443,104 @@ def close_ticket_finally(ticket_id: int, telegram_id: int):
         )
         # Mark all messages for this ticket as forwarded to reset message count
         CustomerMessage.objects.filter(ticket=ticket).update(is_forwarded=True)
-    logger.info(f"Ticket {ticket_id} permanently closed by admin {telegram_id}")
+    logger.info("Ticket %s permanently closed by admin %s", ticket_id, telegram_id)
     return {
         "status": "success",
         "message": "Ticket has been permanently closed.",
-        "agent_telegram_id": agent_telegram_id
+        "agent_telegram_id": agent_telegram_id,
+        "ticket": ticket,
     }
+
+def bulk_raise_tickets(ticket_ids, **data):
+    """
+    raise_ticket() for many tickets at once (Django admin bulk action), as a
+    fixed number of set-based statements. Tickets whose customer already has an
+    active ticket are skipped, and of several selected tickets of one customer
+    only the newest is raised. No Telegram notifications are sent: the caller
+    announces the returned `ticket_ids` (sweeper.announce_raised).
+    """
+    with transaction.atomic():
+        locked = list(
+            Ticket.objects.select_for_update().filter(APPROVED, id__in=ticket_ids)
+            .order_by('id').values_list('id', 'customer_id', 'agent_id')
+        )
+        busy = set(Ticket.objects.filter(
+            customer_id__in={customer_id for _, customer_id, _ in locked},
+            is_resolved_approved=False,
+            is_closed_approved=False,
+        ).values_list('customer_id', flat=True))
+        newest = {row[1]: row for row in locked if row[1] not in busy}  # ascending ids: newest wins
+        rows = list(newest.values())
+        ids = [ticket_id for ticket_id, _, _ in rows]
+        Ticket.objects.filter(id__in=ids).update(
+            is_closed=False,
+            is_closed_approved=False,
+            is_resolved=False,
+            is_resolved_approved=False,
+            is_claimed=False,
+            agent=None,
+            last_updated=timezone.now(),
+        )
+        Customer.objects.filter(id__in=newest).update(open_ticket=True, open_ticket_spam=0)
+        CustomerMessage.objects.filter(ticket_id__in=ids).update(is_forwarded=True)
+        events.record_bulk(rows, events.RAISED, **data)
+    logger.info("Bulk raised %d of %d selected tickets", len(ids), len(ticket_ids))
+    return {"status": "success", "message": f"{len(ids)} ticket(s) raised.", "count": len(ids), "ticket_ids": ids}
+
+def bulk_close_tickets_finally(ticket_ids, admin=None, **data):
+    """
+    close_ticket_finally() for many approved tickets at once (Django admin bulk
+    action), as a fixed number of set-based statements. Tickets already closed
+    for good are skipped. No Telegram notifications are sent.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Ticket.objects.select_for_update().filter(APPROVED, id__in=ticket_ids).exclude(FINALIZED)
+            .values_list('id', 'customer_id', 'agent_id')
+        )
+        ids = [ticket_id for ticket_id, _, _ in rows]
+        Ticket.objects.filter(id__in=ids).update(
+            is_closed=True,
+            is_closed_approved=True,
+            is_resolved=True,
+            is_resolved_approved=True,
+            is_claimed=False,
+            agent=None,
+            closed_at=now,
+            last_updated=now,
+        )
+        Customer.objects.filter(id__in={customer_id for _, customer_id, _ in rows}).update(open_ticket=False)
+        AdminDecision.objects.bulk_create([
+            AdminDecision(ticket_id=ticket_id, admin=admin, decision_type='close', decision='final')
+            for ticket_id in ids
+        ])
+        CustomerMessage.objects.filter(ticket_id__in=ids).update(is_forwarded=True)
+        events.record_bulk(rows, events.CLOSED_FINALLY, **data)
+    logger.info("Bulk closed %d of %d selected tickets for good", len(ids), len(ticket_ids))
+    return {"status": "success", "message": f"{len(ids)} ticket(s) permanently closed.", "count": len(ids)}
+
+def bulk_release_tickets(ticket_ids, silent_since, **data):
+    """
+    Drop the claim on tickets whose agent has not replied since `silent_since`
+    (stale-ticket sweeper), as a fixed number of set-based statements: they
+    go back to the unclaimed queue. Tickets that were resolved, closed or
+    answered meanwhile are skipped. Returns the (ticket id, customer id,
+    agent id) rows released; no Telegram notifications are sent.
+    """
+    with transaction.atomic():
+        rows = list(
+            Ticket.objects.select_for_update(skip_locked=True)
+            .filter(
+                id__in=ticket_ids, is_claimed=True, is_resolved=False, is_closed=False,
+                agent__isnull=False, last_updated__lt=silent_since,
+            )
+            .exclude(Exists(AgentMessage.objects.filter(ticket=OuterRef('pk'), sent_at__gte=silent_since)))
+            .values_list('id', 'customer_id', 'agent_id')
+        )
+        ids = [ticket_id for ticket_id, _, _ in rows]
+        now = timezone.now()
+        Ticket.objects.filter(id__in=ids).update(is_claimed=False, agent=None, last_updated=now, swept_at=now)
+        events.record_bulk(rows, events.RELEASED, **data)
+    logger.info("Released %d of %d stale claims", len(ids), len(ticket_ids))
+    return rows
@@ -1,11 +1,22 @@
 # utils.py
+import heapq
+from operator import itemgetter
+
+from django.db import IntegrityError, transaction
+
+from agents.models import AgentMessage, ArchivedAgentMessage
+from customers.models import ArchivedCustomerMessage, CustomerMessage
+from tickets import events
+from tickets.events import record_event
 from tickets.models import Ticket
 
+HISTORY_CHUNK_SIZE = 500
+
 def sanitize_text(text):
     return text.encode('utf-8', errors='ignore').decode('utf-8') if text else ""
 
 def get_agent_active_ticket(telegram_id: int):
-    return Ticket.objects.filter(
+    return Ticket.objects.select_related("customer", "agent").filter(
         agent__telegram_id=telegram_id,
         is_claimed=True,
         is_resolved=False,
@@ -22,3 +33,55 @@ def get_active_ticket_for_customer(customer):
         is_resolved_approved=False,
         is_closed_approved=False,
     ).order_by("-created_at").first()
+
+def get_or_create_active_ticket(customer):
+    """
+    Return (ticket, created) for the customer's active ticket, creating it if
+    needed. The one_active_ticket_per_customer constraint makes concurrent
+    creators collide; the loser re-reads the winner's ticket.
+    """
+    ticket = get_active_ticket_for_customer(customer)
+    if ticket is not None:
+        return ticket, False
+    try:
+        with transaction.atomic():
+            ticket = Ticket.objects.create(customer=customer)
+            record_event(ticket, events.CREATED, actor=customer.telegram_id)
+            return ticket, True
+    except IntegrityError:
+        ticket = get_active_ticket_for_customer(customer)
+        if ticket is None:
+            raise
+        return ticket, False
+
+def iter_conversation_history(customer, chunk_size=HISTORY_CHUNK_SIZE):
+    """
+    Yield (sent_at, sender, text) for every message to or from `customer`,
+    oldest first, including messages moved to the archive tables. Each side is
+    one UNION ALL query over the live and archived table, streamed with
+    .iterator() (server-side cursors on PostgreSQL); the two streams are merged
+    by timestamp, so long histories are never loaded into memory at once.
+    """
+    customer_label = f"Customer {int(customer.pk):03d}"
+    customer_messages = CustomerMessage.objects.filter(customer=customer).values_list(
+        "sent_at", "id", "message_text"
+    ).union(
+        ArchivedCustomerMessage.objects.filter(customer=customer).values_list("sent_at", "id", "message_text"),
+        all=True,
+    ).order_by("sent_at", "id").iterator(chunk_size=chunk_size)
+    agent_messages = AgentMessage.objects.filter(ticket__customer=customer).values_list(
+        "sent_at", "id", "agent_id", "ticket_id", "message_text"
+    ).union(
+        ArchivedAgentMessage.objects.filter(customer=customer).values_list(
+            "sent_at", "id", "agent_id", "ticket_id", "message_text"
+        ),
+        all=True,
+    ).order_by("sent_at", "id").iterator(chunk_size=chunk_size)
+    return heapq.merge(
+        ((sent_at, customer_label, text) for sent_at, _, text in customer_messages),
+        (
+            (sent_at, f"Agent {int(agent_id):03d} (Ticket #{ticket_id})", text)
+            for sent_at, _, agent_id, ticket_id, text in agent_messages
+        ),
+        key=itemgetter(0),
+    )